@@ -0,0 +1,103 @@
+'''
+Times the collision broadphases from 10 to 10,000 boxes, against the
+original all-pairs loop over CollisionBox objects.
+
+The boxes are ball sized and spread through a hall that grows with their
+number, so the number of real collisions per box stays about the same.
+Each broadphase time includes a small move of every box, as in a game
+frame.
+
+Run from the repository root: python -m benchmarks.bench_broadphase
+'''
+import timeit
+import glm
+import numpy as np
+from engine.gl.broadphase import AllPairs, HashGrid, SweepAndPrune
+from engine.gl.collision import CollisionBox, box_box_collision
+
+COUNTS = (10, 100, 1000, 10000)
+LOOP_LIMIT = 1000  # the Python loop takes minutes beyond this
+ALL_PAIRS_LIMIT = 5000  # and the vectorized one runs out of memory
+
+
+def scene(count, seed=0):
+    rng = np.random.default_rng(seed)
+    width = .6 * count ** (1 / 3)
+    lower = rng.uniform(0, width, (count, 3))
+    return lower, lower + .1
+
+
+def loop_detect(boxes):
+    "The original CollisionSystem.detect loop."
+    collisions = []
+    areas = boxes.copy()
+    while len(areas):
+        a = areas.pop()
+        for b in areas:
+            if box_box_collision(a, b):
+                collisions.append((a, b))
+    return collisions
+
+
+def collision_boxes(lower, upper):
+    boxes = []
+    for near, far in zip(lower, upper):
+        box = CollisionBox(*(far - near))
+        box.base_offset = glm.vec3(*near)
+        box.attach_to_point(type('Point', (), {'vertex': glm.vec3()}))
+        boxes.append(box)
+    return boxes
+
+
+def best_of(func, repeat=3):
+    "Best wall time of func() in milliseconds."
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+
+def frame(broadphase, lower, upper, rng):
+    step = rng.normal(0, .002, lower.shape)
+    lower += step
+    upper += step
+    return broadphase.pairs(lower, upper)
+
+
+def main():
+    names = ['python loop', 'all pairs', 'sweep and prune', 'hash grid']
+    print(f"{'boxes':>7}" + ''.join(f"{name:>17}" for name in names) +
+          f"{'pairs':>8}")
+    times = {name: [] for name in names}
+    for count in COUNTS:
+        lower, upper = scene(count)
+        rng = np.random.default_rng(1)
+        row = {}
+        if count <= LOOP_LIMIT:
+            boxes = collision_boxes(lower, upper)
+            row['python loop'] = best_of(lambda: loop_detect(boxes), 1)
+        if count <= ALL_PAIRS_LIMIT:
+            row['all pairs'] = best_of(
+                lambda: frame(AllPairs(), lower, upper, rng))
+        sweep, grid = SweepAndPrune(), HashGrid()
+        row['sweep and prune'] = best_of(
+            lambda: frame(sweep, lower, upper, rng))
+        row['hash grid'] = best_of(lambda: frame(grid, lower, upper, rng))
+        pairs = len(grid.pairs(lower, upper))
+
+        cells = ''
+        for name in names:
+            if name in row:
+                times[name].append((count, row[name]))
+                cells += f"{row[name]:>15.2f}ms"
+            else:
+                cells += f"{'-':>17}"
+        print(f"{count:>7}{cells}{pairs:>8}")
+
+    # Growth from the last two sizes measured: 1 is linear, 2 quadratic.
+    print(f"{'growth':>7}", end='')
+    for name in names:
+        (n0, t0), (n1, t1) = times[name][-2:]
+        print(f"{np.log(t1 / t0) / np.log(n1 / n0):>16.2f} ", end='')
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+'''
+Compares Shape3D.compile_VBO against the original per-point compile path
+(Point3D.compile_VBO -> Shape2D.compile_VBO -> np.concatenate).
+
+Run from the repository root: python -m benchmarks.bench_compile_vbo
+'''
+import os
+import timeit
+import numpy as np
+from engine.gl.drawable import Point3D, Shape3D, sphere
+from engine.gl.obj_loader import OBJ_to_shape
+
+ASSETS = os.path.join(os.path.dirname(__file__), '..', 'assets',
+                      'pingponggame')
+
+
+def legacy_compile_VBO(shape):
+    "The original compile path, with every point recompiled."
+    for face in shape.shapes:
+        for point in face.points:
+            point._VBO_is_compiled = False
+    vbos = []
+    for face in shape.shapes:
+        face.compile_VBO(force=True)
+        vbos.append(face._VBO)
+    return np.concatenate(vbos)
+
+
+def best_of(func, repeat=5):
+    "Best wall time of func() in milliseconds."
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+
+def report(name, shape):
+    shape.compile_VBO()
+    expected = legacy_compile_VBO(shape)
+    assert np.array_equal(shape._VBO.data, expected)
+
+    legacy = best_of(lambda: legacy_compile_VBO(shape))
+    allocating = best_of(lambda: Shape3D(shape.shapes).compile_VBO())
+    in_place = best_of(lambda: shape.compile_VBO(force=True))
+    print(f"{name:<20}{len(expected):>9}{legacy:>10.1f}ms{allocating:>10.1f}ms"
+          f"{in_place:>10.1f}ms{legacy / in_place:>9.1f}x")
+
+
+def main():
+    print(f"{'model':<20}{'vertices':>9}{'legacy':>12}{'new':>12}"
+          f"{'in place':>12}{'speedup':>10}")
+    report('sphere(detail=5)', Shape3D(
+        sphere(1., Point3D(0, 0, 0), detail=5).shapes))
+    paddle = OBJ_to_shape(os.path.join(ASSETS, 'Paddle.obj'))
+    paddle.gen_normals()
+    report('Paddle.obj', paddle)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''
+Simulated seconds per wall clock second of a HeadlessLoop.
+
+Plays rallies of the game scene (game.drawables.rally: a GravityAnimator
+ball bouncing off the table, floor and wall) with random serves, one after
+another, then a PhysicsWorld with many balls stepped together, where every
+simulated second counts once per ball.
+
+Run from the repository root: python -m benchmarks.bench_headless
+'''
+import contextlib
+import io
+import time
+import numpy as np
+from engine.gameloop.HeadlessLoop import HeadlessLoop
+from engine.gl.animations import PhysicsWorld
+from game.drawables import rally
+
+SIM_RATE = 120
+RALLIES = 20
+RALLY_SECONDS = 10.
+BALL_COUNTS = (1, 100, 1000, 10000)
+WORLD_SECONDS = 10.
+
+
+def rallies(rng):
+    "Runs RALLIES rallies; returns (simulated, wall) seconds."
+    simulated = wall = 0.
+    for _ in range(RALLIES):
+        serve = rng.uniform((-.005, 0., -.03), (.005, .01, -.01))
+        with contextlib.redirect_stdout(io.StringIO()):  # box size prints
+            drawables, _, gravity, collision_system = rally(
+                ball_velocity=serve)
+        loop = HeadlessLoop([gravity], [collision_system], SIM_RATE)
+        loop.track('ball', drawables['ball'])
+        start = time.perf_counter()
+        loop.run(seconds=RALLY_SECONDS)
+        wall += time.perf_counter() - start
+        simulated += loop.sim_time
+    return simulated, wall
+
+
+def world(count, rng):
+    "Runs count balls in a PhysicsWorld; returns (simulated, wall) seconds."
+    balls = PhysicsWorld(drag=.1, magnus=.01, spin_decay=.01,
+                         capacity=count)
+    for _ in range(count):
+        balls.add(rng.uniform(-1, 1, 3), rng.normal(0, .02, 3),
+                  rng.normal(0, .1, 3))
+    loop = HeadlessLoop([balls], sim_rate=SIM_RATE)
+    loop.track('balls', probe=lambda: balls.position)
+    start = time.perf_counter()
+    loop.run(seconds=WORLD_SECONDS)
+    return loop.sim_time * count, time.perf_counter() - start
+
+
+def main():
+    rng = np.random.default_rng(0)
+    simulated, wall = rallies(rng)
+    print(f"{RALLIES} rallies of {RALLY_SECONDS:g}s at {SIM_RATE} Hz: "
+          f"{simulated / wall:,.0f} sim s / wall s")
+    print(f"{'balls':>7}{'sim s / wall s':>18}")
+    for count in BALL_COUNTS:
+        simulated, wall = world(count, rng)
+        print(f"{count:>7}{simulated / wall:>18,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+'''
+Compares memory use and build time of Shape3D (one Point3D object per
+vertex) against the array-backed Mesh.
+
+Run from the repository root: python -m benchmarks.bench_mesh_memory
+'''
+import os
+import time
+import tracemalloc
+from engine.gl.drawable import Mesh, Point3D, sphere
+from engine.gl.obj_loader import OBJ_to_mesh, OBJ_to_shape
+
+ASSETS = os.path.join(os.path.dirname(__file__), '..', 'assets',
+                      'pingponggame')
+
+
+def measure(build):
+    "Returns (bytes retained by the result, seconds) for build()."
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = build()  # alive until its memory is counted
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained, elapsed
+
+
+def report(name, shape_build, mesh_build):
+    shape_bytes, shape_time = measure(shape_build)
+    mesh_bytes, mesh_time = measure(mesh_build)
+    print(f"{name:<22}{shape_bytes / 2**20:>9.2f}MB{mesh_bytes / 2**20:>9.2f}MB"
+          f"{shape_bytes / mesh_bytes:>8.1f}x"
+          f"{shape_time * 1000:>9.1f}ms{mesh_time * 1000:>9.1f}ms")
+
+
+def main():
+    print(f"{'model':<22}{'Shape3D':>11}{'Mesh':>11}{'memory':>9}"
+          f"{'Shape3D':>11}{'Mesh':>11}")
+    for detail in (3, 5):
+        # The Mesh column times the conversion from the Shape3D.
+        shape = sphere(1., Point3D(0, 0, 0), detail=detail)
+        report(f'sphere(detail={detail})',
+               lambda: sphere(1., Point3D(0, 0, 0), detail=detail),
+               lambda: Mesh.from_shape(shape))
+    for name in ('Paddle.obj', 'PingPongPaddle.obj'):
+        path = os.path.join(ASSETS, name)
+        report(name, lambda: OBJ_to_shape(path), lambda: OBJ_to_mesh(path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+'''
+Compares the bulk NumPy .obj parser against the original line-by-line
+loader on the bundled paddle models.
+
+The headline is OBJ_to_mesh, the array-only path: it parses with
+OBJ_to_arrays and builds an indexed Mesh without a Python object per
+vertex. OBJ_to_shape still builds a Point3D and a Shape2D per record, so
+callers that only draw the model, like mesh_cache.build, use the arrays. Text parsing itself is bounded by np.fromstring, about half
+of OBJ_to_arrays, which keeps every path well short of 10x here.
+
+Run from the repository root: python -m benchmarks.bench_obj_loader
+'''
+import os
+import timeit
+from OpenGL.GL import GL_POLYGON
+from engine.gl.drawable import Point3D, Shape2D, Shape3D
+from engine.gl.obj_loader import OBJ_to_arrays, OBJ_to_mesh, OBJ_to_shape
+
+ASSETS = os.path.join(os.path.dirname(__file__), '..', 'assets',
+                      'pingponggame')
+MODELS = ('Paddle.obj', 'PingPongPaddle.obj')
+
+
+def legacy_OBJ_to_shape(filename):
+    "The original per-line loader, kept here as the baseline."
+    state = {'points': [], 'normals': [], 'texcoords': [], 'shapes': []}
+
+    def addPolygon(values):
+        pcoords = []
+        for v in values[1:]:
+            items = [int(i) for i in v.split('/')]
+            pcoords.append(state['points'][items[0] - 1])
+        state['shapes'].append(Shape2D(pcoords, mode=GL_POLYGON))
+
+    calls = {
+        'v': lambda values: state['points'].append(
+            Point3D(*map(float, values[1:4]))),
+        'vn': lambda values: state['normals'].append(
+            map(float, values[1:4])),
+        'vt': lambda values: state['texcoords'].append(
+            map(float, values[1:3])),
+        'f': addPolygon}
+
+    with open(filename, "r") as f:
+        for line in f:
+            if line.startswith('#'):
+                continue
+            values = line.split()
+            if values and values[0] in calls:
+                calls[values[0]](values)
+    return Shape3D(state['shapes'], color=(.5, .5, .5))
+
+
+def best_of(func, repeat=10):
+    "Best wall time of func() in milliseconds."
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+
+def main():
+    print(f"{'model':<20}{'legacy':>10}{'mesh':>10}{'arrays':>10}"
+          f"{'shape':>10}{'mesh x':>10}{'arrays x':>10}{'shape x':>10}")
+    for name in MODELS:
+        path = os.path.join(ASSETS, name)
+        legacy = best_of(lambda: legacy_OBJ_to_shape(path))
+        mesh = best_of(lambda: OBJ_to_mesh(path))
+        arrays = best_of(lambda: OBJ_to_arrays(path))
+        shape = best_of(lambda: OBJ_to_shape(path))
+        print(f"{name:<20}{legacy:>8.1f}ms{mesh:>8.1f}ms{arrays:>8.1f}ms"
+              f"{shape:>8.1f}ms{legacy / mesh:>9.1f}x"
+              f"{legacy / arrays:>9.1f}x{legacy / shape:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+'''
+Times one PhysicsWorld step against GravityAnimator moving the same
+number of models one at a time, and a step plus reading every model's
+matrix back with model_matrices, as the renderer does.
+
+Run from the repository root: python -m benchmarks.bench_physics_world
+'''
+import timeit
+import numpy as np
+from engine.gl.animations import GravityAnimator, PhysicsWorld, \
+    model_matrices
+from engine.gl.drawable import Mesh
+
+COUNTS = (100, 1000, 5000, 10000)
+
+
+def best_of(func, number=20, repeat=5):
+    "Best wall time of one func() call in milliseconds."
+    return min(timeit.repeat(func, number=number, repeat=repeat)) \
+        / number * 1000
+
+
+def main():
+    rng = np.random.default_rng(0)
+    triangle = [[0, 0, 0], [1, 0, 0], [0, 1, 0]]
+    print(f"{'bodies':>7}{'animator':>12}{'world':>12}"
+          f"{'world+models':>15}{'+matrices':>12}")
+    for count in COUNTS:
+        meshes = [Mesh(triangle) for _ in range(count)]
+        gravity = GravityAnimator(.003)
+        for mesh in meshes:
+            gravity.apply_to(mesh)
+        animator = best_of(gravity.step, number=2)
+
+        world = PhysicsWorld(drag=.1, magnus=.01, spin_decay=.01)
+        for _ in range(count):
+            world.add(rng.random(3), rng.random(3), rng.random(3))
+        bodies = best_of(world.step)
+
+        followed = PhysicsWorld(drag=.1, magnus=.01, spin_decay=.01)
+        for mesh in meshes:
+            followed.apply_to(mesh)
+        models = best_of(followed.step)
+
+        def read():
+            followed.step()
+            model_matrices(meshes)
+        matrices = best_of(read, number=2)
+        print(f"{count:>7}{animator:>10.2f}ms{bodies:>10.3f}ms"
+              f"{models:>13.3f}ms{matrices:>10.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+'''
+Render throughput without a window: frames per second, draw calls and GL
+calls per frame through VBOGameLoop.render, into an offscreen EGL context.
+On a machine without a GPU this is Mesa's llvmpipe, so the numbers measure
+the CPU side of the render path and are repeatable on CI.
+
+Scenes are grids of lit cubes, each its own model with its own VAO or
+sharing one MeshBuffer, drawn through the render queue or pipeline by
+pipeline, and the same grids drawn as one instanced model.
+
+The uniform buffer and uniform cache alone leave a model uniform, a VAO
+bind and a draw per model, about two GL calls each ("shared, no queue").
+The order of magnitude fewer calls comes from the render queue merging
+those into multi draws ("models, shared"): 1000 cubes go from about 2000
+GL calls a frame to 8.
+
+Run from the repository root: python -m benchmarks.bench_render
+'''
+from engine.gl.offscreen import OffscreenContext  # before OpenGL
+import glm
+import numpy as np
+from OpenGL.GL import GL_FRAGMENT_SHADER, GL_VERTEX_SHADER
+from engine.gameloop.VBOGameLoop import VBOGameLoop
+from engine.gl.camera import Camera
+from engine.gl.drawable import Point3D, cube
+from engine.gl.shader import Pipeline, Shader
+
+WIDTH, HEIGHT = 640, 480
+COUNTS = (10, 100, 1000)
+FRAMES = 100
+
+
+def grid(count):
+    '''
+    Positions of count cubes in a square grid in front of the camera. The
+    bigger grids spread out past the edges of the view.
+    '''
+    side = int(np.ceil(np.sqrt(count)))
+    i = np.arange(count)
+    return np.stack(((i % side - side / 2) * .3, (i // side - side / 2) * .3,
+                     np.full(count, -4.)), axis=1)
+
+
+def models_loop(count, culling, shared=False, queued=True):
+    pipeline = Pipeline(Shader('litvert', GL_VERTEX_SHADER),
+                        Shader('litfrag', GL_FRAGMENT_SHADER))
+    for position in grid(count):
+        shape = cube(.2, Point3D(-.1, -.1, -.1), color=(.8, .2, .2))
+        shape.gen_normals()
+        shape.compile_VBO()
+        shape.move(*position)
+        pipeline.add_model(shape, shared=shared)
+    loop = VBOGameLoop([pipeline], cameras=[Camera()])
+    loop.frustum_culling = culling
+    if not queued:
+        loop.render_queue = None
+    return loop
+
+
+def instanced_loop(count):
+    pipeline = Pipeline(Shader('litvert_instanced', GL_VERTEX_SHADER),
+                        Shader('litfrag', GL_FRAGMENT_SHADER))
+    shape = cube(.2, Point3D(-.1, -.1, -.1), color=(.8, .2, .2))
+    shape.gen_normals()
+    shape.compile_VBO()
+    pipeline.add_instances(shape, [glm.translate(glm.vec3(*position))
+                                   for position in grid(count)])
+    return VBOGameLoop([pipeline], cameras=[Camera()])
+
+
+def main():
+    with OffscreenContext(WIDTH, HEIGHT) as context:
+        print(f"{context.renderer}, {WIDTH}x{HEIGHT}, {FRAMES} frames")
+        print(f"{'cubes':>6}  {'scene':<16}{'fps':>9}{'draws':>8}"
+              f"{'culled':>8}{'GL calls':>10}")
+        for count in COUNTS:
+            for name, loop in (
+                    ('models', models_loop(count, False)),
+                    ('models, culled', models_loop(count, True)),
+                    ('models, shared', models_loop(count, False, True)),
+                    ('shared, no queue',
+                     models_loop(count, False, True, False)),
+                    ('instanced', instanced_loop(count))):
+                result = loop.benchmark(context, FRAMES)
+                print(f"{count:>6}  {name:<16}{result['fps']:>9.1f}"
+                      f"{result['drawn']:>8.0f}{result['culled']:>8.0f}"
+                      f"{result['gl_calls']:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
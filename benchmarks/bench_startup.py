@@ -0,0 +1,74 @@
+'''
+Startup time of building the game's pipelines, without the program cache,
+with an empty cache and with a warm one.
+
+Each run is a new process with its own offscreen EGL context, timing only
+the Pipeline(...) calls. The lit shaders are built as VARIANTS programs,
+each with a different #define, to stand in for a game with many shader
+variants. Every process gets an empty Mesa shader cache (Mesa only offers
+program binaries while its cache is on), so only this cache is ever warm.
+
+Run from the repository root: python -m benchmarks.bench_startup
+'''
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+VARIANTS = 20
+RUNS = 3
+
+BUILD = r"""
+import json, sys, time
+from engine.gl.offscreen import OffscreenContext
+from OpenGL.GL import GL_FRAGMENT_SHADER, GL_VERTEX_SHADER
+from engine.gl.shader import Pipeline, Shader
+
+def variant(name, shadertype, index):
+    code = Shader(name, shadertype)._code
+    version, rest = code.split('\n', 1)
+    return Shader.from_raw_code(
+        f"{version}\n#define VARIANT {index}\n{rest}", shadertype)
+
+with OffscreenContext(8, 8) as context:
+    Pipeline.use_program_cache = sys.argv[2] == 'on'
+    start = time.perf_counter()
+    for index in range(int(sys.argv[1])):
+        for vert in ('litvert', 'litvert_instanced'):
+            Pipeline(variant(vert, GL_VERTEX_SHADER, index),
+                     variant('litfrag', GL_FRAGMENT_SHADER, index))
+    print(json.dumps({'seconds': time.perf_counter() - start,
+                      'renderer': context.renderer}))
+"""
+
+
+def build(folder, cache):
+    with tempfile.TemporaryDirectory() as mesa_cache:
+        env = dict(os.environ, PYOPENGL_PLATFORM='egl',
+                   PINGPONG_PROGRAM_CACHE=folder,
+                   MESA_SHADER_CACHE_DIR=mesa_cache)
+        out = subprocess.run(
+            [sys.executable, '-c', BUILD, str(VARIANTS), cache], env=env,
+            capture_output=True, text=True, check=True,
+            cwd=os.path.join(os.path.dirname(__file__), '..'))
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    times = {'off': [], 'cold': [], 'warm': []}
+    for _ in range(RUNS):
+        with tempfile.TemporaryDirectory() as folder:
+            result = build(folder, 'off')
+            times['off'].append(result['seconds'])
+            times['cold'].append(build(folder, 'on')['seconds'])
+            times['warm'].append(build(folder, 'on')['seconds'])
+    print(f"{result['renderer']}, {2 * VARIANTS} programs, best of {RUNS}")
+    for name, seconds in times.items():
+        best = min(seconds) * 1000
+        print(f"  cache {name:<5}{best:>9.1f} ms"
+              f"{best / 2 / VARIANTS:>9.2f} ms per program")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+'''
+Frames per second of a mesh whose vertices move every frame, into an
+offscreen EGL context: a plain VBO, recompiled and uploaded whole each
+frame, against a StreamBuffer written in place, with glBufferSubData and
+with persistent mapped storage. Each is run moving every vertex and moving
+1% of them.
+
+Run from the repository root: python -m benchmarks.bench_stream
+'''
+from engine.gl.offscreen import OffscreenContext  # before OpenGL
+import numpy as np
+from OpenGL.GL import GL_FRAGMENT_SHADER, GL_VERTEX_SHADER
+from engine.gameloop.VBOGameLoop import VBOGameLoop
+from engine.gl.camera import Camera
+from engine.gl.drawable import Mesh
+from engine.gl.shader import Pipeline, Shader
+from engine.gl.stream_buffer import StreamBuffer
+
+WIDTH, HEIGHT = 640, 480
+VERTICES = 300000
+FRAMES = 100
+
+
+class DeformingLoop(VBOGameLoop):
+    "Moves the first rows vertices of mesh back and forth every step."
+    def __init__(self, mesh, rows, **kwargs):
+        super().__init__(**kwargs)
+        self.mesh = mesh
+        base = mesh.positions[:rows].copy()
+        self.poses = (base, base + (0, 0, .05))
+        self.steps = 0
+
+    def advance(self, elapsed):
+        super().advance(elapsed)
+        self.steps += 1
+        self.mesh.update_positions(self.poses[self.steps % 2])
+
+
+def deforming_loop(rows, dynamic):
+    rng = np.random.default_rng(0)
+    # Small triangles scattered in front of the camera, so the time goes
+    # on the vertices rather than on filling pixels.
+    centers = rng.uniform((-2, -1.5, -6), (2, 1.5, -4), (VERTICES // 3, 3))
+    positions = centers[:, None] + rng.uniform(-.01, .01,
+                                               (len(centers), 3, 3))
+    mesh = Mesh(positions, normals=np.tile((0, 0, 1.), (VERTICES, 1)),
+                dynamic=dynamic)
+    pipeline = Pipeline(Shader('litvert', GL_VERTEX_SHADER),
+                        Shader('litfrag', GL_FRAGMENT_SHADER))
+    pipeline.add_model(mesh)
+    loop = DeformingLoop(mesh, rows, shaders=[pipeline], cameras=[Camera()])
+    loop.frustum_culling = False
+    return loop
+
+
+def main():
+    with OffscreenContext(WIDTH, HEIGHT) as context:
+        print(f"{context.renderer}, {WIDTH}x{HEIGHT}, {VERTICES} vertices, "
+              f"{FRAMES} frames")
+        print(f"{'moved':>8}  {'buffer':<24}{'fps':>9}")
+        for rows in (VERTICES, VERTICES // 100):
+            for name, dynamic, persistent in (
+                    ('VBO, recompiled', False, False),
+                    ('StreamBuffer, sub data', True, False),
+                    ('StreamBuffer, mapped', True, True)):
+                StreamBuffer.use_persistent = persistent
+                result = deforming_loop(rows, dynamic).benchmark(context,
+                                                                 FRAMES)
+                print(f"{rows:>8}  {name:<24}{result['fps']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+'''
+Rallies per second of game.sweep with 1, 2, 4, ... worker processes up to
+the number of CPUs, and the speed up over one worker. Each run is a 10
+second rally; the grid covers spin, table rebound and gravity.
+
+Run from the repository root: python -m benchmarks.bench_sweep
+'''
+import os
+import time
+import numpy as np
+from game.sweep import grid, sweep
+
+SECONDS = 10.
+
+
+def runs(count):
+    spins = [(0., s, 0.) for s in np.linspace(-.05, .05, 4)]
+    rebounds = np.linspace(.6, .95, 4)
+    gravities = np.linspace(.002, .004, 4)
+    every = grid(spin=spins, rebound=rebounds, gravity=gravities,
+                 ball_position=[(-.25, 0., 0.)])
+    return (every * -(-count // len(every)))[:count]
+
+
+def main():
+    cpus = os.cpu_count()
+    workers = [1]
+    while workers[-1] * 2 <= cpus:
+        workers.append(workers[-1] * 2)
+    if workers[-1] != cpus:
+        workers.append(cpus)
+
+    batch = runs(16 * cpus)
+    print(f"{len(batch)} rallies of {SECONDS:g}s on {cpus} CPUs")
+    print(f"{'workers':>8}{'rallies/s':>12}{'speed up':>10}")
+    base = None
+    for count in workers:
+        start = time.perf_counter()
+        sweep(batch, SECONDS, workers=count)
+        rate = len(batch) / (time.perf_counter() - start)
+        base = base or rate
+        print(f"{count:>8}{rate:>12.1f}{rate / base:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''
+Frame time histograms of VBOGameLoop with the simulation on the main thread
+and on its own thread.
+
+The scene is the rally from game.drawables plus a crowd of boxes in the
+collision system, so a step takes a few milliseconds. There's no display
+here: render() is replaced by a sleep the length of a typical frame's GL
+work, which, like waiting on the driver, releases the GIL. The loop aims
+for 60 fps.
+
+Next to the histograms are the simulation steps run per wall second. A
+step here takes longer than its 1/SIM_RATE s share of real time, so the
+simulation falls behind in both modes: it can't keep up with SIM_RATE,
+and both advance and simulate drop the backlog after max_sim_steps
+(simulate sets due = now), so game time runs slower than real time.
+Threading keeps the frames smooth; it doesn't make the steps cheaper.
+
+Run from the repository root: python -m benchmarks.bench_threaded_loop
+'''
+import contextlib
+import io
+import time
+from types import SimpleNamespace
+import glm
+import numpy as np
+import pygame
+from engine.gameloop.VBOGameLoop import VBOGameLoop
+from engine.gl.collision import CollisionBox
+from game.drawables import rally
+
+SECONDS = 3.
+FPS = 60
+SIM_RATE = 120
+RENDER_MS = 6.
+CROWD = 3000
+
+
+class EmulatedLoop(VBOGameLoop):
+    "Draws nothing; stops itself after SECONDS. Counts the steps run."
+    steps = 0
+
+    def GLsetup(self, display):
+        self.started = time.perf_counter()
+        self.steps = 0
+
+    def animate(self):
+        super().animate()
+        self.steps += 1
+
+    def create_buffers(self):
+        pass
+
+    def handle_events(self):
+        pass
+
+    def render(self):
+        time.sleep(RENDER_MS / 1000.)
+        self.wall = time.perf_counter() - self.started
+        self.exit_flag = self.wall > SECONDS
+
+
+def scene():
+    rng = np.random.default_rng(0)
+    with contextlib.redirect_stdout(io.StringIO()):  # box size prints
+        drawables, _, gravity, collision_system = rally(
+            ball_position=(-.25, 0., 0.))
+        for corner in rng.uniform(-5, 5, (CROWD, 3)):
+            box = CollisionBox(.05, .05, .05)
+            box.base_offset = glm.vec3(*corner)
+            box.attach_to_point(SimpleNamespace(vertex=glm.vec3()))
+            collision_system.add(box)
+    shader = SimpleNamespace(
+        _models_and_VAOs=[(d, None) for d in drawables.values()],
+        _instances_and_VAOs=[])
+    return shader, gravity, collision_system
+
+
+def run(threaded):
+    shader, gravity, collision_system = scene()
+    loop = EmulatedLoop([shader], cameras=[], sim_rate=SIM_RATE,
+                        threaded=threaded)
+    loop.animators.append(gravity)
+    loop.collision_systems.append(collision_system)
+    loop.animate()  # warm up
+    start = time.perf_counter()
+    loop.animate()
+    step = (time.perf_counter() - start) * 1000
+    loop.begin(None, pygame.time.Clock(), FPS)
+    return loop, step
+
+
+def main():
+    for threaded in (False, True):
+        loop, step = run(threaded)
+        counts, edges = loop.frame_time_histogram()
+        times = np.array(loop.frame_times) * 1000
+        print(f"{'threaded' if threaded else 'one thread'}: "
+              f"{len(times)} frames, one step {step:.1f} ms, "
+              f"mean frame {times.mean():.1f} ms, "
+              f"worst {times.max():.1f} ms")
+        rate = loop.steps / loop.wall
+        print(f"  {rate:.0f} sim steps / wall s of {SIM_RATE}, one step "
+              f"{step:.1f} ms of a {1000. / SIM_RATE:.1f} ms budget"
+              + (", falling behind" if rate < .99 * SIM_RATE else ""))
+        for count, low, high in zip(counts, edges, edges[1:]):
+            print(f"  {low:>4g}-{high:<4g} ms {count:>5} {'#' * (count // 4)}")
+
+
+if __name__ == '__main__':
+    main()
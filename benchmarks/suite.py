@@ -0,0 +1,351 @@
+'''
+Times the engine's hot paths on synthetic scenes of increasing size. Nothing
+here needs a display or a GL context.
+
+    python -m benchmarks.suite                  # exit 1 on regressions
+    python -m benchmarks.suite --against main   # since main; use in CI
+    python -m benchmarks.suite -k collision --threshold .5
+    python -m benchmarks.suite --save           # time, and save baselines
+
+The suite compares against a reference commit, HEAD unless --against names
+another (or a directory). It checks the commit out into a temporary git
+worktree and times it and the working tree in a process each, taking turns
+on every case and size for a few rounds. A case regresses when its median
+time is more than 1 + threshold times the reference's. Both sides run on
+the same machine at the same time, so a slower or busier machine slows
+both alike. Cases the reference tree doesn't have yet are skipped.
+
+Timings saved with --save, to benchmarks/baselines.json by default, can be
+compared against with --baselines instead, but only on the machine that
+saved them, so they're not committed.
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+from types import SimpleNamespace
+import glm
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+ASSETS = os.path.join(os.path.dirname(__file__), '..', 'assets',
+                      'pingponggame')
+THRESHOLD = .25
+
+
+# The setups import what they time themselves, so a case whose code an
+# older reference tree doesn't have is skipped rather than stopping the
+# whole run.
+def obj_to_shape(name):
+    from engine.gl.obj_loader import OBJ_to_shape
+    path = os.path.join(ASSETS, name)
+    return lambda: OBJ_to_shape(path)
+
+
+def compile_VBO(detail):
+    from engine.gl.drawable import Point3D, sphere
+    shape = sphere(1., Point3D(0, 0, 0), detail=detail)
+    return lambda: shape.compile_VBO(force=True)
+
+
+def gen_normals(detail):
+    from engine.gl.drawable import Point3D, sphere
+    shape = sphere(1., Point3D(0, 0, 0), detail=detail)
+    return shape.gen_normals
+
+
+def make_sphere(detail):
+    from engine.gl.drawable import Point3D, sphere
+    return lambda: sphere(1., Point3D(0, 0, 0), detail=detail)
+
+
+def camera_matrix(count):
+    "The matrices of count cameras that all just turned."
+    from engine.gl.camera import Camera
+    cameras = [Camera() for _ in range(count)]
+
+    def run():
+        for camera in cameras:
+            camera.rotate(.1, 0, 0)
+            camera.matrix
+    return run
+
+
+def collision_detect(count):
+    "count ball sized boxes spread so each touches a few others."
+    from engine.gl.collision import CollisionBox, CollisionSystem
+    rng = np.random.default_rng(0)
+    width = .6 * count ** (1 / 3)
+    system = CollisionSystem()
+    with contextlib.redirect_stdout(io.StringIO()):  # box size prints
+        for corner in rng.uniform(0, width, (count, 3)):
+            area = CollisionBox(.1, .1, .1)
+            area.base_offset = glm.vec3(*corner)
+            area.attach_to_point(SimpleNamespace(vertex=glm.vec3()))
+            system.add(area)
+    return system.detect
+
+
+def gravity_step(count):
+    from engine.gl.animations import GravityAnimator
+    from engine.gl.drawable import Mesh
+    gravity = GravityAnimator(.003)
+    for _ in range(count):
+        gravity.apply_to(Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]]))
+    return gravity.step
+
+
+def euler_matrix(count):
+    from engine.gl.utils import transformations
+    angles = np.random.default_rng(0).uniform(-np.pi, np.pi, (count, 3))
+
+    def run():
+        for ai, aj, ak in angles:
+            transformations.euler_matrix(ai, aj, ak)
+    return run
+
+
+# name: (setup(size) returning the function to time, sizes)
+CASES = {
+    'OBJ_to_shape': (obj_to_shape, ('Paddle.obj', 'PingPongPaddle.obj')),
+    'Shape3D.compile_VBO': (compile_VBO, (1, 2, 3, 4)),
+    'Shape3D.gen_normals': (gen_normals, (1, 2, 3, 4)),
+    'sphere': (make_sphere, (0, 1, 2, 3, 4, 5, 6)),
+    'Camera.matrix': (camera_matrix, (1, 100, 1000)),
+    'CollisionSystem.detect': (collision_detect, (10, 100, 1000)),
+    'GravityAnimator.step': (gravity_step, (10, 100, 1000)),
+    'euler_matrix': (euler_matrix, (1, 100, 1000)),
+}
+
+
+def best_of(func, repeat=5, budget=.2):
+    '''
+    Best time of one func() call in milliseconds. Fast functions are run
+    in loops of about budget / repeat seconds to get above the clock's
+    resolution.
+    '''
+    func()  # warm up caches
+    timer = timeit.Timer(func)
+    loop = budget / repeat
+    number = 1
+    while True:  # like Timer.autorange, but up to a tenth of a loop
+        took = timer.timeit(number)
+        if took >= loop / 10:
+            break
+        number *= 10
+    number = max(1, int(number * loop / took))
+    return min(timer.repeat(repeat, number)) / number * 1000
+
+
+def run(cases=CASES, repeat=5, budget=.2, log=print):
+    '''
+    Times every case at every size: {case: {size: ms}}. A case that fails
+    to set up, e.g. in an older reference tree, is logged and left out.
+    '''
+    results = {}
+    for name, (setup, sizes) in cases.items():
+        results[name] = {}
+        for size in sizes:
+            try:
+                ms = best_of(setup(size), repeat, budget)
+            except Exception as err:
+                log(f"{name:<24}{size!s:>20}  skipped: {err!r}")
+                continue
+            results[name][str(size)] = ms
+            log(f"{name:<24}{size!s:>20}{ms:>12.3f} ms")
+    return results
+
+
+@contextlib.contextmanager
+def reference_tree(ref):
+    '''
+    The directory of the code to compare against: ref itself if it's a
+    directory, else a temporary git worktree of the commit ref names.
+    '''
+    if os.path.isdir(ref):
+        yield os.path.abspath(ref)
+        return
+    with tempfile.TemporaryDirectory() as folder:
+        tree = os.path.join(folder, 'reference')
+        subprocess.run(['git', 'worktree', 'add', '--detach', '--quiet',
+                        tree, ref], cwd=ROOT, check=True)
+        try:
+            yield tree
+        finally:
+            subprocess.run(['git', 'worktree', 'remove', '--force', tree],
+                           cwd=ROOT, check=True)
+
+
+_REPLY = '@suite '  # marks serve()'s answers among anything else printed
+
+
+def serve(lines=sys.stdin):
+    '''
+    Answers timing requests, one JSON [case, size, repeat, budget] per
+    line, with the ms for it on a line of its own. Each case is set up once
+    and reused. Used by against to time a tree in its own process.
+    '''
+    funcs = {}
+    for line in lines:
+        name, size, repeat, budget = json.loads(line)
+        try:
+            if (name, size) not in funcs:
+                setup, sizes = CASES[name]
+                funcs[name, size] = setup(next(s for s in sizes
+                                               if str(s) == size))
+            reply = {'ms': best_of(funcs[name, size], repeat, budget)}
+        except Exception as err:
+            reply = {'error': repr(err)}
+        print(_REPLY + json.dumps(reply), flush=True)
+
+
+def _start(tree):
+    "A process serving timings of the engine in tree."
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve'], cwd=tree,
+        env=dict(os.environ, PYTHONPATH=tree), stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE, text=True)
+
+
+def _time(process, name, size, repeat, budget):
+    process.stdin.write(json.dumps([name, size, repeat, budget]) + '\n')
+    process.stdin.flush()
+    for line in process.stdout:
+        if line.startswith(_REPLY):
+            return json.loads(line[len(_REPLY):])
+    raise RuntimeError(f"The suite process timing {name} exited.")
+
+
+def against(ref, cases=CASES, rounds=5, repeat=5, budget=.2, log=print):
+    '''
+    Times every case in the reference tree (see reference_tree) and the
+    working tree, each in its own process. The two take turns for every
+    case and size, rounds times, so a machine that slows down or speeds up
+    does so for both. Returns the median timings of both as (current,
+    reference); cases that fail on either side are left out.
+    '''
+    current, reference = {}, {}
+    with reference_tree(ref) as tree:
+        sides = [_start(tree), _start(ROOT)]
+        try:
+            for name, (_, sizes) in cases.items():
+                current[name], reference[name] = {}, {}
+                for size in map(str, sizes):
+                    times = ([], [])
+                    for i in range(rounds):
+                        # ABBA order, so neither side always goes first
+                        for side in (0, 1) if i % 2 == 0 else (1, 0):
+                            times[side].append(_time(sides[side], name,
+                                                     size, repeat, budget))
+                    errors = [t['error'] for side in times for t in side
+                              if 'error' in t]
+                    if errors:
+                        log(f"{name:<24}{size:>20}  skipped: {errors[0]}")
+                        continue
+                    ref_ms, ms = (float(np.median([t['ms'] for t in side]))
+                                  for side in times)
+                    reference[name][size], current[name][size] = ref_ms, ms
+                    log(f"{name:<24}{size:>20}{ms:>12.3f} ms"
+                        f"{ref_ms:>12.3f} ms{ms / ref_ms - 1:>+8.0%}")
+        finally:
+            for process in sides:
+                process.stdin.close()
+                process.wait()
+    return current, reference
+
+
+def compare(results, baselines, threshold=THRESHOLD):
+    '''
+    Returns (case, size, ms, baseline ms) for every timing more than
+    1 + threshold times slower than its baseline. Timings without a
+    baseline are skipped.
+    '''
+    regressions = []
+    for name, sizes in results.items():
+        for size, ms in sizes.items():
+            baseline = baselines.get(name, {}).get(size)
+            if baseline is not None and ms > baseline * (1 + threshold):
+                regressions.append((name, size, ms, baseline))
+    return regressions
+
+
+def load(path=BASELINES):
+    "The baseline timings saved at path, or {} if there are none."
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def save(results, path=BASELINES):
+    with open(path, 'w') as f:
+        json.dump({'machine': platform.machine(),
+                   'python': platform.python_version(),
+                   'numpy': np.__version__,
+                   'results': results}, f, indent=1)
+        f.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--against', metavar='REF', default='HEAD',
+                        help='git commit or directory to compare with '
+                             '(default: HEAD)')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='timings of each side to take the median of')
+    parser.add_argument('--save', action='store_true',
+                        help='just time the working tree and save the '
+                             'timings as local baselines')
+    parser.add_argument('--baselines', metavar='PATH',
+                        help='compare with timings saved by --save instead '
+                             'of a reference commit')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='allowed slow down, e.g. .5 for 50%%')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=.2,
+                        help='seconds to spend timing each case and size')
+    parser.add_argument('--serve', action='store_true',
+                        help=argparse.SUPPRESS)  # see against
+    parser.add_argument('-k', dest='match', default='',
+                        help='only run cases whose name contains this')
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve()
+        return 0
+    cases = {name: case for name, case in CASES.items()
+             if args.match.lower() in name.lower()}
+    if args.save or args.baselines:
+        path = args.baselines or BASELINES
+        baselines = load(path)
+        if not args.save and not baselines:
+            parser.error(f"no baselines saved at {path}")
+        results = run(cases, args.repeat, args.budget)
+        if args.save:
+            baselines.update(results)
+            save(baselines, path)
+            print(f"Saved baselines to {path}")
+            return 0
+    else:
+        print(f"{'':<44}{'current':>12}{args.against:>15.15}")
+        results, baselines = against(args.against, cases, args.rounds,
+                                     args.repeat, args.budget)
+
+    regressions = compare(results, baselines, args.threshold)
+    for name, size, ms, baseline in regressions:
+        print(f"REGRESSION {name} [{size}]: {ms:.3f} ms, baseline "
+              f"{baseline:.3f} ms ({ms / baseline - 1:+.0%})")
+    if not regressions:
+        print("No regressions.")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
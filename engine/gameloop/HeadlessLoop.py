@@ -0,0 +1,102 @@
+import numpy as np
+from .timing import TICK
+
+
+class HeadlessLoop:
+    '''
+    Runs the simulation part of a game loop (animators and collision
+    systems) without a display: no pygame, no OpenGL context and no VBOs.
+    Steps run back to back as fast as the CPU allows, for batches of
+    simulated matches.
+
+    What happens is recorded into NumPy arrays: track() a model's position
+    or any value, and run() returns an array per tracked name with a row
+    per recorded step.
+
+        loop = HeadlessLoop([gravity], [collision_system])
+        loop.track('ball', drawables['ball'])
+        trajectories = loop.run(seconds=10)
+        trajectories['ball']  # (steps + 1, 3)
+    '''
+    def __init__(self, animators=None, collision_systems=None, sim_rate=120):
+        '''
+        :param sim_rate: Simulation steps per simulated second, as in
+          VBOGameLoop.
+        '''
+        self.animators = animators if animators else []
+        self.collision_systems = collision_systems if collision_systems \
+            else []
+        self.sim_rate = sim_rate
+        self.steps = 0  # run so far
+        self._probes = {}
+
+    @property
+    def sim_time(self):
+        "Simulated seconds so far."
+        return self.steps / self.sim_rate
+
+    def track(self, name, model=None, probe=None):
+        '''
+        Records a value whenever run() records a row.
+
+        :param model: A Transformable; its position (the translation of
+          its model matrix) is recorded.
+        :param probe: Or a function returning the value to record, e.g.
+          lambda: world.position for every body of a PhysicsWorld. It must
+          return the same shape every time.
+        '''
+        if (model is None) == (probe is None):
+            raise ValueError("Give either a model or a probe to track.")
+        if probe is None:
+            probe = lambda: model.model_matrix[3].xyz
+        self._probes[name] = probe
+
+    def untrack(self, name):
+        del self._probes[name]
+
+    def step(self):
+        "Runs one simulation step, the same as VBOGameLoop.animate."
+        dt = 1. / (self.sim_rate * TICK)
+        for ani in self.animators:
+            ani.step(dt)
+        for coll in self.collision_systems:
+            coll.detect()
+        self.steps += 1
+
+    def run(self, steps=None, seconds=None, until=None, every=1):
+        '''
+        Runs steps simulation steps, or enough to simulate seconds, and
+        returns the trajectories as {name: array}, recorded before the first
+        step and then after every few steps, plus 'time': the simulated time
+        of each row.
+
+        :param until: Optional function called after each step; return True
+          to stop early. The arrays only hold the rows recorded by then.
+        :param every: Record after every this many steps, and after the
+          last one.
+        '''
+        if (steps is None) == (seconds is None):
+            raise ValueError("Give either steps or seconds to run.")
+        if steps is None:
+            steps = int(round(seconds * self.sim_rate))
+        rows = -(-steps // every) + 1
+        records = {'time': np.empty(rows)}
+        for name, probe in self._probes.items():
+            first = np.asarray(probe(), np.float64)
+            records[name] = np.empty((rows,) + first.shape)
+            records[name][0] = first
+        records['time'][0] = self.sim_time
+
+        probes = list(self._probes.items())
+        row = 1
+        for i in range(1, steps + 1):
+            self.step()
+            stop = until is not None and until()
+            if i % every == 0 or i == steps or stop:
+                records['time'][row] = self.sim_time
+                for name, probe in probes:
+                    records[name][row] = probe()
+                row += 1
+            if stop:
+                break
+        return {name: values[:row] for name, values in records.items()}
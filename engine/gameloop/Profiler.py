@@ -0,0 +1,114 @@
+import csv
+import json
+import time
+import numpy as np
+
+# Where a frame's time goes, in the order VBOGameLoop runs them. idle is
+# clock.tick waiting for the next frame.
+PHASES = ('events', 'animators', 'collision', 'interpolate', 'render',
+          'flip', 'idle')
+# Per frame counts copied from VBOGameLoop.frame_stats.
+COUNTERS = ('drawn', 'culled', 'gl_calls', 'sim_steps')
+
+
+class Profiler:
+    '''
+    Records how long each phase of every frame took, and a few counts, into
+    a ring buffer holding the last capacity frames.
+
+    A frame is start_frame(), then mark(phase) at the end of each phase,
+    which adds the time since the previous mark to that phase, then
+    end_frame(). Marking costs a clock read and an add, so profiling every
+    frame is cheap; the statistics are only worked out when asked for.
+    '''
+    def __init__(self, capacity=1000, phases=PHASES, counters=COUNTERS):
+        self.phases = tuple(phases)
+        self.counters = tuple(counters)
+        self.columns = self.phases + ('frame',) + self.counters
+        self._column = {name: i for i, name in enumerate(self.columns)}
+        self._frame = self._column['frame']
+        self.data = np.zeros((capacity, len(self.columns)))
+        self.frames = 0  # recorded in total
+        self._row = np.zeros(len(self.columns))
+        self._start = self._last = time.perf_counter()
+
+    def start_frame(self):
+        self._row[:] = 0.
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, phase):
+        "Ends a phase: adds the time since the last mark to it."
+        now = time.perf_counter()
+        self._row[self._column[phase]] += now - self._last
+        self._last = now
+
+    def end_frame(self, stats=None):
+        '''
+        Stores the frame in the ring buffer.
+
+        :param stats: Optional dict of this frame's counts, e.g.
+          VBOGameLoop.frame_stats; only the profiler's counters are kept.
+        '''
+        row = self._row
+        row[self._frame] = time.perf_counter() - self._start
+        if stats:
+            for name in self.counters:
+                if name in stats:
+                    row[self._column[name]] = stats[name]
+        self.data[self.frames % len(self.data)] = row
+        self.frames += 1
+
+    def recent(self):
+        "The frames held, oldest first, as a (frames, columns) array."
+        if self.frames <= len(self.data):
+            return self.data[:self.frames]
+        return np.roll(self.data, -(self.frames % len(self.data)), axis=0)
+
+    def percentiles(self, q=(50, 95, 99)):
+        '''
+        Rolling percentiles over the frames held, as {column: array with a
+        value per q}. Times are in milliseconds.
+        '''
+        recent = self.recent()
+        if not len(recent):
+            return {}
+        values = np.percentile(recent, q, axis=0)
+        values[:, :self._frame + 1] *= 1000.
+        return {name: values[:, i] for i, name in enumerate(self.columns)}
+
+    def summary(self, q=(50, 95, 99)):
+        "percentiles as plain {column: {'p50': value, ...}}, e.g. for JSON."
+        return {name: {f'p{p:g}': float(value) for p, value in zip(q, values)}
+                for name, values in self.percentiles(q).items()}
+
+    def overlay_lines(self):
+        "A few lines of text for an on screen overlay."
+        stats = self.percentiles()
+        if not stats:
+            return []
+        p50, p95, p99 = stats['frame']
+        lines = [f"frame {p50:.1f} / {p95:.1f} / {p99:.1f} ms "
+                 f"(p50 / p95 / p99)"]
+        lines += [f"{name:<12}{stats[name][0]:>6.2f} ms"
+                  for name in self.phases]
+        lines += [f"{name:<12}{stats[name][0]:>6.0f}"
+                  for name in self.counters]
+        return lines
+
+    def dump(self, path):
+        '''
+        Writes the frames held to a .csv file, a row per frame with times in
+        seconds, or to a .json file with the percentiles and the frames.
+        '''
+        recent = self.recent()
+        if str(path).endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump({'frames': self.frames,
+                           'percentiles': self.summary(),
+                           'columns': self.columns,
+                           'data': recent.tolist()}, f, indent=1)
+        else:
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(self.columns)
+                writer.writerows(recent.tolist())
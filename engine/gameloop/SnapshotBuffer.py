@@ -0,0 +1,79 @@
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+import numpy as np
+
+# The model and camera matrices after the last two published simulation states, as
+# read only (n, 4, 4) arrays indexed like glm, and the time.perf_counter()
+# the latest was published at.
+Snapshot = namedtuple('Snapshot', 'previous current time')
+
+
+class SnapshotBuffer:
+    '''
+    Double buffered model and camera matrices passed from a simulation
+    thread to a render thread.
+
+    The simulation thread publish()es into the back buffer while the render
+    thread reads the front one, then the two swap. A reader only ever sees a
+    whole state, and the writer only waits if the reader is still on the
+    buffer it's about to fill, i.e. when rendering took longer than a
+    simulation step.
+    '''
+    def __init__(self, models, cameras=()):
+        '''
+        :param models: The models, in the order publish gets their matrices.
+        :param cameras: Cameras whose matrices publish gets after the
+          models', so the reader draws from the view the state was
+          simulated with.
+        '''
+        self.models = list(models)
+        self.cameras = list(cameras)
+        count = len(self.models) + len(self.cameras)
+        self._arrays = [np.zeros((2, count, 4, 4), np.float32)
+                        for _ in range(2)]
+        for arrays in self._arrays:
+            arrays[:, :] = np.eye(4, dtype=np.float32)
+        self._times = [0., 0.]
+        self._readers = [0, 0]
+        self._front = 0
+        self._changed = threading.Condition()
+        self.published = 0  # count
+
+    def publish(self, matrices, time):
+        '''
+        Makes matrices, an (n, 4, 4) array of the models' current matrices
+        followed by the cameras', the latest snapshot; the previous latest
+        becomes its previous.
+        '''
+        with self._changed:
+            back = 1 - self._front
+            self._changed.wait_for(lambda: not self._readers[back])
+        # Readers only take the front buffer, so this one is ours until the
+        # swap below.
+        arrays = self._arrays[back]
+        arrays[0] = self._arrays[self._front][1]
+        arrays[1] = matrices
+        self._times[back] = time
+        with self._changed:
+            self._front = back
+            self.published += 1
+
+    @contextmanager
+    def read(self):
+        '''
+        The latest Snapshot. Its arrays stay valid until the with block
+        ends; copy anything needed after that.
+        '''
+        with self._changed:
+            front = self._front
+            self._readers[front] += 1
+        try:
+            previous, current = self._arrays[front]
+            previous, current = previous.view(), current.view()
+            previous.flags.writeable = current.flags.writeable = False
+            yield Snapshot(previous, current, self._times[front])
+        finally:
+            with self._changed:
+                self._readers[front] -= 1
+                self._changed.notify_all()
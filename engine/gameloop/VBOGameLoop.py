@@ -10,12 +10,48 @@ from OpenGL.GLU import *
 from OpenGL.GLU import gluPerspective
 from OpenGL.arrays.vbo import VBO
 from .GameLoop import GameLoop
+from .Profiler import Profiler
+from .SnapshotBuffer import SnapshotBuffer
+from .timing import TICK
+from ..gl.animations import model_matrices
+from ..gl.render_queue import RenderQueue
+from ..gl.shader import warm_up
+from ..gl.ubo import UniformBuffer
+from ..gl.utils import bounds
+from collections import deque
 from contextlib import contextmanager
+import queue
+import threading
+import time
 
 
 class VBOGameLoop(GameLoop):
     "A game loop that draws with Vertex Buffer Objects."
-    def __init__(self, shaders=None, cameras=None, lights=None, filters=None):
+    def __init__(self, shaders=None, cameras=None, lights=None, filters=None,
+                 sim_rate=120, max_sim_steps=8, threaded=False,
+                 profile=False, profile_overlay=False):
+        '''
+        :param sim_rate: Simulation steps per second. Animators and collision
+          systems step at this fixed rate whatever the frame rate is. The
+          animators are passed the step's length in ticks (see
+          timing.TICK), so the rate changes how finely motion is
+          simulated, not how fast things move.
+        :param max_sim_steps: The most simulation steps run for one frame.
+          After a longer stall the simulation slows down instead of trying
+          to catch up.
+        :param threaded: Run the simulation on its own thread. It publishes
+          the model matrices after every step to a SnapshotBuffer, and the
+          main thread only draws the latest snapshot, so a slow step
+          doesn't hold up a frame. Event handlers run on the simulation
+          thread. The view camera's matrix is published with the models',
+          and handlers and animators change vertex data (update_positions,
+          compile_VBO) through on_render_thread, so a frame never reads
+          a camera or a buffer halfway through a change.
+        :param profile: True to time the phases of every frame with a
+          Profiler (self.profiler), or a .csv or .json path to also write
+          the timings there when the loop's with block exits.
+        :param profile_overlay: Draw the profiler's numbers on screen.
+        '''
         self.shaders = shaders if shaders else []
         self.cameras = cameras if cameras else []
         self.view = cameras[0] if len(cameras) else None
@@ -25,6 +61,41 @@ class VBOGameLoop(GameLoop):
         self.filters = filters if filters else []
         self.animators = []
         self.collision_systems = []
+        # Skip models outside the camera's view; counts are per frame.
+        self.frustum_culling = True
+        self.frame_stats = {'drawn': 0, 'culled': 0, 'gl_calls': 0,
+                            'sim_steps': 0}
+        # Draw every pipeline's models sorted by state and depth, merged
+        # into multi draws where they can be; None to draw them pipeline
+        # by pipeline in the order they were added.
+        self.render_queue = RenderQueue()
+
+        # Fixed timestep: time not yet simulated, and the model matrices
+        # from before the last step for interpolating between steps.
+        self.sim_rate = sim_rate
+        self.max_sim_steps = max_sim_steps
+        self._accumulator = 0.
+        self._previous = None
+        self._render_matrices = {}
+
+        self.threaded = threaded
+        self.snapshots = None
+        self._events = queue.Queue()  # for the simulation thread
+        self._render_tasks = queue.Queue()  # for the main thread
+        self._render_view = None  # the snapshot's view matrix
+        self._published = 0
+
+        # Seconds between frames, for frame_time_histogram.
+        self.frame_times = deque(maxlen=10000)
+        self.profiler = Profiler() if profile else None
+        self.profile_path = profile if isinstance(profile, str) else None
+        self.profile_overlay = profile_overlay
+        self._overlay = None
+
+        # Pipelines to link in spare time, a few each frame, before they're
+        # first drawn with; see engine.gl.shader.warm_up.
+        self.warm_up = []
+        self.warm_up_budget = .002  # seconds a frame
 
         self._event_handlers = {}
         self.state = {}  # a dictionary for storing in-game variables.
@@ -32,12 +103,15 @@ class VBOGameLoop(GameLoop):
     def GLsetup(self, display):
         "Set up OpenGL."
         self.projection = glm.perspective(45, float(display.get_width()) / display.get_height(), .02, 5)
+        self.display = display
+        self.display_size = display.get_size()
         # Set up the drawing field.
         glEnable(GL_POLYGON_SMOOTH)
         glHint(GL_POLYGON_SMOOTH_HINT, GL_NICEST)
         glEnable(GL_BLEND)
         glEnable(GL_DEPTH_TEST)
         glClearColor(.5, .5, .5, 0.)
+        self.frame_buffer = UniformBuffer()
 
         # Drawing mode.
 
@@ -72,69 +146,447 @@ class VBOGameLoop(GameLoop):
 
         # Main Loop
         self.flaggo = True
+        self.frame_times.clear()
+        if self.threaded:
+            self._begin_threaded(clock, clock_rate)
+            return
+        elapsed = 0.
+        profiler = self.profiler
         while not self.exit_flag:
+            if profiler:
+                profiler.start_frame()
             self.handle_events()
-            self.animate()
+            if profiler:
+                profiler.mark('events')
+            self.advance(elapsed)
+            if profiler:
+                profiler.mark('interpolate')
             self.render()
-            clock.tick(clock_rate)
+            if profiler:
+                profiler.mark('flip')
+            if self.warm_up:
+                warm_up(self.warm_up, self.warm_up_budget)
+            elapsed = clock.tick(clock_rate) / 1000.
+            self.frame_times.append(elapsed)
+            if profiler:
+                profiler.mark('idle')
+                profiler.end_frame(self.frame_stats)
         # end game loop
 
+    def _begin_threaded(self, clock, clock_rate):
+        "The main loop when the simulation has its own thread."
+        self.snapshots = SnapshotBuffer(
+            self._models(), [self.view] if self.view else [])
+        self.snapshots.publish(self._snapshot_matrices(),
+                               time.perf_counter())
+        self._published = self.snapshots.published
+        simulation = threading.Thread(target=self.simulate,
+                                      name='simulation', daemon=True)
+        simulation.start()
+        profiler = self.profiler
+        try:
+            while not self.exit_flag:
+                if profiler:
+                    profiler.start_frame()
+                self.handle_events()
+                self.run_render_tasks()
+                if profiler:
+                    profiler.mark('events')
+                self.interpolate_snapshot()
+                if profiler:
+                    profiler.mark('interpolate')
+                self.render()
+                if profiler:
+                    profiler.mark('flip')
+                if self.warm_up:
+                    warm_up(self.warm_up, self.warm_up_budget)
+                self.frame_times.append(clock.tick(clock_rate) / 1000.)
+                if profiler:
+                    profiler.mark('idle')
+                    profiler.end_frame(self.frame_stats)
+        finally:
+            self.exit_flag = True
+            simulation.join()
+
+    def simulate(self):
+        '''
+        The simulation thread: runs queued event handlers, steps at
+        sim_rate with the same catch-up cap as advance, and publishes the
+        models' matrices after every step.
+        '''
+        dt = self.sim_dt
+        due = time.perf_counter()
+        while not self.exit_flag:
+            self.handle_queued_events()
+            now = time.perf_counter()
+            if now < due:
+                time.sleep(due - now)
+                continue
+            for _ in range(self.max_sim_steps):
+                self.animate()
+                self.snapshots.publish(self._snapshot_matrices(),
+                                       time.perf_counter())
+                due += dt
+                if due > now:
+                    break
+            else:
+                due = now  # drop the rest of a stall
+
+    def _snapshot_matrices(self):
+        "What simulate publishes: the models' matrices, then the cameras'."
+        return np.concatenate((
+            model_matrices(self.snapshots.models),
+            bounds.matrix_array(camera.matrix
+                                for camera in self.snapshots.cameras)))
+
+    def on_render_thread(self, func, *args):
+        '''
+        Calls func(*args) on the thread that draws: right away, or with the
+        simulation on its own thread, before the next frame. Event
+        handlers and animators change vertex data through this, e.g.
+        loop.on_render_thread(mesh.update_positions, positions).
+        '''
+        if self.threaded and self.snapshots is not None:
+            self._render_tasks.put((func, args))
+        else:
+            func(*args)
+
+    def run_render_tasks(self):
+        "Runs the calls queued by on_render_thread."
+        while True:
+            try:
+                func, args = self._render_tasks.get_nowait()
+            except queue.Empty:
+                return
+            func(*args)
+
+    def handle_queued_events(self):
+        "Runs the handlers for the events the main thread queued."
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                return
+            self._event_handlers[event.type](self, event)
+
+    def interpolate_snapshot(self):
+        '''
+        Sets the matrices to draw with from the latest snapshot, blended
+        from its previous state by the time since it was published, like
+        interpolate, and the view matrix from it as it is. Also counts the
+        steps published since the last frame.
+        '''
+        count = len(self.snapshots.models)
+        with self.snapshots.read() as snapshot:
+            alpha = min((time.perf_counter() - snapshot.time) *
+                        self.sim_rate, 1.)
+            previous, current = snapshot.previous[:count], \
+                snapshot.current[:count]
+            blended = previous + (current - previous) * np.float32(alpha)
+            views = snapshot.current[count:].tobytes()
+        matrices = glm.array.from_bytes(blended.tobytes(), glm.mat4)
+        self._render_matrices = dict(zip(map(id, self.snapshots.models),
+                                         matrices))
+        if views:
+            self._render_view = glm.array.from_bytes(views, glm.mat4)[0]
+        published = self.snapshots.published
+        self.frame_stats['sim_steps'] = published - self._published
+        self._published = published
+
+    def frame_time_histogram(self, bins=(0, 8, 17, 25, 34, 50, 100, 1000)):
+        '''
+        Counts of the recorded frame times, as returned by np.histogram:
+        (counts, bin edges in milliseconds). At 60 fps frames take 17 ms;
+        a frame that misses a refresh lands in a later bin.
+        '''
+        return np.histogram(np.array(self.frame_times) * 1000., bins)
+
     def render(self):
         "Override for custom drawing."
         # Clear the screen buffer
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        # GL calls made this frame, roughly: each bind, upload and draw.
+        gl_calls = 1
+
+        # Camera and lights go to the shared uniform buffer once per frame,
+        # and only if they changed.
+        frame = self.frame_uniforms()
+        self.frame_buffer.update(frame)
+        if self.frame_buffer.upload():
+            gl_calls += 3
+
+        self.frame_stats['drawn'] = self.frame_stats['culled'] = 0
+        view = self.view_matrix()
+        planes = bounds.frustum_planes(self.projection * view) \
+            if self.frustum_culling else None
+
+        render_queue = self.render_queue
+        if render_queue is not None:
+            render_queue.clear()
+            for shader in self.shaders:
+                visible = self.cull(shader._models_and_VAOs, planes)
+                render_queue.submit(shader, visible, [
+                    self.render_matrix(mdl) for mdl, _ in visible])
+            render_queue.sort(view)
+            gl_calls += render_queue.draw(frame)
 
         for shader in self.shaders:
+            if render_queue is not None and not shader._instances_and_VAOs:
+                continue
             with shader.rendering():
-                # Set view and perspective
-                glUniformMatrix4fv(
-                    shader.uniforms['view'][0],
-                    1,
-                    GL_FALSE,
-                    np.array(self.view.matrix))
-                glUniformMatrix4fv(
-                    shader.uniforms['projection'][0],
-                    1,
-                    GL_FALSE,
-                    np.array(self.projection))
-                glUniform1f(shader.uniforms['light_ambient_weight'][0], self.ambient_light)
-                glUniform3f(shader.uniforms['light_ambient_color'][0], *self.ambient_light_color)
-                glUniform3f(shader.uniforms['light_pos'][0], *(2., 2., 2.))
-                glUniform3f(shader.uniforms['light_color'][0], *(1, 1, 1))
-                glUniform1f(shader.uniforms['light_glare'][0], 32.)
-
-                # Draw models with shader
-                for mdl, vao in shader._models_and_VAOs:
+                gl_calls += 2  # in and out of use
+                # Shaders without the Frame block get plain uniforms.
+                for name, value in frame.items():
+                    if name in shader.uniforms:
+                        gl_calls += shader.set_uniform(name, value)
+
+                # Draw models with shader, unless they're queued
+                models = [] if render_queue is not None else \
+                    self.cull(shader._models_and_VAOs, planes)
+                for mdl, vao in models:
                     # Set the model's transform matrix uniform
                     vbo, mode = mdl.render_data
-                    glUniformMatrix4fv(
-                        shader.uniforms['model'][0],
-                        1,
-                        GL_FALSE,
-                        np.array(mdl.model_matrix))
+                    gl_calls += shader.set_uniform('model',
+                                                   self.render_matrix(mdl))
+                    gl_calls += vao.bind()  # nothing if it's shared
+                    if not vbo.copied:  # upload new data
+                        gl_calls += vao.upload(
+                            vbo, getattr(mdl, 'index_buffer', None))
+                    vao.draw(mode, len(vbo))
+                    gl_calls += 1
+
+                # Draw every copy of each instanced model in one call
+                for instances, vao in shader._instances_and_VAOs:
+                    vbo, mode = instances.render_data
+                    instances.compile_VBO()  # no-op unless updated
                     vao.bind()
-                    vbo.bind()
-                    glDrawArrays(mode, 0, len(vbo))
+                    if not instances.instance_buffer.copied:
+                        instances.instance_buffer.bind()
+                        gl_calls += 2
+                    vao.draw(mode, len(vbo), instances=len(instances))
+                    gl_calls += 2
+                    self.frame_stats['drawn'] += 1
                 self.flaggo = False
+        if render_queue is not None:
+            gl_calls += render_queue.draw(frame, transparent=True)
         # TODO Apply postprocessing filters
 
+        if self.profiler and self.profile_overlay:
+            gl_calls += self.draw_overlay()
+        self.frame_stats['gl_calls'] = gl_calls
+        if self.profiler:
+            self.profiler.mark('render')
+
         # Put it on the screen.
-        pygame.display.flip()
+        self.present()
+
+    def present(self):
+        '''
+        Shows the finished frame: pygame.display.flip, or the display's own
+        flip if it has one, like an OffscreenContext.
+        '''
+        flip = getattr(self.display, 'flip', None)
+        if flip is not None:
+            flip()
+        else:
+            pygame.display.flip()
+
+    def benchmark(self, display, frames=300, warmup=10):
+        '''
+        Renders frames as fast as possible, with one simulation step before
+        each, and returns the averages: {'frames', 'seconds', 'fps',
+        'drawn', 'culled', 'gl_calls'}. Sets up like begin, but there's no
+        clock and no event handling, so display can be an OffscreenContext.
+
+        :param warmup: Frames drawn first and left out, e.g. while the
+          driver compiles shaders.
+        '''
+        self.exit_flag = False
+        self.GLsetup(display)
+        self.create_buffers()
+        self.add_lighting()
+        self.add_cameras()
+        counts = ('drawn', 'culled', 'gl_calls')
+        totals = dict.fromkeys(counts, 0)
+        for frame in range(warmup + frames):
+            if frame == warmup:
+                start = time.perf_counter()
+                totals = dict.fromkeys(counts, 0)
+            self.advance(self.sim_dt)
+            self.render()
+            for name in counts:
+                totals[name] += self.frame_stats[name]
+        seconds = time.perf_counter() - start
+        result = {'frames': frames, 'seconds': seconds,
+                  'fps': frames / seconds}
+        result.update((name, total / frames)
+                      for name, total in totals.items())
+        return result
+
+    def draw_overlay(self, refresh=30):
+        '''
+        Draws the profiler's overlay_lines in the top left corner. The text
+        is only rendered again every refresh frames. Returns the number of
+        GL calls made.
+        '''
+        if self._overlay is None or self.profiler.frames % refresh == 0:
+            font = pygame.font.SysFont('monospace', 14)
+            lines = [font.render(line, True, (255, 255, 255), (0, 0, 0))
+                     for line in self.profiler.overlay_lines() or ['']]
+            surface = pygame.Surface((max(l.get_width() for l in lines),
+                                      sum(l.get_height() for l in lines)))
+            y = 0
+            for line in lines:
+                surface.blit(line, (0, y))
+                y += line.get_height()
+            self._overlay = (surface.get_width(), surface.get_height(),
+                             pygame.image.tostring(surface, 'RGBA', True))
+        width, height, pixels = self._overlay
+        glDisable(GL_DEPTH_TEST)
+        glWindowPos2i(0, self.display_size[1] - height)
+        glDrawPixels(width, height, GL_RGBA, GL_UNSIGNED_BYTE, pixels)
+        glEnable(GL_DEPTH_TEST)
+        return 4
+
+    def cull(self, models_and_VAOs, planes):
+        '''
+        Returns the (model, VAO) pairs whose bounding spheres touch the view
+        frustum, testing all of them at once. Models without local_bounds
+        are always drawn. Updates frame_stats.
+
+        :param planes: From Camera.frustum_planes, or None to draw all.
+        '''
+        if planes is None or not models_and_VAOs:
+            self.frame_stats['drawn'] += len(models_and_VAOs)
+            return models_and_VAOs
+        local = [getattr(mdl, 'local_bounds', None)
+                 for mdl, _ in models_and_VAOs]
+        unbounded = np.array([b is None for b in local])
+        centers = np.array([(0., 0., 0.) if b is None else b.center
+                            for b in local])
+        radii = np.array([0. if b is None else b.radius for b in local])
+        matrices = bounds.matrix_array(
+            self.render_matrix(mdl) for mdl, _ in models_and_VAOs)
+        centers, radii = bounds.world_spheres(matrices, centers, radii)
+        visible = bounds.spheres_in_frustum(planes, centers, radii)
+        visible |= unbounded
+
+        drawn = int(visible.sum())
+        self.frame_stats['drawn'] += drawn
+        self.frame_stats['culled'] += len(visible) - drawn
+        return [pair for pair, keep in zip(models_and_VAOs, visible)
+                if keep]
+
+    def view_matrix(self):
+        '''
+        The view camera's matrix to draw with. With the simulation on its
+        own thread that's the one published with the latest snapshot.
+        '''
+        if self.threaded and self._render_view is not None:
+            return self._render_view
+        return self.view.matrix
+
+    def frame_uniforms(self):
+        "The values for the Frame uniform block. Override to move the lights."
+        return {
+            'view': self.view_matrix(),
+            'projection': self.projection,
+            'light_pos': (2., 2., 2.),
+            'light_ambient_weight': self.ambient_light,
+            'light_ambient_color': self.ambient_light_color,
+            'light_glare': 32.,
+            'light_color': (1., 1., 1.),
+        }
 
     def handle_events(self):
         "Override for custom event handling."
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                self.exit_flag = True
                 pygame.quit()
                 quit()
             if event.type in self._event_handlers:
-                self._event_handlers[event.type](self, event)
+                if self.threaded:
+                    self._events.put(event)
+                else:
+                    self._event_handlers[event.type](self, event)
+
+    @property
+    def sim_dt(self):
+        "The length of one simulation step in seconds."
+        return 1. / self.sim_rate
+
+    def advance(self, elapsed):
+        '''
+        Runs the simulation steps that fit in elapsed seconds plus the time
+        left over from earlier frames, at most max_sim_steps of them, and
+        sets up interpolation for the time left over.
+        '''
+        dt = self.sim_dt
+        self._accumulator += elapsed
+        steps = int(self._accumulator / dt + 1e-9)
+        if steps > self.max_sim_steps:
+            steps = self.max_sim_steps
+            self._accumulator = steps * dt  # drop the rest of the backlog
+        for i in range(steps):
+            if i == steps - 1:
+                self._previous = self._model_matrices()
+            self.animate()
+        self._accumulator = max(self._accumulator - steps * dt, 0.)
+        self.frame_stats['sim_steps'] = steps
+        self.interpolate(self._accumulator / dt)
+
+    def _models(self):
+        return [mdl for shader in self.shaders
+                for mdl, _ in shader._models_and_VAOs]
+
+    def _model_matrices(self):
+        models = self._models()
+        return models, model_matrices(models)
+
+    def interpolate(self, alpha):
+        '''
+        Blends every model's matrix from before the last simulation step
+        towards its current one by alpha (0 to 1), in one vectorized pass.
+        Rendering uses the results, so motion stays smooth when the display
+        and simulation rates differ, at the cost of drawing up to one step
+        behind the simulation.
+        '''
+        self._render_matrices = {}
+        if self._previous is None:
+            return
+        models, previous = self._previous
+        current_models, current = self._model_matrices()
+        if models != current_models:
+            self._previous = None  # the scene changed; skip a frame
+            return
+        moved = (previous != current).any(axis=(1, 2))
+        if not moved.any():
+            return
+        blended = previous[moved] + (current[moved] - previous[moved]) * \
+            np.float32(alpha)
+        matrices = glm.array.from_bytes(blended.tobytes(), glm.mat4)
+        moved_models = [mdl for mdl, m in zip(models, moved) if m]
+        self._render_matrices = {id(mdl): matrix for mdl, matrix
+                                 in zip(moved_models, matrices)}
+
+    def render_matrix(self, model):
+        "The model matrix to draw model with this frame."
+        return self._render_matrices.get(id(model), model.model_matrix)
 
     def animate(self):
+        "Runs one simulation step."
+        # The profiler times the main thread only.
+        profiler = None if self.threaded else self.profiler
+        dt = self.sim_dt / TICK
         for ani in self.animators:
-            ani.step()
+            ani.step(dt)
+        if profiler:
+            profiler.mark('animators')
         for coll in self.collision_systems:
             coll.detect()
+        if profiler:
+            profiler.mark('collision')
 
     def cleanup(self):
         pass
@@ -147,6 +599,9 @@ class VBOGameLoop(GameLoop):
         for shader in self.shaders:
             for model, _ in shader._models_and_VAOs:
                 model.compile_VBO()
+            for instances, _ in shader._instances_and_VAOs:
+                instances.model.compile_VBO()
+                instances.compile_VBO()
 
     def add_lighting(self):
         pass
@@ -159,4 +614,6 @@ class VBOGameLoop(GameLoop):
 
     def __exit__(self, type, value, traceback):  # Destroy game assets. Override as needed.
         "Actions performed when the class exits."
+        if self.profiler and self.profile_path:
+            self.profiler.dump(self.profile_path)
         return False  # do not supress any errors.
@@ -0,0 +1,6 @@
+'''Time units shared by the game loops.'''
+
+# Seconds in a tick, the unit of time of the animators' constants: speeds
+# are per tick and accelerations per tick squared. The loops step them by
+# their step length in ticks, so the motion doesn't depend on sim_rate.
+TICK = 1. / 60
@@ -5,7 +5,8 @@ class Animator(ReprMixin):
     def __init__(self, *args, **kwargs):
         self.targets = []
 
-    def step(self):
+    def step(self, dt=1.):
+        "Advances by dt ticks of 1/60 s; speeds and forces are per tick."
         pass
 
     def apply_to(self, target):
@@ -4,15 +4,49 @@ import glm
 
 class GravityAnimator(PhysicsAnimator):
     def __init__(self, force, *args, **kwargs):
-        ':param force: amount of velocity to add per step.'
+        ':param force: amount of velocity to add per tick.'
         super().__init__(self, *args, **kwargs)
         self.translatestack = [glm.vec3(0., -1 * force, 0.), glm.vec3(0., 0., -.02)]
+        self.sweeps = {}
+        # Spin (axis * radians per tick) bends the path by the Magnus
+        # effect, magnus * spin x velocity per tick, like PhysicsWorld.
+        self.spin = glm.vec3(0.)
+        self.magnus = 1.
 
-    def step(self):
-        steps = len(self.translatestack) - 1
-        if steps > 0:
-            for i in range(steps):
-                self.translatestack[i + 1] = self.translatestack[i] + self.translatestack[i + 1]
+    def sweep_with(self, model, collision_system, area, sphere=False):
+        '''
+        Moves model with continuous collision detection against the boxes in
+        collision_system, bouncing off them at the moment of contact instead
+        of passing through thin ones when it's fast.
 
+        :param area: model's own CollisionBox in collision_system.
+        :param sphere: Treat area as the sphere that fits in it, e.g. a ball.
+        '''
+        self.sweeps[id(model)] = (collision_system, area, sphere)
+
+    def step(self, dt=1.):
+        '''
+        Moves the targets for dt ticks. Gravity moves them along the exact
+        parabola and the spin turns the momentum half before and half after
+        (leapfrog), so the path hardly depends on the step length.
+        '''
+        self._curve(dt / 2)
+        velocity = self.momentum
+        gravity = self.translatestack[0]
+        self.momentum = velocity + gravity * dt
         for model in self.targets:
-            model.move(*self.translatestack[-1])
+            if id(model) in self.sweeps:
+                system, area, sphere = self.sweeps[id(model)]
+                self.momentum = system.move(area, velocity * dt, sphere,
+                                            gravity * (dt * dt)) / dt
+            else:
+                model.move(*((velocity + gravity * (dt / 2)) * dt))
+        self._curve(dt / 2)
+
+    def _curve(self, dt):
+        '''
+        Bends the momentum by the Magnus effect for dt ticks: it turns
+        about the spin's axis by magnus * |spin| radians per tick.
+        '''
+        if self.spin != glm.vec3(0.):
+            self.momentum = glm.rotate(self.momentum, self.magnus * dt * glm.length(self.spin), glm.normalize(self.spin))
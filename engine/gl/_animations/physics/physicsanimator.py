@@ -9,19 +9,19 @@ class PhysicsAnimator(Animator):
         self.rotatestack = [glm.vec3(0., 0., 0.)]
         self.translatestack = [glm.vec3(0., 0., 0.)]
 
-    def step(self):
+    def step(self, dt=1.):
         steps = len(self.rotatestack) - 2
         if steps > 0:
             for i in range(steps):
-                self.rotatestack[i + 1] += self.rotatestack[i]
+                self.rotatestack[i + 1] += self.rotatestack[i] * dt
         steps = len(self.translatestack) - 2
         if steps > 0:
             for i in range(steps):
-                self.translatestack[i + 1] += self.translatestack[i]
+                self.translatestack[i + 1] += self.translatestack[i] * dt
 
         for model in self.targets:
-            model.rotate(self.rotatestack[-1])
-            model.move(self.translatestack[-1])
+            model.rotate(self.rotatestack[-1] * dt)
+            model.move(self.translatestack[-1] * dt)
 
     def get_momentum(self):
         return self.translatestack[-1]
@@ -0,0 +1,268 @@
+import glm
+import numpy as np
+from ...utils import bounds
+from ..Animator import Animator
+
+
+class PhysicsWorld(Animator):
+    '''
+    Rigid bodies stored in NumPy arrays and integrated together in one
+    vectorized step, instead of an animator per object moving its targets
+    one at a time.
+
+    Every body has a position, a velocity, an angular velocity (axis times
+    radians per unit of time) and a spin: the rotation it has turned
+    through so far, as a unit quaternion (w, x, y, z). The forces are
+    gravity, air drag and the Magnus effect of a spinning ball (see
+    PingPongBall.rot_vector); the angular velocity slowly decays.
+    Units are per tick (1/60 s) like the other animators; step is given
+    the step length in ticks.
+
+    Use it like any other animator: apply_to(model) adds a body that the
+    model's offset and rotate follow. Stepping doesn't touch the models; a
+    model takes its body's matrices when next used, and model_matrices
+    reads the whole (n, 4, 4) array for the renderer without touching them.
+    '''
+    def __init__(self, gravity=(0., -.003, 0.), drag=0., magnus=0.,
+                 spin_decay=0., capacity=64):
+        '''
+        :param gravity: Acceleration of every body.
+        :param drag: Quadratic air drag: a = -drag * |v| * v.
+        :param magnus: Lift from spin: a = magnus * (angular velocity x v).
+        :param spin_decay: Fraction of the spin lost per unit of time.
+        :param capacity: Number of bodies to allocate room for up front.
+        '''
+        if capacity < 0:
+            raise ValueError(f"capacity must not be negative, got {capacity}")
+        super().__init__()
+        self.gravity = np.array(gravity, np.float64)
+        self.drag = drag
+        self.magnus = magnus
+        self.spin_decay = spin_decay
+        self.count = 0
+        self.models = []
+        self.steps = 0  # count
+        self._current = None  # matrices() as of the last step, when read
+        self._drawn = None  # and times the models' scales
+        self._scales = {}  # body: scale matrix, of models not at scale 1
+        # Stored a component per row, e.g. _position[0] holds every x, so
+        # the per step math runs on contiguous arrays.
+        self._position = np.zeros((3, capacity))
+        self._velocity = np.zeros((3, capacity))
+        self._angular_velocity = np.zeros((3, capacity))
+        self._spin = np.zeros((4, capacity))
+        self._spin[0] = 1.
+
+    # (n, 3) and (n, 4) views of the live bodies; edit them in place to
+    # push bodies around.
+    position = property(lambda self: self._position[:, :self.count].T)
+    velocity = property(lambda self: self._velocity[:, :self.count].T)
+    angular_velocity = property(
+        lambda self: self._angular_velocity[:, :self.count].T)
+    spin = property(lambda self: self._spin[:, :self.count].T)
+
+    def __len__(self):
+        return self.count
+
+    def add(self, position=(0., 0., 0.), velocity=(0., 0., 0.),
+            angular_velocity=(0., 0., 0.), model=None):
+        '''
+        Adds a body and returns its index.
+
+        :param model: Optional Transformable that follows the body. If
+          given, the body starts at the model's offset.
+        '''
+        if self.count == self._position.shape[1]:
+            self._grow(max(1, 2 * self.count))
+        i = self.count
+        if model is not None:
+            position = model.offset[3].xyz
+        self._position[:, i] = position
+        self._velocity[:, i] = velocity
+        self._angular_velocity[:, i] = angular_velocity
+        self._spin[:, i] = (1., 0., 0., 0.)
+        self.models.append(model)
+        self.count += 1
+        self._current = self._drawn = None
+        if model is not None:
+            self.set_scale(i, model.scale)
+            model._follow(self, i)
+        return i
+
+    def apply_to(self, target):
+        "Adds a body for target, so it fits in with the other animators."
+        self.targets.append(target)
+        return self.add(model=target)
+
+    def _grow(self, capacity):
+        for name in ('_position', '_velocity', '_angular_velocity',
+                     '_spin'):
+            old = getattr(self, name)
+            new = np.empty((len(old), capacity))
+            new[:, :old.shape[1]] = old
+            setattr(self, name, new)
+
+    def acceleration(self):
+        "The (3, n) acceleration of every body from gravity, drag and spin."
+        n = self.count
+        v = self._velocity[:, :n]
+        a = np.empty((3, n))
+        a[:] = self.gravity[:, None]
+        if self.drag:
+            speed = np.sqrt(np.einsum('ij,ij->j', v, v))
+            speed *= self.drag
+            a -= speed * v
+        if self.magnus:
+            w = self._angular_velocity[:, :n]
+            lift = _cross(w, v)
+            lift *= self.magnus
+            a += lift
+        return a
+
+    def step(self, dt=1.):
+        '''
+        Advances every body by dt with semi-implicit Euler: velocities are
+        updated first and the new velocities move the bodies. Then the
+        models are marked out of date; see write_back.
+        '''
+        n = self.count
+        if not n:
+            return
+        a = self.acceleration()
+        a *= dt
+        velocity = self._velocity[:, :n]
+        velocity += a
+        a[:] = velocity
+        a *= dt
+        self._position[:, :n] += a
+        w = self._angular_velocity[:, :n]
+        if self.spin_decay:
+            w *= (1. - self.spin_decay) ** dt
+        self._spin[:, :n] = _turn(self._spin[:, :n], w * dt)
+        self.write_back()
+
+    def matrices(self):
+        '''
+        The model matrix (translation * rotation) of every body as an
+        (n, 4, 4) float32 array indexed like glm, e.g. for
+        Instances.update.
+        '''
+        out = np.zeros((self.count, 4, 4), np.float32)
+        out[:, :3, :3] = rotation_matrices(self.spin).transpose(0, 2, 1)
+        out[:, 3, :3] = self.position
+        out[:, 3, 3] = 1.
+        return out
+
+    def write_back(self):
+        '''
+        Marks every body's model out of date. Each model takes its offset
+        and rotate from current_matrices when next used, so a step costs
+        nothing per model.
+        '''
+        self.steps += 1
+        self._current = self._drawn = None
+
+    def current_matrices(self):
+        '''
+        matrices() as of the last step, computed once and shared by every
+        reader until the next one. Don't modify it.
+        '''
+        if self._current is None:
+            self._current = self.matrices()
+        return self._current
+
+    def set_scale(self, i, scale):
+        "Sets the scale matrix of body i's model; its setter calls this."
+        if scale == glm.mat4():
+            self._scales.pop(i, None)
+        else:
+            self._scales[i] = scale
+        self._drawn = None
+
+    def model_matrices(self):
+        '''
+        current_matrices() times the scale of every body's model, i.e. their
+        model_matrix, computed once per step. Don't modify it.
+        '''
+        if self._drawn is None:
+            self._drawn = self.current_matrices()
+            if self._scales:
+                bodies = list(self._scales)
+                scales = bounds.matrix_array(self._scales.values())
+                self._drawn = self._drawn.copy()
+                # Indexed like glm, i.e. transposed, so M * S is S @ M.
+                self._drawn[bodies] = scales @ self._drawn[bodies]
+        return self._drawn
+
+    def body_matrices(self, i):
+        "The offset and rotate matrices of body i as of the last step."
+        matrix = self.current_matrices()[i]
+        offset = glm.translate(glm.vec3(*matrix[3, :3].tolist()))
+        rotate = matrix.copy()
+        rotate[3, :3] = 0.
+        rotate = glm.mat4.from_bytes(rotate.tobytes())
+        return offset, rotate
+
+
+def model_matrices(models):
+    '''
+    The model_matrix of every model as an (n, 4, 4) array, like
+    bounds.matrix_array. Models following a PhysicsWorld body that stepped
+    since they last read it get their rows from the world's matrices in
+    bulk, and are left to catch up when next used.
+    '''
+    bodies = [getattr(model, '_body', None) for model in models]
+    # The body of every stale model, or -1.
+    index = np.fromiter((-1 if body is None or model._body_step ==
+                         body[0].steps else body[1]
+                         for model, body in zip(models, bodies)),
+                        np.intp, len(models))
+    stale = index >= 0
+    if not stale.any():
+        return bounds.matrix_array(model.model_matrix for model in models)
+    out = np.empty((len(models), 4, 4), np.float32)
+    worlds = {body[0] for body in bodies if body is not None}
+    for world in worlds:
+        rows = stale
+        if len(worlds) > 1:
+            rows = stale & np.fromiter((body is not None and body[0] is world
+                                        for body in bodies), bool, len(models))
+        out[rows] = world.model_matrices()[index[rows]]
+    rows = np.flatnonzero(~stale)
+    if len(rows):
+        out[rows] = bounds.matrix_array(models[row].model_matrix
+                                        for row in rows)
+    return out
+
+
+def _cross(a, b):
+    "Cross products of (3, n) arrays of vectors."
+    return np.stack((a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2],
+                     a[0] * b[1] - a[1] * b[0]))
+
+
+def _turn(spin, rotations):
+    '''
+    Turns (4, n) unit quaternions by small (3, n) rotation vectors (axis *
+    angle in radians): q += (rotation / 2) * q, then renormalizes. This is
+    the usual first order update; it avoids a sin and cos per body and is
+    accurate while the turn per step is small.
+    '''
+    dx, dy, dz = rotations * .5
+    w, x, y, z = spin
+    turned = np.stack((w - dx * x - dy * y - dz * z,
+                       x + dx * w + dy * z - dz * y,
+                       y - dx * z + dy * w + dz * x,
+                       z + dx * y - dy * x + dz * w))
+    turned /= np.sqrt(np.einsum('ij,ij->j', turned, turned))
+    return turned
+
+
+def rotation_matrices(spin):
+    "(n, 3, 3) rotation matrices, [row][column], from (n, 4) quaternions."
+    w, x, y, z = np.asarray(spin, np.float64).T
+    return np.stack((
+        1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y),
+        2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x),
+        2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y),
+        ), axis=1).reshape(-1, 3, 3)
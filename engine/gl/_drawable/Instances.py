@@ -0,0 +1,109 @@
+import glm
+import numpy as np
+from OpenGL.arrays.vbo import VBO
+from ..utils import ReprMixin
+
+WHITE = (1., 1., 1.)
+
+
+class Instances(ReprMixin):
+    '''
+    Many copies of one model drawn with a single instanced draw call. Each
+    copy has its own model matrix and a color that tints the model's
+    vertex colors. Add it to a Pipeline with add_instances; the pipeline's
+    vertex shader needs instance_model and instance_color inputs, like
+    litvert_instanced.
+    '''
+    def __init__(self, model, matrices, colors=None):
+        '''
+        :param model: The Mesh or Shape3D to draw copies of.
+        :param matrices: A model matrix for each copy, as a list of glm.mat4
+          or an (n, 4, 4) array indexed like glm, i.e. [copy][column][row].
+        :param colors: Optional (n, 3) color for each copy. Defaults to
+          white, which leaves the model's colors unchanged.
+        '''
+        self.model = model
+        self.matrices = np.empty((0, 4, 4), 'f')
+        self.colors = np.empty((0, 3), 'f')
+        self._VBO = None
+        self._VBO_is_compiled = False
+        self.update(matrices, colors)
+
+    def update(self, matrices=None, colors=None):
+        '''
+        Replaces the matrices and/or colors. The instance buffer is
+        rewritten in place the next time it's compiled, so it can be called
+        every frame. If only the matrices change in number, the colors are
+        reset to white.
+        '''
+        if matrices is not None:
+            self.matrices = _matrix_array(matrices)
+            if colors is None and len(self.colors) != len(self.matrices):
+                colors = WHITE
+        if colors is not None:
+            values = np.empty((len(self.matrices), 3), 'f')
+            values[:] = colors
+            self.colors = values
+        self._VBO_is_compiled = False
+
+    def __len__(self):
+        "The number of instances."
+        return len(self.matrices)
+
+    def instance_data(self, out=None):
+        '''
+        Returns one (n, 19) float32 array with a row per instance: the model
+        matrix in OpenGL's column major order followed by the color.
+
+        :param out: Optional array of that shape to write into.
+        '''
+        if out is None:
+            out = np.empty((len(self), 19), 'f')
+        out[:, :16] = self.matrices.reshape(-1, 16)
+        out[:, 16:] = self.colors
+        return out
+
+    def compile_VBO(self, force=False):
+        '''
+        Compiles the instance data into a VBO. The same buffer is reused
+        when recompiling, so VAOs it was attached to stay valid.
+        '''
+        if self._VBO_is_compiled and not force:
+            return
+        previous = self._VBO.data if self._VBO is not None else None
+        if previous is not None and previous.shape == (len(self), 19):
+            data = self.instance_data(previous)
+        else:
+            data = self.instance_data()
+        if self._VBO is None:
+            self._VBO = VBO(data, usage='GL_DYNAMIC_DRAW')
+        else:
+            self._VBO.set_array(data)  # upload again on the next bind
+        self._VBO_is_compiled = True
+
+    @property
+    def instance_buffer(self):
+        "The VBO with the per-instance data."
+        if not self._VBO_is_compiled:
+            self.compile_VBO()
+        return self._VBO
+
+    @property
+    def render_data(self):
+        "The model's VBO and drawing mode."
+        return self.model.render_data
+
+    @property
+    def index_buffer(self):
+        "The model's element buffer, if it has one."
+        return getattr(self.model, 'index_buffer', None)
+
+
+def _matrix_array(matrices):
+    "An (n, 4, 4) float32 array in glm's column major memory layout."
+    if len(matrices) and isinstance(matrices[0], glm.mat4):
+        # np.array(glm.mat4) transposes in some PyGLM versions; the raw
+        # bytes are always column major.
+        data = glm.array(list(matrices)).to_bytes()
+        return np.frombuffer(data, 'f').reshape(-1, 4, 4).copy()
+    return np.array(matrices, 'f').reshape(-1, 4, 4)
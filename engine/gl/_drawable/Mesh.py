@@ -0,0 +1,252 @@
+import glm
+import numpy as np
+from OpenGL.GL import GL_TRIANGLES
+from .Transformable import Transformable
+from .VertexBuffers import VertexBuffers
+from ..utils import indexing, normals, bounds
+
+DEFAULT_COLOR = (.9, .8, .7)  # matches Point3D
+
+
+class Mesh(VertexBuffers, Transformable):
+    '''
+    A 3d shape stored as contiguous arrays instead of Point3D objects.
+    Drop-in replacement for Shape3D anywhere only model_matrix, move and
+    render_data are used, e.g. Pipeline.add_model.
+    '''
+    def __init__(self,
+                 positions,
+                 normals=None,
+                 colors=None,
+                 texcoords=None,
+                 indices=None,
+                 color=None,
+                 mode=GL_TRIANGLES,
+                 offset=None,
+                 rotate=None,
+                 scale=None,
+                 dynamic=False):
+        '''
+        :param positions: (n, 3) vertex positions.
+        :param normals: Optional (n, 3) vertex normals.
+        :param colors: Optional (n, 3) vertex colors.
+        :param texcoords: Optional (n, 2) texture coordinates.
+        :param indices: Optional flat list of vertex indices to draw through
+          an element buffer. If None, the vertices are drawn in order.
+        :param color: Color for every vertex if colors isn't given.
+          Defaults to the same color as Point3D.
+        :param mode: GL drawing mode constant, normally GL_TRIANGLES.
+        :param dynamic: Compile the vertices into a StreamBuffer, for
+          vertices that change every frame; see update_positions.
+        '''
+        super().__init__(offset, rotate, scale)
+        self.positions = np.ascontiguousarray(positions, 'f').reshape(-1, 3)
+        count = len(self.positions)
+        self.normals = self._attribute(normals, count, 3)
+        self.texcoords = self._attribute(texcoords, count, 2)
+        if colors is None:
+            colors = np.empty((count, 3), 'f')
+            colors[:] = DEFAULT_COLOR if color is None else color
+        self.colors = self._attribute(colors, count, 3)
+        if indices is not None:
+            indices = np.ascontiguousarray(indices, np.uint32).reshape(-1)
+        self.indices = indices
+        self.mode = mode
+        self.dynamic = dynamic
+        self._VAO = None
+        self._VBO = None
+        self._IBO = None
+        self._VBO_is_compiled = False
+
+    @staticmethod
+    def _attribute(values, count, width):
+        if values is None:
+            return None
+        values = np.ascontiguousarray(values, 'f')
+        if values.ndim == 1:
+            values = values.reshape(-1, width)
+        if len(values) != count:
+            raise ValueError(f"Mesh attribute has {len(values)} rows but\
+                there are {count} vertices.")
+        return values
+
+    @classmethod
+    def from_shape(cls, shape):
+        '''
+        Converts a Shape3D to a Mesh. Point3D objects shared between faces
+        become a single indexed vertex.
+        '''
+        arr_format, columns, index = shape.vertex_arrays()
+        attributes = dict(zip(arr_format, columns))
+        mesh = cls(attributes['v'],
+                   normals=attributes.get('n'),
+                   colors=attributes.get('c'),
+                   texcoords=attributes.get('t'),
+                   indices=index,
+                   mode=shape.mode)
+        mesh.offset = glm.mat4(shape.offset)
+        mesh.rotate = glm.mat4(shape.rotate)
+        mesh.scale = glm.mat4(shape.scale)
+        return mesh
+
+    def __len__(self):
+        "The number of vertices drawn."
+        if self.indices is not None:
+            return len(self.indices)
+        return len(self.positions)
+
+    @property
+    def VBO_format(self):
+        "The format string of compile_VBO's output, i.e. 'vnc'."
+        fmt = 'v'
+        if self.texcoords is not None:
+            fmt += 't'
+        if self.normals is not None:
+            fmt += 'n'
+        if self.colors is not None:
+            fmt += 'c'
+        return fmt
+
+    def interleave(self, out=None):
+        '''
+        Returns one (n, k) float32 array with a row per unique vertex, with
+        the attributes ordered as in VBO_format.
+
+        :param out: Optional array of that shape to write into.
+        '''
+        columns = [self.positions, self.texcoords, self.normals, self.colors]
+        columns = [c for c in columns if c is not None]
+        return np.concatenate(columns, axis=1, out=out)
+
+    def compile_VBO(self, force=False, out=None):
+        '''
+        Compiles the vertex arrays into a VBO and, if the mesh is indexed,
+        the indices into an element buffer, and saves the refs.
+
+        Recompiling with force=True writes into the existing vertex array
+        when it still has the right size instead of allocating a new one.
+
+        :param out: Optional float32 array to write the vertex data into.
+        '''
+        if self._VBO_is_compiled and not force and out is None:
+            return
+        if self.indices is not None:
+            indices = self.indices.astype(
+                indexing.index_dtype(len(self.positions)))
+            self._compile_indexed(self.interleave(out), indices)
+        else:
+            self._compile_arrays(out)
+        self._VBO_format = self.VBO_format
+        self._VBO_is_compiled = True
+        self.local_bounds = bounds.local_bounds(self.positions)
+
+    def _compile_arrays(self, out):
+        "compile_VBO for meshes drawn without an element buffer."
+        previous = self._VBO.data if self._VBO_is_compiled else None
+        width = sum(c.shape[1] for c in (self.positions, self.texcoords,
+                                         self.normals, self.colors)
+                    if c is not None)
+        if out is None and previous is not None and \
+                previous.shape == (len(self.positions), width):
+            out = previous
+        self._compile_vertices(self.interleave(out), previous)
+        self._IBO = None
+
+    @property
+    def render_data(self):
+        if not self._VBO_is_compiled:
+            self.compile_VBO()
+        return (self._VBO, self.mode)
+
+    @property
+    def index_buffer(self):
+        "The element buffer for indexed meshes, otherwise None."
+        if not self._VBO_is_compiled:
+            self.compile_VBO()
+        return self._IBO
+
+    def update_positions(self, positions, first=0):
+        '''
+        Moves the vertices from first on, e.g. to deform the mesh. A
+        compiled dynamic mesh writes just those rows into its StreamBuffer
+        and grows its bounds to fit them; any other compiled mesh is
+        compiled again into its existing vertex array.
+        '''
+        positions = np.asarray(positions, 'f').reshape(-1, 3)
+        end = first + len(positions)
+        self.positions[first:end] = positions
+        if self.dynamic and self._VBO_is_compiled:
+            self._VBO.data[first:end, :3] = positions
+            self._VBO.dirty(first, len(positions))
+            self.local_bounds = bounds.include(self.local_bounds, positions)
+        elif self._VBO_is_compiled:
+            self.compile_VBO(force=True)
+
+    def deduplicate(self):
+        "Merges identical vertices and draws them through an index buffer."
+        data, indices = indexing.deduplicate(self.interleave())
+        if self.indices is not None:
+            indices = indices[self.indices]
+        self._set_interleaved(data)
+        self.indices = indices.astype(np.uint32)
+        self._release_VBO()
+
+    def gen_normals(self, mode=normals.SMOOTH, angle=60.):
+        '''
+        Generates vertex normals, replacing any existing ones. See
+        Shape3D.gen_normals for the modes; 'flat' and 'angle' split vertices
+        that need more than one normal and leave the mesh indexed.
+        '''
+        if self.mode != GL_TRIANGLES:
+            raise ValueError("Mesh.gen_normals only supports GL_TRIANGLES.")
+        if self.indices is not None:
+            triangles = self.indices.reshape(-1, 3)
+        else:
+            triangles = np.arange(len(self.positions)).reshape(-1, 3)
+
+        if mode == normals.SMOOTH:
+            self.normals = normals.vertex_normals(
+                self.positions, triangles).astype('f')
+        else:
+            per_corner = normals.corner_normals(
+                self.positions, triangles, mode, angle)
+            corners = triangles.reshape(-1)
+            for name in ('positions', 'texcoords', 'colors'):
+                values = getattr(self, name)
+                if values is not None:
+                    setattr(self, name, values[corners])
+            self.normals = per_corner.astype('f')
+            self.indices = None
+            self.deduplicate()
+        self._release_VBO()
+
+    def optimize_vertex_cache(self, cache_size=16):
+        '''
+        Reorders the triangles for the GPU's post-transform vertex cache.
+        Deduplicates the vertices first if the mesh isn't indexed.
+        '''
+        if self.indices is None:
+            self.deduplicate()
+        self.indices = indexing.optimize_vertex_cache(
+            self.indices, len(self.positions), cache_size)
+        self._release_VBO()
+
+    def _set_interleaved(self, data):
+        "Splits an array from interleave() back into the attributes."
+        start = 0
+        for name, width in (('positions', 3), ('texcoords', None),
+                            ('normals', 3), ('colors', 3)):
+            current = getattr(self, name)
+            if current is None:
+                continue
+            width = width or current.shape[1]
+            setattr(self, name,
+                    np.ascontiguousarray(data[:, start:start + width]))
+            start += width
+
+    @property
+    def nbytes(self):
+        "Memory used by the vertex arrays."
+        arrays = [self.positions, self.normals, self.colors,
+                  self.texcoords, self.indices]
+        return sum(a.nbytes for a in arrays if a is not None)
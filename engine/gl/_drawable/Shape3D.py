@@ -1,6 +1,7 @@
 import pygame
 import numpy as np
 import glm
+from itertools import chain
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GL import shaders
@@ -9,10 +10,12 @@ from .Point3D import Point3D
 from .Rect2D import Rect2D
 from .Shape2D import Shape2D
 from .. import shader_presets
-from ..utils import ReprMixin
+from ..utils import indexing, normals, bounds
+from .Transformable import Transformable
+from .VertexBuffers import VertexBuffers
 
 
-class Shape3D(ReprMixin):
+class Shape3D(VertexBuffers, Transformable):
     "A 3d shape made from a collection of 2d faces."
     def __init__(self,
                  shapes_list,
@@ -20,7 +23,10 @@ class Shape3D(ReprMixin):
                  mode=GL_TRIANGLES,
                  offset=None,
                  rotate=None,
-                 scale=None):
+                 scale=None,
+                 indexed=False,
+                 optimize_vertex_cache=False,
+                 dynamic=False):
         '''
         Builds a 3D shape from the given shape list with the given arguments.
 
@@ -28,6 +34,13 @@ class Shape3D(ReprMixin):
         :param color: Applies a color to any vertex with no color data.
         :param mode: GL drawing mode constant, normally GL_TRIANGLES.
         :param offset: (x, y, z) offset in 3D space.
+        :param indexed: Compile identical vertices once and draw them through
+          an element buffer.
+        :param optimize_vertex_cache: When indexed, also reorder the
+          triangles for the GPU's vertex cache. Slower to compile.
+        :param dynamic: Compile into a StreamBuffer, for shapes whose points
+          move every frame. compile_VBO(force=True) then writes straight
+          into it.
         '''
         self.shapes = shapes_list
         if color is not None:
@@ -35,15 +48,37 @@ class Shape3D(ReprMixin):
                 for p in s.points:
                     if p.color is None:
                         p.color = color
-        self.offset = offset if offset else glm.mat4()
-        self.rotate = rotate if rotate else glm.mat4()
-        self.scale = scale if scale else glm.mat4()
-        self._matrix = None
+        super().__init__(offset, rotate, scale)
         self.mode = mode
+        self.indexed = indexed
+        self.optimize_vertex_cache = optimize_vertex_cache
+        self.dynamic = dynamic
         self._VAO = None
+        self._VBO = None
+        self._IBO = None
         self._VBO_is_compiled = False
         # self._VBO_contexts = []
 
+    @classmethod
+    def from_VBO(cls, vbo_array, arr_format, mode=GL_TRIANGLES, indices=None):
+        '''
+        Alternate constructor for a shape that is already compiled, such as
+        one loaded from a mesh cache. The shape has no faces, so methods that
+        edit the points (gen_normals, center_and_normalize) do nothing.
+
+        :param vbo_array: A 2d float32 array with one row per vertex.
+        :param arr_format: The format string returned by compile_VBO.
+        :param indices: Optional element indices into vbo_array.
+        '''
+        self = cls([], mode=mode, indexed=indices is not None)
+        self._VBO = VBO(vbo_array)
+        if indices is not None:
+            self._IBO = VBO(indices, target=GL_ELEMENT_ARRAY_BUFFER)
+        self._VBO_format = arr_format
+        self._VBO_is_compiled = True
+        self.local_bounds = bounds.local_bounds(vbo_array[:, :3])
+        return self
+
     def GLDraw(self):
         "Draws the shape. Old-style drawing mechanism. Deprecated."
         for s in self.shapes:
@@ -54,41 +89,95 @@ class Shape3D(ReprMixin):
         for s in self.shapes:
             s.GLDraw_outline()
 
-    def compile_VBO(self, force=False):
-        "Compiles the verticies of all faces into a VBO and saves the ref."
-        if self._VBO_is_compiled and not force:
-            return
-        vbos = []
-        try:
-            self._VBO_format = self.shapes[0].compile_VBO(force=True)
-        except IndexError:
+    def _topology(self):
+        '''
+        Returns the distinct Point3D objects of all faces and, for each
+        point of each face in order, its index in that list.
+        '''
+        corners = [p for s in self.shapes for p in s.points]
+        points = list(dict.fromkeys(corners))  # Point3D hashes by identity
+        lookup = {p: i for i, p in enumerate(points)}
+        index = np.fromiter(map(lookup.__getitem__, corners), np.intp,
+                            len(corners))
+        return points, index
+
+    def vertex_arrays(self):
+        '''
+        Gathers the data of every point into arrays in one pass.
+
+        Returns (arr_format, columns, corners): arr_format is the format
+        string described in Point3D.compile_VBO, columns is a list of float32
+        arrays in that order with one row per distinct Point3D, and corners
+        indexes into those rows for each point of each face, in draw order.
+        '''
+        if not self.shapes:
             raise ValueError("Shape3D tried to compile to VBO, but it didn't\
                               have any shapes.")
-        for s in self.shapes:
-            fmt = s.compile_VBO()
-            if fmt != self._VBO_format and fmt is not None:
+        points, index = self._topology()
+
+        arr_format = 'v'
+        columns = [_stack([p.vertex for p in points])]
+        for key, attr in (('t', 'texcoords'), ('n', 'normal'),
+                          ('c', 'color')):
+            values = [getattr(p, attr) for p in points]
+            missing = sum(v is None for v in values)
+            if missing == len(values):
+                continue
+            if missing:
                 # TODO figure out a good way of filling in the blanks?
-                raise ValueError("While compiling a Shape3D to VBO, a Shape2D\
-                    format mismatched with the format for the other shapes.")
-            vbos.append(s._VBO)
+                raise ValueError("While compiling a Shape3D to VBO, some\
+                    points had " + attr + " data and others didn't.")
+            arr_format += key
+            columns.append(_stack(values))
+        return arr_format, columns, index
 
-        self._VBO = VBO(np.concatenate(vbos))
-        self._VBO_is_compiled = True
-
-    @property
-    def model_matrix(self):
+    def compile_VBO(self, force=False, out=None):
         '''
-        The transform matrix is a way to transform of an object
-        at draw time without overwriting all of its members.
+        Compiles the verticies of all faces into a VBO and saves the ref.
+
+        Recompiling with force=True writes into the existing vertex array
+        when it still has the right size instead of allocating a new one.
 
-        This is calculated lazily only if ._matrix doesn't exist, create it.
-        Modifying the offset, rotate, or scale will reset the value of _matrix
-        to None and cause it to recalculate the next time it's used. This
-        avoids repetitive calculations for objects that don't move.
+        :param out: Optional float32 array of shape (vertices, floats per
+          vertex) to write the vertex data into. Indexed shapes raise a
+          ValueError if given one, as their vertex count is only known
+          once the points have been deduplicated.
         '''
-        if self._matrix is None:
-            self._matrix = self.offset * self.rotate * self.scale
-        return self._matrix
+        if out is not None and self.indexed:
+            raise ValueError("out can't be used to compile an indexed\
+                Shape3D.")
+        if self._VBO_is_compiled and not force and out is None:
+            return
+        arr_format, columns, index = self.vertex_arrays()
+
+        if self.indexed:
+            data, unique = indexing.deduplicate(np.concatenate(columns, 1))
+            indices = unique[index].astype(unique.dtype)
+            if self.optimize_vertex_cache:
+                indices = indexing.optimize_vertex_cache(indices, len(data))
+            self._compile_indexed(data, indices)
+        else:
+            self._IBO = None
+            shape = (len(index), sum(c.shape[1] for c in columns))
+            previous = self._VBO.data if self._VBO_is_compiled else None
+            if out is not None:
+                if out.shape != shape or out.dtype != np.float32:
+                    raise ValueError(f"out should be a float32 array with\
+                        shape {shape}.")
+            elif previous is not None and previous.shape == shape and \
+                    previous.dtype == np.float32 and previous.flags.writeable:
+                out = previous
+            else:
+                out = np.empty(shape, 'f')
+            start = 0
+            for column in columns:
+                end = start + column.shape[1]
+                np.take(column, index, axis=0, out=out[:, start:end])
+                start = end
+            self._compile_vertices(out, previous)
+        self._VBO_format = arr_format
+        self._VBO_is_compiled = True
+        self.local_bounds = bounds.local_bounds(columns[0])
 
     @property
     def render_data(self):
@@ -96,71 +185,79 @@ class Shape3D(ReprMixin):
             self.compile_VBO()
         return (self._VBO, self.mode)
 
-    def move(self, x, y, z):
-        "Moves the shape around the world."
-        self.offset[3][0] = self.offset[3][0] + x
-        self.offset[3][1] = self.offset[3][1] + y
-        self.offset[3][2] = self.offset[3][2] + z
-        self._matrix = None
-
-    def move_relative_to_camera(self, right, up, back):
-        "Moves the shape relative to the camera position."
-        # TODO
-        pass
-
-    # The below three properties are used to in the transform matrix.
-    # Resetting the matrix to None enables a lazy calculation.
-    def get_offset(self):
-        return self._offset
-
-    def set_offset(self, val):
-        self._matrix = None
-        self._offset = val
-
-    def get_rotate(self):
-        return self._rotate
-
-    def set_rotate(self, val):
-        self._matrix = None
-        self._rotate = val
-
-    def get_scale(self):
-        return self._scale
-
-    def set_scale(self, val):
-        self._matrix = None
-        self._scale = val
-
-    offset = property(get_offset, set_offset)
-    rotate = property(get_rotate, set_rotate)
-    scale = property(get_scale, set_scale)
-
-    def gen_normals(self):
-        """Generates a normal vector for each of the attached
-        points if one hasn't been generated already."""
-        pointd = {}
-        for shape in self.shapes:
-            count = 0
-            verts = []
-            for point in shape.points:
-                if count < 3:
-                    verts.append(point.vertex)
-                    count += 1
-            shape.normal = glm.normalize(
-                glm.cross(
-                    verts[1] - verts[0],
-                    verts[2] - verts[0]
-                    ))
-            for point in shape.points:
-                if point not in pointd:
-                    pointd[point] = [shape.normal]
-                else:
-                    pointd[point].append(shape.normal)
-            if count < 3:
-                raise ValueError("Unable to calculate normal for shape with < 3 verticies. (It's not a viable surface)")
-        for point, norms in pointd.items():
-            if point.normal is None:
-                point.normal = sum(verts) / len(verts)
+    @property
+    def index_buffer(self):
+        "The element buffer for indexed shapes, otherwise None."
+        if not self._VBO_is_compiled:
+            self.compile_VBO()
+        return self._IBO
+
+    def gen_normals(self, mode=normals.SMOOTH, angle=60.):
+        '''
+        Generates a normal vector for each face and each of the attached
+        points.
+
+        :param mode: 'smooth' gives each point the area weighted average of
+          the normals of the faces around it, and keeps the normal of points
+          that already have one. 'flat' gives the points of each face that
+          face's normal. 'angle' is smooth across edges where the faces are
+          within angle degrees of each other and flat across sharper ones.
+          'flat' and 'angle' replace existing normals, and copy points that
+          are shared by faces which need different normals.
+        :param angle: The crease angle in degrees for 'angle' mode.
+        '''
+        sizes = [len(shape.points) for shape in self.shapes]
+        if not sizes or min(sizes) < 3:
+            raise ValueError("Unable to calculate normal for shape with < 3 verticies. (It's not a viable surface)")
+        points, index = self._topology()
+        positions = _stack([p.vertex for p in points])
+        corners, faces = indexing.triangulate(
+            sizes, [shape.mode for shape in self.shapes])
+        triangles = index[corners].reshape(-1, 3)
+
+        weighted = normals.face_normals(positions, triangles)
+        face_normals = normals.normalize(np.stack(
+            [np.bincount(faces, weighted[:, i], len(sizes))
+             for i in range(3)], axis=1))
+        for shape, normal in zip(self.shapes, face_normals.tolist()):
+            shape.normal = glm.vec3(normal)
+
+        if mode == normals.SMOOTH:
+            smooth = normals.vertex_normals(positions, triangles)
+            for point, normal in zip(points, smooth.tolist()):
+                if point.normal is None:
+                    point.normal = glm.vec3(normal)
+            return
+
+        if mode == normals.FLAT:
+            per_corner = np.repeat(face_normals, sizes, axis=0)
+        else:
+            per_corner = np.zeros((len(index), 3))
+            per_corner[corners] = normals.corner_normals(
+                positions, triangles, mode, angle)
+
+        # Each distinct (point, normal) pair becomes one Point3D; the first
+        # pair seen for a point keeps the original object.
+        keys = np.concatenate((index[:, None], np.round(per_corner, 6)), 1)
+        _, firsts, groups = np.unique(keys, axis=0, return_index=True,
+                                      return_inverse=True)
+        split = [None] * len(firsts)
+        used = set()
+        for group in np.argsort(firsts).tolist():
+            corner = firsts[group]
+            point = points[index[corner]]
+            if point in used:
+                point = Point3D(*point.vertex,
+                                texcoords=point.texcoords,
+                                color=point.color)
+            used.add(point)
+            point.normal = glm.vec3(per_corner[corner].tolist())
+            split[group] = point
+        groups = groups.reshape(-1).tolist()
+        start = 0
+        for shape, size in zip(self.shapes, sizes):
+            shape.points = [split[g] for g in groups[start:start + size]]
+            start += size
 
     def center_and_normalize(self, scale=1.0):
         '''
@@ -195,6 +292,15 @@ class Shape3D(ReprMixin):
                 point.vertex = point.vertex * scale
 
 
+def _stack(values):
+    "Stacks a list of glm vectors or sequences into an (n, k) float32 array."
+    if all(type(v) is glm.vec3 for v in values):
+        return np.asarray(glm.array(values))
+    width = len(tuple(values[0]))
+    return np.fromiter(chain.from_iterable(values), 'f',
+                       len(values) * width).reshape(-1, width)
+
+
 # Alternate constructors
 def box(width, height, depth, first_point, color=None):
     'Constructs a rectangular box.'
@@ -212,7 +318,7 @@ def box(width, height, depth, first_point, color=None):
               p1 + d + h + w]
 
     for index, point in enumerate(points):
-        points[index] = Point3D(point[0], point[1], point[2], color)
+        points[index] = Point3D(point[0], point[1], point[2], color=color)
 
     shapes = [
         Rect2D([points[0], points[1], points[2], points[3]]),
@@ -269,6 +375,7 @@ def sphere(radius, first_point, detail=2, color=None):
             x * radius / length,
             y * radius / length,
             z * radius / length,
+            color=color,
         )
 
     middle_point_cache = {}
@@ -338,7 +445,7 @@ def sphere(radius, first_point, detail=2, color=None):
         # reuse faces to save a bit of memory here
         faces[i] = Shape2D([verts[point] for point in face])
 
-    sphere = Shape3D(faces)
+    sphere = Shape3D(faces, indexed=True)
     sphere.gen_normals()
     # sphere.offset = glm.vec4(first_point.vertex, 1)
     return sphere
\ No newline at end of file
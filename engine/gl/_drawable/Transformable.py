@@ -0,0 +1,104 @@
+import glm
+from ..utils import ReprMixin
+
+
+class Transformable(ReprMixin):
+    '''
+    Base class for drawables that are placed in the world with an
+    offset, rotate and scale matrix.
+    '''
+    def __init__(self, offset=None, rotate=None, scale=None):
+        # Collision boxes attached to the shape, told when it moves.
+        self._moving_with = []
+        # The PhysicsWorld and index of the body the offset and rotate
+        # follow, and the world step they were last taken from.
+        self._body = None
+        self._body_step = None
+        self.offset = offset if offset else glm.mat4()
+        self.rotate = rotate if rotate else glm.mat4()
+        self.scale = scale if scale else glm.mat4()
+        self._matrix = None
+        # Bounds of the vertices in model space, set by compile_VBO and
+        # used for view frustum culling.
+        self.local_bounds = None
+
+    @property
+    def model_matrix(self):
+        '''
+        The transform matrix is a way to transform of an object
+        at draw time without overwriting all of its members.
+
+        This is calculated lazily only if ._matrix doesn't exist, create it.
+        Modifying the offset, rotate, or scale will reset the value of _matrix
+        to None and cause it to recalculate the next time it's used. This
+        avoids repetitive calculations for objects that don't move.
+        '''
+        if self._body is not None:
+            self._follow_body()
+        if self._matrix is None:
+            self._matrix = self.offset * self.rotate * self.scale
+        return self._matrix
+
+    def move(self, x, y, z):
+        "Moves the shape around the world."
+        self.offset[3][0] = self.offset[3][0] + x
+        self.offset[3][1] = self.offset[3][1] + y
+        self.offset[3][2] = self.offset[3][2] + z
+        self._matrix = None
+        for area in self._moving_with:
+            area.moved()
+
+    def _follow(self, world, i):
+        "Makes the offset and rotate follow body i of a PhysicsWorld."
+        self._body = (world, i)
+        self._body_step = world.steps
+        for area in self._moving_with:
+            area._reclassify()
+
+    def _follow_body(self):
+        "Takes the offset and rotate of the body if it stepped since."
+        world, i = self._body
+        if self._body_step != world.steps:
+            self._body_step = world.steps
+            self._offset, self._rotate = world.body_matrices(i)
+            self._matrix = None
+
+    def move_relative_to_camera(self, right, up, back):
+        "Moves the shape relative to the camera position."
+        # TODO
+        pass
+
+    # The below three properties are used to in the transform matrix.
+    # Resetting the matrix to None enables a lazy calculation.
+    def get_offset(self):
+        if self._body is not None:
+            self._follow_body()
+        return self._offset
+
+    def set_offset(self, val):
+        self._matrix = None
+        self._offset = val
+        for area in self._moving_with:
+            area.moved()
+
+    def get_rotate(self):
+        if self._body is not None:
+            self._follow_body()
+        return self._rotate
+
+    def set_rotate(self, val):
+        self._matrix = None
+        self._rotate = val
+
+    def get_scale(self):
+        return self._scale
+
+    def set_scale(self, val):
+        self._matrix = None
+        self._scale = val
+        if self._body is not None:
+            self._body[0].set_scale(self._body[1], val)
+
+    offset = property(get_offset, set_offset)
+    rotate = property(get_rotate, set_rotate)
+    scale = property(get_scale, set_scale)
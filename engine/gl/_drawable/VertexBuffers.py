@@ -0,0 +1,57 @@
+import numpy as np
+from OpenGL.GL import GL_ELEMENT_ARRAY_BUFFER
+from OpenGL.arrays.vbo import VBO
+from ..stream_buffer import StreamBuffer
+
+
+class VertexBuffers:
+    '''
+    Mixin for drawables that compile their vertices into a vertex buffer,
+    _VBO, and optionally an element buffer, _IBO. The class sets
+    _VBO_is_compiled and dynamic; a dynamic one streams its vertices
+    through a StreamBuffer.
+    '''
+    def _compile_indexed(self, data, indices):
+        '''
+        Sets the vertex and element buffers to data and indices, reusing
+        the compiled ones when they fit. Buffers that are replaced get
+        attached in their place by VAO.upload on the next draw.
+        '''
+        vbo, ibo = self._VBO, self._IBO
+        reuse = self._VBO_is_compiled and ibo is not None and \
+            isinstance(vbo, StreamBuffer) == self.dynamic and \
+            ibo.data.dtype == indices.dtype
+        if reuse and self.dynamic:
+            # A StreamBuffer's size is fixed, and writing to it needn't
+            # upload anything, so it can't bring new indices along.
+            reuse = (len(vbo), vbo.stride) == (len(data), data[0].nbytes) \
+                and np.array_equal(ibo.data, indices)
+        if reuse:
+            vbo.set_array(data)
+            if not np.array_equal(ibo.data, indices):
+                ibo.set_array(indices)
+            return
+        self._release_VBO()
+        self._IBO = VBO(indices, target=GL_ELEMENT_ARRAY_BUFFER)
+        self._VBO = StreamBuffer(data) if self.dynamic else VBO(data)
+
+    def _compile_vertices(self, data, previous):
+        '''
+        Sets the vertex buffer to data. If data is previous, the compiled
+        buffer's own array written in place, it's uploaded again on the
+        next bind.
+        '''
+        if data is previous:
+            self._VBO.set_array(data)
+            return
+        self._release_VBO()
+        self._VBO = StreamBuffer(data) if self.dynamic else VBO(data)
+
+    def _release_VBO(self):
+        '''
+        Marks the vertex buffer for recompiling, freeing it first if it's a
+        StreamBuffer, whose storage would otherwise stay mapped.
+        '''
+        if self._VBO_is_compiled and isinstance(self._VBO, StreamBuffer):
+            self._VBO.delete()
+        self._VBO_is_compiled = False
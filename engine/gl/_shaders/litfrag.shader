@@ -1,18 +1,26 @@
 #version 420
+// Variants: define UNLIT to draw the plain vertex colors.
 
 in vec3 vertex;
 in vec3 normal;
 in vec3 color;
 out vec4 fragment_color;
 
-uniform float light_ambient_weight;
-uniform vec3 light_ambient_color;
-
-uniform vec3 light_pos;
-uniform vec3 light_color;
-uniform float light_glare;   // Spectacular weight
+// Camera and lights, shared by every program; see engine/gl/ubo.py.
+layout (std140, binding=0) uniform Frame {
+    mat4 view;
+    mat4 projection;
+    vec3 light_pos;
+    float light_ambient_weight;
+    vec3 light_ambient_color;
+    float light_glare;   // Spectacular weight
+    vec3 light_color;
+};
 
 void main() {
+#ifdef UNLIT
+    fragment_color = vec4(color, 1.0);
+#else
     // ambient
     vec3 ambient = light_ambient_weight * light_ambient_color;
 
@@ -30,4 +38,5 @@ void main() {
 
     vec3 result = (ambient + diffuse + specular) * color;
     fragment_color = vec4(result, 1.0);
+#endif
 }
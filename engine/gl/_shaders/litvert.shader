@@ -1,19 +1,43 @@
 #version 420
+// Variants: define INSTANCED to read a model matrix and a color tint per
+// instance from the instance buffer instead of the model uniform.
 layout (location=0) in vec3 vertex_attrib;
 layout (location=1) in vec3 normal_attrib;
 layout (location=2) in vec3 color_attrib;
+#ifdef INSTANCED
+// One per instance, from the instance buffer. mat4 uses locations 3-6.
+layout (location=3) in mat4 instance_model;
+layout (location=7) in vec3 instance_color;
+#endif
 // in vec3 texcoord_attrib;
 out vec3 vertex;
 out vec3 normal;
 out vec3 color;
 
+#ifndef INSTANCED
 uniform mat4 model;
-uniform mat4 view;
-uniform mat4 projection;
+#endif
+// Camera and lights, shared by every program; see engine/gl/ubo.py.
+layout (std140, binding=0) uniform Frame {
+    mat4 view;
+    mat4 projection;
+    vec3 light_pos;
+    float light_ambient_weight;
+    vec3 light_ambient_color;
+    float light_glare;   // Spectacular weight
+    vec3 light_color;
+};
 
 void main() {
+#ifdef INSTANCED
+    mat4 model = instance_model;
+#endif
     gl_Position = projection * view * model * vec4(vertex_attrib, 1.0f);
     vertex = gl_Position.xyz;
     normal = normal_attrib;
+#ifdef INSTANCED
+    color = color_attrib * instance_color;
+#else
     color = color_attrib;
+#endif
 }
@@ -0,0 +1,4 @@
+#version 420
+// litvert with a model matrix and color per instance.
+#define INSTANCED 1
+#include "litvert.shader"
@@ -0,0 +1,94 @@
+'Bounding volumes and vectorized view frustum culling.'
+from collections import namedtuple
+import numpy as np
+
+# An axis aligned box from lower to upper, and a sphere around the same
+# points, in the model's own (local) coordinates.
+Bounds = namedtuple('Bounds', 'lower upper center radius')
+
+
+def local_bounds(positions):
+    '''
+    The bounds of a set of vertex positions. The sphere is centered on the
+    box, which is close to minimal for the shapes we draw and cheap to find.
+
+    :param positions: (n, 3) vertex positions.
+    '''
+    positions = np.asarray(positions, np.float64).reshape(-1, 3)
+    if not len(positions):
+        zero = np.zeros(3)
+        return Bounds(zero, zero, zero, 0.)
+    lower = positions.min(axis=0)
+    upper = positions.max(axis=0)
+    center = (lower + upper) / 2
+    offsets = positions - center
+    radius = float(np.sqrt(np.einsum('ij,ij->i', offsets, offsets).max()))
+    return Bounds(lower, upper, center, radius)
+
+
+def include(bounds, positions):
+    '''
+    bounds grown to take in more positions, e.g. vertices that moved.
+    Much cheaper than local_bounds of every point when only a few changed,
+    but it never shrinks, and once it grows the sphere is the one around
+    the whole box.
+    '''
+    positions = np.asarray(positions, np.float64).reshape(-1, 3)
+    if not len(positions):
+        return bounds
+    offsets = positions - bounds.center
+    distances = np.einsum('ij,ij->i', offsets, offsets)
+    if (positions >= bounds.lower).all() and \
+            (positions <= bounds.upper).all() and \
+            distances.max() <= bounds.radius ** 2:
+        return bounds
+    lower = np.minimum(bounds.lower, positions.min(axis=0))
+    upper = np.maximum(bounds.upper, positions.max(axis=0))
+    center = (lower + upper) / 2
+    return Bounds(lower, upper, center, float(np.linalg.norm(upper - center)))
+
+
+def matrix_array(matrices):
+    '''
+    An (n, 4, 4) array from glm matrices, indexed like glm: [n][column][row].
+    '''
+    data = b''.join(m.to_bytes() for m in matrices)
+    return np.frombuffer(data, np.float32).reshape(-1, 4, 4)
+
+
+def frustum_planes(matrix):
+    '''
+    The six planes of the view frustum of a projection * view matrix, as a
+    (6, 4) array of (a, b, c, d) with the normal pointing into the frustum,
+    so a point p is inside a plane if a*x + b*y + c*z + d >= 0. Order is
+    left, right, bottom, top, near, far. (Gribb and Hartmann, 2001.)
+    '''
+    m = matrix_array([matrix])[0].T.astype(np.float64)  # [row][column]
+    planes = np.array([m[3] + m[0], m[3] - m[0],
+                       m[3] + m[1], m[3] - m[1],
+                       m[3] + m[2], m[3] - m[2]])
+    return planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+
+def world_spheres(model_matrices, centers, radii):
+    '''
+    Moves local bounding spheres into world space. Radii grow by the
+    largest scale along any axis, so the spheres stay conservative.
+
+    :param model_matrices: (n, 4, 4) array indexed like glm.
+    :param centers: (n, 3) local sphere centers.
+    :param radii: (n,) local sphere radii.
+    '''
+    m = np.asarray(model_matrices, np.float64)
+    world = np.einsum('nij,ni->nj', m[:, :3, :3], centers) + m[:, 3, :3]
+    scale = np.sqrt(np.einsum('nij,nij->ni', m[:, :3, :3], m[:, :3, :3]))
+    return world, radii * scale.max(axis=1)
+
+
+def spheres_in_frustum(planes, centers, radii):
+    '''
+    A bool per sphere; False if it's entirely outside one of the planes.
+    Spheres on the edge count as inside.
+    '''
+    distances = centers @ planes[:, :3].T + planes[:, 3]
+    return (distances >= -np.asarray(radii)[:, None]).all(axis=1)
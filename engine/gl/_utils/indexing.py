@@ -0,0 +1,175 @@
+'Helpers for building index (element) buffers.'
+import numpy as np
+from OpenGL.GL import GL_UNSIGNED_SHORT, GL_UNSIGNED_INT, GL_TRIANGLES, \
+    GL_QUADS, GL_POLYGON
+
+INDEX_TYPES = {
+    np.dtype(np.uint16): GL_UNSIGNED_SHORT,
+    np.dtype(np.uint32): GL_UNSIGNED_INT,
+}
+
+
+def index_dtype(vertex_count):
+    "The smallest index type that can address vertex_count vertices."
+    return np.uint16 if vertex_count <= 0x10000 else np.uint32
+
+
+def triangulate(face_sizes, modes=GL_POLYGON):
+    '''
+    Splits faces into triangles. Returns a flat array of indices into the
+    faces' concatenated corners, three per triangle, and the face each
+    triangle came from.
+
+    :param face_sizes: The number of corners in each face.
+    :param modes: GL_TRIANGLES, GL_QUADS or GL_POLYGON, either one for all
+      faces or one per face. Triangle and quad faces are split into groups
+      of 3 or 4 corners; polygons are fan-triangulated.
+    '''
+    face_sizes = np.asarray(face_sizes, np.int64).reshape(-1)
+    modes = np.broadcast_to(np.asarray(modes), face_sizes.shape)
+    is_tri = modes == GL_TRIANGLES
+    is_quad = modes == GL_QUADS
+    counts = np.where(is_tri, face_sizes // 3,
+                      np.where(is_quad, face_sizes // 4 * 2,
+                               np.maximum(face_sizes - 2, 0)))
+
+    faces = np.repeat(np.arange(len(face_sizes)), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                            counts)
+    first = (np.cumsum(face_sizes) - face_sizes)[faces]
+    a = np.where(is_tri[faces], first + 3 * k,
+                 np.where(is_quad[faces], first + 4 * (k // 2), first))
+    b = np.where(is_tri[faces], a + 1,
+                 np.where(is_quad[faces], a + 1 + k % 2, first + k + 1))
+    return np.stack((a, b, b + 1), axis=1).reshape(-1), faces
+
+
+def deduplicate(data):
+    '''
+    Merges identical rows of an interleaved vertex array.
+
+    :param data: A 2d array with one row per drawn vertex.
+    :returns: (vertices, indices) where vertices holds each distinct row
+      once, in order of first appearance, and vertices[indices] == data.
+    '''
+    data = np.ascontiguousarray(data)
+    if not len(data):
+        return data, np.zeros(0, np.uint16)
+    # Compare whole rows as opaque bytes; much faster than unique(axis=0).
+    # Adding 0 turns -0.0 into 0.0 so they still compare equal.
+    rows = data.reshape(len(data), -1)
+    if rows.dtype.kind == 'f':
+        rows = rows + rows.dtype.type(0)
+    rows = rows.view(np.dtype((np.void, rows.strides[0]))).reshape(-1)
+    _, first, inverse = np.unique(rows, return_index=True,
+                                  return_inverse=True)
+    # np.unique sorts the rows; renumber them by first appearance so
+    # neighbouring triangles keep neighbouring vertices.
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    indices = rank[inverse.reshape(-1)].astype(index_dtype(len(order)))
+    return data[first[order]], indices
+
+
+def cache_miss_ratio(indices, cache_size=16):
+    '''
+    Average cache miss ratio (ACMR) of a triangle list for a FIFO
+    post-transform vertex cache: vertex shader runs per triangle. Lower is
+    better; 3.0 means nothing is reused, ~0.5-0.7 is typical when optimized.
+    '''
+    indices = np.asarray(indices).reshape(-1).tolist()
+    if not indices:
+        return 0.
+    cache = []
+    cached = set()
+    misses = 0
+    for v in indices:
+        if v in cached:
+            continue
+        misses += 1
+        cache.append(v)
+        cached.add(v)
+        if len(cache) > cache_size:
+            cached.discard(cache.pop(0))
+    return misses / (len(indices) / 3)
+
+
+def optimize_vertex_cache(indices, vertex_count=None, cache_size=16):
+    '''
+    Reorders the triangles of an indexed triangle list so vertices are
+    reused while they are still in the GPU's post-transform cache, using
+    the Tipsify algorithm (Sander, Nehab and Barczak, 2007). The set of
+    triangles and their winding are unchanged.
+
+    :param indices: Flat triangle list indices.
+    :param vertex_count: Number of vertices, defaults to max(indices) + 1.
+    :param cache_size: Size of the vertex cache to optimize for.
+    '''
+    indices = np.asarray(indices)
+    triangles = indices.reshape(-1, 3)
+    if vertex_count is None:
+        vertex_count = int(indices.max()) + 1 if indices.size else 0
+    if not len(triangles):
+        return indices.copy()
+
+    # Triangles using each vertex, as a CSR style offsets/adjacency pair.
+    flat = triangles.reshape(-1).astype(np.int64)
+    live = np.bincount(flat, minlength=vertex_count)
+    offsets = np.concatenate(([0], np.cumsum(live))).tolist()
+    adjacency = (np.argsort(flat, kind='stable') // 3).tolist()
+    live = live.tolist()
+    tris = triangles.tolist()
+
+    cache_time = [-cache_size - 1] * vertex_count
+    emitted = [False] * len(tris)
+    dead_end = []
+    output = []
+    timestamp = 0
+    cursor = 0
+    fanning = flat[0].item()
+
+    while fanning >= 0:
+        candidates = []
+        for t in adjacency[offsets[fanning]:offsets[fanning + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            output.append(t)
+            for v in tris[t]:
+                dead_end.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if timestamp - cache_time[v] > cache_size:
+                    cache_time[v] = timestamp
+                    timestamp += 1
+
+        # Next fanning vertex: the candidate that will still be in the
+        # cache after its remaining triangles are emitted, oldest first.
+        fanning = -1
+        best = -1
+        for v in candidates:
+            if live[v] <= 0:
+                continue
+            age = timestamp - cache_time[v]
+            priority = age if age + 2 * live[v] <= cache_size else 0
+            if priority > best:
+                best = priority
+                fanning = v
+        if fanning >= 0:
+            continue
+
+        # Dead end: fall back to recently used vertices, then any vertex.
+        while dead_end:
+            v = dead_end.pop()
+            if live[v] > 0:
+                fanning = v
+                break
+        else:
+            while cursor < vertex_count:
+                if live[cursor] > 0:
+                    fanning = cursor
+                    break
+                cursor += 1
+
+    return triangles[output].reshape(indices.shape)
@@ -0,0 +1,89 @@
+'Vectorized normal generation for indexed triangle meshes.'
+import numpy as np
+
+FLAT = 'flat'
+SMOOTH = 'smooth'
+ANGLE = 'angle'
+MODES = (FLAT, SMOOTH, ANGLE)
+
+
+def normalize(vectors):
+    "Normalizes each row, leaving zero-length rows at zero."
+    vectors = np.asarray(vectors, np.float64)
+    length = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+    length[length == 0] = 1.
+    return vectors / length[:, None]
+
+
+def face_normals(positions, triangles):
+    '''
+    The cross product of two edges of every triangle. The length of each
+    is twice the triangle's area, so summing them weights by area.
+
+    :param positions: (n, 3) vertex positions.
+    :param triangles: (m, 3) vertex indices of each triangle.
+    '''
+    positions = np.asarray(positions, np.float64)
+    triangles = np.asarray(triangles).reshape(-1, 3)
+    a = positions[triangles[:, 0]]
+    return np.cross(positions[triangles[:, 1]] - a,
+                    positions[triangles[:, 2]] - a)
+
+
+def vertex_normals(positions, triangles):
+    '''
+    Smooth normals: every vertex gets the area weighted average of the
+    normals of the triangles that use it.
+    '''
+    triangles = np.asarray(triangles).reshape(-1, 3)
+    weighted = np.repeat(face_normals(positions, triangles), 3, axis=0)
+    corners = triangles.reshape(-1)
+    count = len(positions)
+    summed = np.stack([np.bincount(corners, weighted[:, i], count)
+                       for i in range(3)], axis=1)
+    return normalize(summed)
+
+
+def corner_normals(positions, triangles, mode=SMOOTH, angle=60.):
+    '''
+    A normal for every corner of every triangle, in triangle order.
+
+    :param mode: FLAT gives each corner its triangle's normal. SMOOTH
+      gives each corner its vertex's smooth normal. ANGLE averages the
+      normals of the triangles around the vertex that are within angle
+      degrees of the corner's own triangle, keeping hard edges sharp.
+    :param angle: The crease angle in degrees for ANGLE mode.
+    '''
+    triangles = np.asarray(triangles).reshape(-1, 3)
+    if mode == SMOOTH:
+        return vertex_normals(positions, triangles)[triangles.reshape(-1)]
+    weighted = face_normals(positions, triangles)
+    if mode == FLAT:
+        return np.repeat(normalize(weighted), 3, axis=0)
+    if mode != ANGLE:
+        raise ValueError(f"Unknown normal mode {mode}; use one of {MODES}.")
+
+    # Pair every corner with every corner sharing its vertex, then sum
+    # the weighted normals of the partners' triangles that are within the
+    # crease angle of the corner's triangle.
+    unit = normalize(weighted)
+    corners = triangles.reshape(-1)
+    order = np.argsort(corners, kind='stable')
+    _, starts, sizes = np.unique(corners[order], return_index=True,
+                                 return_counts=True)
+    group = np.repeat(np.arange(len(sizes)), sizes)
+    pairs = sizes[group]  # partners of each sorted corner
+    mine = np.repeat(order, pairs)
+    offset = np.arange(pairs.sum()) - np.repeat(np.cumsum(pairs) - pairs,
+                                                pairs)
+    theirs = order[np.repeat(starts[group], pairs) + offset]
+
+    mine_face, their_face = mine // 3, theirs // 3
+    keep = np.einsum('ij,ij->i', unit[mine_face], unit[their_face]) >= \
+        np.cos(np.radians(angle)) - 1e-6
+    # A corner's own triangle always counts, even if it's degenerate.
+    keep |= mine_face == their_face
+    mine, their_face = mine[keep], their_face[keep]
+    summed = np.stack([np.bincount(mine, weighted[their_face, i],
+                                   len(corners)) for i in range(3)], axis=1)
+    return normalize(summed)
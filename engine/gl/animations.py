@@ -1,2 +1,3 @@
 from ._animations.Animator import Animator
-from ._animations.physics.gravity import GravityAnimator, PhysicsAnimator
\ No newline at end of file
+from ._animations.physics.gravity import GravityAnimator, PhysicsAnimator
+from ._animations.physics.world import PhysicsWorld, model_matrices
@@ -0,0 +1,153 @@
+'''
+Broadphase collision detection: finding the pairs of axis aligned boxes
+that overlap without testing every pair.
+
+Every broadphase takes (n, 3) arrays of the boxes' lower and upper corners
+and returns an (m, 2) array of index pairs (i < j) whose boxes overlap,
+sorted by i then j. Boxes that only touch count as overlapping, the same as
+collision.box_box_collision.
+'''
+import numpy as np
+from .utils import ReprMixin
+
+_NO_PAIRS = np.zeros((0, 2), np.int64)
+
+
+def overlapping(lower, upper, pairs):
+    "Keeps the candidate pairs whose boxes overlap on every axis."
+    if not len(pairs):
+        return _NO_PAIRS
+    i, j = pairs[:, 0], pairs[:, 1]
+    keep = ((lower[i] <= upper[j]) & (upper[i] >= lower[j])).all(axis=1)
+    return pairs[keep]
+
+
+def _sorted_pairs(pairs, count):
+    "Orders pairs so i < j, drops repeats and sorts them by i then j."
+    if not len(pairs):
+        return _NO_PAIRS
+    pairs = np.sort(pairs, axis=1)
+    keys = np.unique(pairs[:, 0] * count + pairs[:, 1])
+    return np.stack((keys // count, keys % count), axis=1)
+
+
+def _runs(starts, ends):
+    '''
+    For every i, the positions starts[i] to ends[i] - 1. Returns
+    (owner, position) arrays, one entry per position.
+    '''
+    lengths = np.maximum(ends - starts, 0)
+    owner = np.repeat(np.arange(len(starts)), lengths)
+    offset = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) -
+                                                  lengths, lengths)
+    return owner, starts[owner] + offset
+
+
+class Broadphase(ReprMixin):
+    "Base class; subclasses implement pairs."
+    def pairs(self, lower, upper):
+        raise NotImplementedError
+
+
+class AllPairs(Broadphase):
+    '''
+    Tests every pair at once. O(n^2) time and memory, but with little
+    overhead, so it's fine for a few dozen boxes.
+    '''
+    def pairs(self, lower, upper):
+        count = len(lower)
+        i, j = np.triu_indices(count, 1)
+        return overlapping(lower, upper, np.stack((i, j), axis=1))
+
+
+class SweepAndPrune(Broadphase):
+    '''
+    Sorts the boxes along one axis and pairs each box with the boxes whose
+    lower corner falls between its own lower and upper corner on that axis.
+    The order from the last call is reused as the starting point, so when
+    the boxes have moved only a little the sort is nearly linear.
+
+    Works best when the boxes are spread out along the axis.
+    '''
+    def __init__(self, axis=None):
+        '''
+        :param axis: 0, 1 or 2. If None, the axis the boxes are most spread
+          out along is picked on every call.
+        '''
+        self.axis = axis
+        self._order = None
+
+    def pairs(self, lower, upper):
+        count = len(lower)
+        if count < 2:
+            return _NO_PAIRS
+        axis = self.axis
+        if axis is None:
+            axis = int(np.argmax(np.var(lower + upper, axis=0)))
+
+        keys = lower[:, axis]
+        order = self._order
+        if order is None or len(order) != count:
+            order = np.argsort(keys, kind='stable')
+        else:
+            # timsort is close to linear on nearly sorted input
+            order = order[np.argsort(keys[order], kind='stable')]
+        self._order = order
+
+        starts = keys[order]
+        ends = np.searchsorted(starts, upper[order, axis], side='right')
+        owner, partner = _runs(np.arange(1, count + 1), ends)
+        candidates = np.stack((order[owner], order[partner]), axis=1)
+        return _sorted_pairs(overlapping(lower, upper, candidates), count)
+
+
+class HashGrid(Broadphase):
+    '''
+    A uniform grid stored in a hash table: every box is put in each cell it
+    touches, and only boxes that share a cell are paired.
+
+    Works best when the boxes are about the size of a cell or smaller.
+    '''
+    # Primes from Teschner et al., "Optimized Spatial Hashing for Collision
+    # Detection of Deformable Objects", 2003.
+    PRIMES = np.array([73856093, 19349663, 83492791], np.int64)
+
+    def __init__(self, cell_size=None):
+        '''
+        :param cell_size: The width of a cell. If None, twice the average
+          box width is used.
+        '''
+        self.cell_size = cell_size
+
+    def pairs(self, lower, upper):
+        count = len(lower)
+        if count < 2:
+            return _NO_PAIRS
+        cell_size = self.cell_size
+        if cell_size is None:
+            cell_size = 2 * float(np.mean(upper - lower)) or 1.
+        first = np.floor(lower / cell_size).astype(np.int64)
+        last = np.floor(upper / cell_size).astype(np.int64)
+
+        # One entry per (box, cell it touches)
+        extent = last - first + 1
+        cells = extent.prod(axis=1)
+        box = np.repeat(np.arange(count), cells)
+        k = np.arange(cells.sum()) - np.repeat(np.cumsum(cells) - cells,
+                                               cells)
+        ex = extent[box]
+        cell = first[box] + np.stack((k % ex[:, 0],
+                                      k // ex[:, 0] % ex[:, 1],
+                                      k // (ex[:, 0] * ex[:, 1])), axis=1)
+        keys = np.bitwise_xor.reduce(cell * self.PRIMES, axis=1)
+
+        # Pair up the boxes in each cell. Different cells can share a hash;
+        # that only adds candidates, which are filtered below.
+        order = np.argsort(keys, kind='stable')
+        keys, box = keys[order], box[order]
+        ends = np.searchsorted(keys, keys, side='right')
+        owner, partner = _runs(np.arange(1, len(keys) + 1), ends)
+        candidates = np.stack((box[owner], box[partner]), axis=1)
+        candidates = candidates[candidates[:, 0] != candidates[:, 1]]
+        candidates = _sorted_pairs(candidates, count)
+        return overlapping(lower, upper, candidates)
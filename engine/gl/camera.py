@@ -1,6 +1,7 @@
 import numpy as np
 from .utils import ReprMixin
 from .utils import transformations
+from .utils import bounds
 import glm
 
 
@@ -127,3 +128,12 @@ class Camera(ReprMixin):
             self._matrix = self._transm * self._zoomm * self._rotm
 
         return self._matrix
+
+    def frustum_planes(self, projection):
+        '''
+        The planes of the camera's view frustum in world space, as a (6, 4)
+        array; see bounds.frustum_planes.
+
+        :param projection: The projection matrix, e.g. glm.perspective(...).
+        '''
+        return bounds.frustum_planes(projection * self.matrix)
@@ -1,22 +1,31 @@
 from .utils import ReprMixin
+from .broadphase import SweepAndPrune
+import numpy as np
 import glm
 
 
 class CollisionSystem(ReprMixin):
     "A grouping of objects that can possibly collide."
-    def __init__(self):
+    def __init__(self, broadphase=None):
+        '''
+        :param broadphase: A Broadphase from engine.gl.broadphase that finds
+          the pairs of boxes worth testing. Defaults to SweepAndPrune.
+        '''
         self.areas = []
+        self.broadphase = broadphase if broadphase is not None \
+            else SweepAndPrune()
+        self._boxes = None
+        self._moved = {}  # id: box, for boxes whose rows are out of date
 
     def detect(self):
         collisions = []
-        areas = self.areas.copy()
-
-        while len(areas):
-            a = areas.pop()
-            for b in areas:
-                assert a is not b
-                if a.detect_collision(b):
-                    collisions.append((a, b))
+        for i, j in self.candidate_pairs():
+            # Same order as testing every pair: later areas first.
+            a, b = self.areas[j], self.areas[i]
+            # The broadphase already did the exact test for two boxes.
+            if (i in self._boxes and j in self._boxes) or \
+                    a.detect_collision(b):
+                collisions.append((a, b))
 
         for a, b in collisions:
             if a.handler is not None:
@@ -24,21 +33,165 @@ class CollisionSystem(ReprMixin):
             elif b.handler is not None:
                 b.handler(b, a)
 
+    def candidate_pairs(self):
+        '''
+        Pairs of area indices (i, j) that may collide, ordered like the
+        all-pairs loop: j descending, then i ascending. Box pairs are only
+        returned if the boxes overlap; other areas are paired with all.
+        '''
+        count = len(self.areas)
+        self.update_bounds()
+
+        index = self._box_index
+        pairs = index[self.broadphase.pairs(self._lower[index],
+                                            self._upper[index])]
+        if len(index) < count:
+            others = np.setdiff1d(np.arange(count), index)
+            i, j = np.meshgrid(np.arange(count), others, indexing='ij')
+            extra = np.stack((i.ravel(), j.ravel()), axis=1)
+            extra = np.sort(extra[extra[:, 0] != extra[:, 1]], axis=1)
+            pairs = np.unique(np.concatenate((pairs, extra)), axis=0)
+        order = np.lexsort((pairs[:, 0], -pairs[:, 1]))
+        return pairs[order].tolist()
+
+    def update_bounds(self):
+        '''
+        Brings the bounds arrays up to date. Only the rows of boxes that
+        moved since the last call, of animated bounding boxes and of boxes
+        on shapes a PhysicsWorld moves are written again; all of them after areas were added or removed.
+        '''
+        count = len(self.areas)
+        if self._boxes is None or len(self._lower) != count:
+            self._boxes = {i for i, a in enumerate(self.areas)
+                           if isinstance(a, CollisionBox)}
+            self._box_index = np.array(sorted(self._boxes), np.int64)
+            self._rows = {id(self.areas[i]): i for i in self._box_index}
+            # Refreshed every time: animated bounding boxes, and boxes on
+            # shapes following a PhysicsWorld body, which doesn't tell
+            # them when it steps.
+            self._animated = [i for i in self._box_index
+                              if self.areas[i].boundingBox or getattr(
+                                  self.areas[i].glueShape, '_body', None)]
+            self._lower = np.full((count, 3), -np.inf)
+            self._upper = np.full((count, 3), np.inf)
+            rows = self._box_index
+        else:
+            rows = [self._rows[key] for key in self._moved] + self._animated
+        self._moved = {}
+        if not len(rows):
+            return
+        areas = self.areas
+        bases = glm.array([glm.vec3(areas[i].base) for i in rows])
+        sizes = glm.array([glm.vec3(areas[i].size) for i in rows])
+        self._lower[rows] = np.asarray(bases)
+        self._upper[rows] = self._lower[rows] + np.asarray(sizes)
+
+    def box_moved(self, area):
+        "Marks a box's bounds to be written again; see CollisionBox.moved."
+        self._moved[id(area)] = area
+
+    def sweep(self, area, displacement, sphere=False):
+        '''
+        Finds the first box area would hit if it moved by displacement.
+        Returns (time, normal, other) where time is the fraction of the move
+        (0 to 1) at first contact and normal points out of other, or None.
+        Boxes it already overlaps are ignored.
+
+        :param area: A CollisionBox in this system.
+        :param sphere: Sweep the sphere that fits in area's box instead of
+          the box itself, e.g. for a ball.
+        '''
+        self.update_bounds()
+        index = self._box_index
+        others = index[[self.areas[i] is not area for i in index]]
+        if not len(others):
+            return None
+        displacement = np.array(displacement, np.float64)
+        near = np.array(area.base, np.float64)
+        size = np.array(area.size, np.float64)
+        lower, upper = self._lower[others], self._upper[others]
+        if sphere:
+            times, normals = swept_sphere_box(
+                near + size / 2, size.min() / 2, displacement, lower, upper)
+        else:
+            times, normals = swept_box_box(
+                near, near + size, displacement, lower, upper)
+        first = int(np.argmin(times))
+        if not np.isfinite(times[first]):
+            return None
+        return (float(times[first]), glm.vec3(*normals[first]),
+                self.areas[others[first]])
+
+    def move(self, area, velocity, sphere=False, acceleration=None,
+             max_bounces=4, skin=1e-6):
+        '''
+        Moves area (and what it's attached to) by velocity for one step with
+        continuous collision detection, so fast areas can't pass through
+        thin boxes. At each contact the area stops, bounces off the box
+        (scaled by the box's bounce_rebound, if any) and moves on for the
+        rest of the step. Returns the velocity after the bounces.
+
+        :param sphere: See sweep.
+        :param acceleration: Optional change in velocity over the step, e.g.
+          gravity. The area follows the chord of its curved path between
+          contacts and bounces with the velocity it has at the contact, so
+          where it goes doesn't depend on how long the steps are.
+        :param max_bounces: The most contacts to resolve in one step.
+        :param skin: Gap left between the area and the box it hit, so the
+          contact isn't detected again as an overlap.
+        '''
+        velocity = glm.vec3(velocity)
+        acceleration = glm.vec3(0.) if acceleration is None \
+            else glm.vec3(acceleration)
+        remaining = 1.
+        for _ in range(max_bounces + 1):
+            move = (velocity + acceleration * (remaining / 2)) * remaining
+            hit = self.sweep(area, move, sphere)
+            if hit is None:
+                _translate(area, move)
+                velocity += acceleration * remaining
+                break
+            time, normal, other = hit
+            length = glm.length(move)
+            _translate(area, move * max(time - skin / length, 0.))
+            velocity += acceleration * (remaining * time)
+            rebound = getattr(other, 'bounce_rebound', 1.)
+            velocity = (velocity - 2 * glm.dot(velocity, normal) * normal) \
+                * rebound
+            remaining *= 1. - time
+        return velocity
+
     def add(self, area):
         self.areas.append(area)
+        self._watch(area)
+        self._boxes = None
 
     def __getitem__(self, i):
         return self.areas[i]
 
     def __setitem__(self, i, val):
+        self._unwatch(self.areas[i])
         self.areas.__setitem__(i, val)
+        self._watch(val)
+        self._boxes = None
 
     def __delitem__(self, i):
+        self._unwatch(self.areas[i])
         del self.areas[i]
+        self._boxes = None
 
     def __len__(self):
         return len(self.areas)
 
+    def _watch(self, area):
+        if isinstance(area, CollisionBox):
+            area._systems.append(self)
+
+    def _unwatch(self, area):
+        if isinstance(area, CollisionBox):
+            area._systems.remove(self)
+            self._moved.pop(id(area), None)
+
 
 class CollisionFrame(list, ReprMixin):
     'A class for holding multiple collision boxes.'
@@ -77,6 +230,8 @@ class CollisionBox(ReprMixin):
 
     def __init__(self, width, height, depth,
                  suppress_no_collision_formula=False):
+        # The systems the box is in, told when it moves; see moved.
+        self._systems = []
         self.base_offset = glm.vec3(0., 0., 0.)
         self.size = glm.vec3(float(width), float(height), float(depth))
 
@@ -88,17 +243,61 @@ class CollisionBox(ReprMixin):
         self.handler_targets = []
         self.handler=None
 
-    def attach_to_point(self, point):
+    def moved(self):
+        '''
+        Tells the box's CollisionSystems its bounds changed. Shapes it's
+        attached to, and CollisionSystem.move, call this; call it after
+        moving the point it's attached to some other way.
+        '''
+        for system in self._systems:
+            system.box_moved(self)
+
+    def get_base_offset(self):
+        return self._base_offset
+
+    def set_base_offset(self, val):
+        self._base_offset = val
+        self.moved()
+
+    def get_size(self):
+        return self._size
+
+    def set_size(self, val):
+        self._size = val
+        self.moved()
+
+    base_offset = property(get_base_offset, set_base_offset)
+    size = property(get_size, set_size)
+
+    def _glue(self, point=None, shape=None):
+        "Attaches to point or shape, and follows the shape's moves."
+        old = getattr(self, 'glueShape', None)
+        if old is not None and self in old._moving_with:
+            old._moving_with.remove(self)
         self.gluePoint = point
-        self.glueShape = None
+        self.glueShape = shape
+        if shape is not None and hasattr(shape, '_moving_with'):
+            shape._moving_with.append(self)
+        self._reclassify()
+        self.moved()
+
+    def _reclassify(self):
+        '''
+        Makes the box's systems sort their boxes again into ones refreshed
+        only when moved and ones refreshed every time.
+        '''
+        for system in self._systems:
+            system._boxes = None
+
+    def attach_to_point(self, point):
+        self._glue(point=point)
 
     def attach_to_shape(self, shape):
         '''
         This function uses the shape's offset when calculating collision,
         but does not resize the collision box.
         '''
-        self.gluePoint = None
-        self.glueShape = shape
+        self._glue(shape=shape)
 
     def attach_as_animated_bounding_box(self, shape, *points):
         '''
@@ -115,14 +314,13 @@ class CollisionBox(ReprMixin):
         '''
         if len(points) < 2:
             raise ValueError("Points should be at least two items long; three is preferred. Otherwise, use CollsionBox.attach_to_point.")
-        self.glueShape = shape
         self.boundingBox = True
         self.boundingPoints = points
+        self._glue(shape=shape)  # refreshed every time from now on
 
     def detach(self):
-        self.gluePoint = None
-        self.glueShape = None
         self.boundingBox = False
+        self._glue()
         self.boundingPoints = None
         self.detect_collision = CollisionBox.detect_collision
 
@@ -145,7 +343,7 @@ class CollisionBox(ReprMixin):
                     zmax = max(zmax, p.vertex.z)
                 offset = glm.vec3(xmin, ymin, zmin)
                 base = base + offset
-                self.size = glm.vec3(xmax, ymax, zmax) - offset
+                self._size = glm.vec3(xmax, ymax, zmax) - offset
 
         return base
 
@@ -195,3 +393,100 @@ def box_sphere_collision(box, sph):
                (z - sph.z) ** 2
 
     return distance < sph.radius ** 2
+
+
+def _translate(area, offset):
+    "Moves a collision box by moving whatever it's attached to."
+    if area.glueShape is not None:
+        area.glueShape.move(*offset)
+    elif area.gluePoint is not None:
+        area.gluePoint.vertex = area.gluePoint.vertex + offset
+        area.moved()
+    else:
+        area.base_offset = area.base_offset + offset
+
+
+# ############################ ###
+# Swept (continuous) functions ###
+# ############################ ###
+# These take one moving shape and (m, 3) arrays of the corners of m static
+# boxes, and return the time of first contact with each box as a fraction
+# of the move (inf if they don't touch), and the contact normals pointing
+# out of the boxes.
+
+def _ray_box(origin, direction, lower, upper):
+    '''
+    Slab test of the ray origin + t * direction against boxes. Returns the
+    entry time, the axis it enters through and whether it hits at t in
+    [0, 1] from outside the box.
+    '''
+    parallel = direction == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t1 = (lower - origin) / direction
+        t2 = (upper - origin) / direction
+    inside = (origin >= lower) & (origin <= upper)
+    t_near = np.where(parallel, np.where(inside, -np.inf, np.inf),
+                      np.minimum(t1, t2))
+    t_far = np.where(parallel, np.where(inside, np.inf, -np.inf),
+                     np.maximum(t1, t2))
+    entry = t_near.max(axis=1)
+    hit = (entry <= t_far.min(axis=1)) & (entry >= 0) & (entry <= 1)
+    return entry, t_near.argmax(axis=1), hit
+
+
+def _face_normals(direction, axis):
+    normals = np.zeros((len(axis), 3))
+    normals[np.arange(len(axis)), axis] = -np.sign(direction[axis])
+    return normals
+
+
+def swept_box_box(near, far, displacement, lower, upper):
+    '''
+    A box from near to far moving by displacement against static boxes.
+    The moving box is shrunk to its center and the static ones grown by its
+    half size, which turns it into a ray test.
+    '''
+    near, far = np.asarray(near, float), np.asarray(far, float)
+    displacement = np.asarray(displacement, float)
+    half = (far - near) / 2
+    entry, axis, hit = _ray_box(near + half, displacement,
+                                lower - half, upper + half)
+    return np.where(hit, entry, np.inf), _face_normals(displacement, axis)
+
+
+def swept_sphere_box(center, radius, displacement, lower, upper):
+    '''
+    A sphere moving by displacement against static boxes. The boxes are
+    grown by the radius with rounded edges and corners, so grazing a
+    corner is exact instead of hitting the corner of a bigger box.
+    '''
+    center = np.asarray(center, float)
+    displacement = np.asarray(displacement, float)
+    entry, axis, hit = _ray_box(center, displacement,
+                                lower - radius, upper + radius)
+    times = np.where(hit, entry, np.inf)
+    normals = _face_normals(displacement, axis)
+
+    # Entering the grown box outside the box on two or three axes means the
+    # first contact is with an edge or a corner: solve for the time the
+    # distance to it (on those axes) equals the radius.
+    point = center + np.where(hit, entry, 0)[:, None] * displacement
+    nearest = np.clip(point, lower, upper)
+    outside = ~np.isclose(point, nearest, rtol=0, atol=1e-12)
+    rounded = hit & (outside.sum(axis=1) >= 2)
+    if rounded.any():
+        mask = outside[rounded]
+        offset = (center - nearest[rounded]) * mask
+        step = displacement * mask
+        a = np.einsum('ij,ij->i', step, step)
+        b = 2 * np.einsum('ij,ij->i', step, offset)
+        c = np.einsum('ij,ij->i', offset, offset) - radius ** 2
+        disc = b * b - 4 * a * c
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (-b - np.sqrt(disc)) / (2 * a)
+        touch = (disc >= 0) & (a > 0) & (t >= 0) & (t <= 1)
+        t = np.where(touch, t, np.inf)
+        times[rounded] = t
+        contact = (offset + np.where(touch, t, 0)[:, None] * step)
+        normals[rounded] = contact / radius
+    return times, normals
@@ -4,6 +4,8 @@ from ._drawable.Sphere3D import Sphere3D
 from ._drawable.Point3D import Point3D
 from ._drawable.Shape3D import Shape3D, box, cube, pyramid, sphere
 from ._drawable.Shape2D import Shape2D
+from ._drawable.Mesh import Mesh
+from ._drawable.Instances import Instances
 from ._drawable.Model3D import Model3D
 from ._drawable.Sprite import Sprite, Sprite3D
 from ._drawable.Texture import Texture
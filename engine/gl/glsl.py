@@ -0,0 +1,342 @@
+'''
+Reads GLSL source without a GL context: a small preprocessor, and a
+scanner that lists the declarations the engine cares about.
+
+preprocess strips comments, pastes in #include "file" (dropping its
+#version line, so whole shaders can be included) and resolves
+#define, #undef, #ifdef, #ifndef, #if, #elif, #else and #endif, so the
+driver gets one flat source. Object-like macros are expanded in the code;
+function-like ones are left for the driver.
+
+reflect scans preprocessed source for every global uniform, uniform block,
+input and output, with array sizes and layout(location=...) qualifiers.
+'''
+import functools
+import os
+import re
+from collections import namedtuple
+
+ShaderVar = namedtuple('ShaderVar', 'cls type name count location',
+                       defaults=(1, None))
+UniformBlock = namedtuple('UniformBlock', 'name members binding instance')
+Reflection = namedtuple('Reflection', 'version uniforms blocks inputs outputs')
+
+_TOKEN = re.compile(r'[A-Za-z_]\w*|\.?[0-9][\w.]*|&&|\|\||[=!<>]=|<<|>>|\S')
+_IDENTIFIER = re.compile(r'[A-Za-z_]\w*')
+_COMMENT = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)
+_DIRECTIVE = re.compile(r'\s*#\s*(\w*)\s*(.*?)\s*$')
+_DEFINED = re.compile(r'\bdefined\s*(?:\(\s*(\w+)\s*\)|(\w+))')
+_INCLUDE = re.compile(r'["<](.+)[">]$')
+
+# Words that can come before the type in a global declaration.
+QUALIFIERS = {
+    'const', 'in', 'out', 'inout', 'uniform', 'attribute', 'varying',
+    'buffer', 'shared', 'flat', 'smooth', 'noperspective', 'centroid',
+    'sample', 'patch', 'invariant', 'precise', 'highp', 'mediump', 'lowp',
+    'coherent', 'volatile', 'restrict', 'readonly', 'writeonly'}
+STORAGE = ('in', 'out', 'inout', 'uniform', 'attribute', 'varying', 'buffer')
+MAX_INCLUDE_DEPTH = 32
+
+
+class GLSLError(ValueError):
+    pass
+
+
+def _blank(match):
+    "A comment as blank space, keeping its line breaks."
+    return '\n' * match.group().count('\n') or ' '
+
+
+def _expand(line, macros):
+    "Substitutes object-like macros until none are left."
+    if not macros:
+        return line
+    for _ in range(MAX_INCLUDE_DEPTH):
+        expanded = _IDENTIFIER.sub(
+            lambda m: macros.get(m.group(), m.group()), line)
+        if expanded == line:
+            return line
+        line = expanded
+    raise GLSLError(f"Recursive macro in: {line}")
+
+
+def _evaluate(expression, macros):
+    "The value of an #if expression."
+    expression = _DEFINED.sub(
+        lambda m: '1' if (m.group(1) or m.group(2)) in macros else '0',
+        expression)
+    python = []
+    for token in _TOKEN.findall(_expand(expression, macros)):
+        if token[0].isdigit():
+            python.append(str(int(token.rstrip('uU'), 0)))
+        elif token[0].isalpha() or token[0] == '_':
+            python.append('0')  # undefined, as in C
+        elif token in ('&&', '||', '!'):
+            python.append({'&&': ' and ', '||': ' or ', '!': ' not '}[token])
+        elif token == '/':
+            python.append('//')
+        elif token in '()+-*%<>' or token in ('<=', '>=', '==', '!=',
+                                              '<<', '>>'):
+            python.append(token)
+        else:
+            raise GLSLError(f"Can't evaluate #if {expression}")
+    try:
+        return bool(eval(''.join(python), {'__builtins__': {}}))
+    except Exception as e:
+        raise GLSLError(f"Can't evaluate #if {expression}") from e
+
+
+def _find_include(name, folders):
+    for folder in folders:
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            return path
+    raise GLSLError(f"Can't find #include {name} in {folders}")
+
+
+def _preprocess(code, macros, folders, out, depth):
+    if depth > MAX_INCLUDE_DEPTH:
+        raise GLSLError("#include nested too deep")
+    code = _COMMENT.sub(_blank, code.replace('\\\n', ''))
+    stack = []  # [active before the #if, a branch was taken]
+    active = True
+    for line in code.split('\n'):
+        directive = _DIRECTIVE.match(line)
+        if directive is None:
+            out.append(_expand(line, macros) if active else '')
+            continue
+        name, rest = directive.groups()
+        out.append('')
+        if name in ('if', 'ifdef', 'ifndef'):
+            stack.append([active, False])
+            if active:
+                if name == 'if':
+                    active = _evaluate(rest, macros)
+                else:
+                    active = (rest in macros) == (name == 'ifdef')
+                stack[-1][1] = active
+        elif name in ('elif', 'else', 'endif'):
+            if not stack:
+                raise GLSLError(f"#{name} without #if")
+            if name == 'endif':
+                active = stack.pop()[0]
+                continue
+            outer, taken = stack[-1]
+            active = outer and not taken and \
+                (name == 'else' or _evaluate(rest, macros))
+            stack[-1][1] = taken or active
+        elif not active:
+            pass
+        elif name == 'define':
+            macro = re.match(r'(\w+)(\(?)\s*(.*)', rest)
+            if macro.group(2):
+                macros.setdefault(macro.group(1), macro.group(1))
+            else:
+                macros[macro.group(1)] = macro.group(3)
+            out[-1] = line.strip()
+        elif name == 'undef':
+            macros.pop(rest, None)
+            out[-1] = line.strip()
+        elif name == 'include':
+            include = _INCLUDE.match(rest)
+            if not include:
+                raise GLSLError(f"Bad #include {rest}")
+            path = _find_include(include.group(1), folders)
+            with open(path) as f:
+                included = f.read()
+            out.pop()
+            _preprocess(included, macros,
+                        [os.path.dirname(path)] + folders[1:], out,
+                        depth + 1)
+        elif name == 'error':
+            raise GLSLError(f"#error {rest}")
+        elif name == 'version' and depth:
+            pass  # an included file's #version; the first one counts
+        else:  # version, extension, pragma, line
+            out[-1] = line.strip()
+    if stack:
+        raise GLSLError("#if without #endif")
+
+
+def _next_line(head):
+    '''
+    The #line number that makes the line after it the first line after
+    head, the #version line if any. Before GLSL 3.30 (and ES 3.00) #line
+    gave the number of the directive's own line instead of the next one.
+    '''
+    lines = head.count('\n')
+    version = re.search(r'version\s+(\d+)\s*(es)?', head)
+    number = int(version.group(1)) if version else 110
+    current = number >= 300 if version and version.group(2) else \
+        number >= 330
+    return lines + 1 if current else lines
+
+
+def preprocess(code, defines=None, path=None, include_dirs=()):
+    '''
+    Returns code with comments removed, #include files pasted in, the
+    lines left out by #if and friends blanked and object-like macros
+    expanded. Line numbers are kept up to the first #include.
+
+    :param defines: Optional {name: value} to #define right after the
+      #version line, followed by a #line directive so the lines after
+      them keep their numbers.
+    :param path: The file code came from; #include looks next to it first.
+    :param include_dirs: More folders to look for #include files in.
+    '''
+    macros = {}
+    lines = []
+    if defines:
+        defined = [f"#define {name} {value}"
+                   for name, value in defines.items()]
+        version = re.match(r'(\s*#\s*version[^\n]*\n)?(.*)', code, re.S)
+        head = version.group(1) or ''
+        defined.append(f"#line {_next_line(head)}")
+        code = head + '\n'.join(defined) + '\n' + version.group(2)
+    folders = [os.path.dirname(os.path.abspath(path))] if path else \
+        [os.getcwd()]
+    _preprocess(code, macros, folders + list(include_dirs), lines, 0)
+    return '\n'.join(lines)
+
+
+def _split(tokens, separator=','):
+    "Splits tokens on separator outside of brackets."
+    parts, part, depth = [], [], 0
+    for token in tokens:
+        if token in '([{':
+            depth += 1
+        elif token in ')]}':
+            depth -= 1
+        if token == separator and not depth:
+            parts.append(part)
+            part = []
+        else:
+            part.append(token)
+    return parts + [part] if part else parts
+
+
+def _layout(tokens):
+    "layout(...) qualifiers as a dict: {'location': 0, 'std140': True}."
+    layout = {}
+    for part in _split(tokens):
+        if len(part) >= 3 and part[1] == '=':
+            try:
+                layout[part[0]] = int(part[2], 0)
+            except ValueError:
+                layout[part[0]] = part[2]
+        elif part:
+            layout[part[0]] = True
+    return layout
+
+
+def _qualifiers(tokens):
+    '''
+    Splits the qualifiers off a declaration. Returns (layout, storage
+    qualifier or None, the remaining tokens).
+    '''
+    layout, storage, i = {}, None, 0
+    while i < len(tokens):
+        if tokens[i] == 'layout' and i + 1 < len(tokens) and \
+                tokens[i + 1] == '(':
+            end = tokens.index(')', i)
+            layout.update(_layout(tokens[i + 2:end]))
+            i = end + 1
+        elif tokens[i] in QUALIFIERS:
+            if tokens[i] in STORAGE:
+                storage = tokens[i]
+            i += 1
+        else:
+            break
+    return layout, storage, tokens[i:]
+
+
+def _array_size(tokens):
+    "The size from tokens like [ 4 ], or None if it isn't a number."
+    try:
+        return int(tokens[1], 0) if len(tokens) == 3 else None
+    except ValueError:
+        return None
+
+
+def _variables(cls, layout, tokens):
+    "The variables one declaration like `vec3 a, b[2] = ...` declares."
+    if len(tokens) < 2:
+        return []  # e.g. layout(early_fragment_tests) in;
+    typ, rest = tokens[0], tokens[1:]
+    if rest[0] == '[':  # float[4] a;
+        end = rest.index(']')
+        typ, rest = typ + ''.join(rest[:end + 1]), rest[end + 1:]
+    variables = []
+    location = layout.get('location')
+    for declarator in _split(rest):
+        if '=' in declarator:
+            declarator = declarator[:declarator.index('=')]
+        count = 1
+        if len(declarator) > 1 and declarator[1] == '[':
+            count = _array_size(declarator[1:])
+        variables.append(ShaderVar(cls, typ, declarator[0], count, location))
+        location = None
+    return variables
+
+
+@functools.lru_cache(maxsize=None)
+def reflect(code, vertex=True):
+    '''
+    The global declarations in GLSL as a Reflection of (version, uniforms,
+    blocks, inputs, outputs), tuples in source order. Comments are skipped,
+    but #if and macros aren't; run code with those through preprocess
+    first. Results are memoized on the code, so each source is only
+    scanned once.
+
+    :param vertex: True for a vertex shader, where varying is an output;
+      in other stages it's an input.
+    '''
+    code = _COMMENT.sub(_blank, code)
+    version = re.search(r'^\s*#\s*version\s+(\d+)', code, re.M)
+    tokens = _TOKEN.findall(re.sub(r'^\s*#.*$', '', code, flags=re.M))
+    uniforms, blocks, inputs, outputs = [], [], [], []
+
+    statement, i = [], 0
+    while i < len(tokens):
+        token = tokens[i]
+        i += 1
+        if token == ';':
+            layout, storage, rest = _qualifiers(statement)
+            statement = []
+            if storage is None:
+                continue  # precision statements, constants, prototypes
+            variables = _variables(storage, layout, rest)
+            if storage == 'uniform':
+                uniforms += variables
+            elif storage in ('in', 'attribute') or \
+                    (storage == 'varying' and not vertex):
+                inputs += variables
+            elif storage in ('out', 'varying'):
+                outputs += variables
+        elif token == '{':
+            depth, start = 1, i
+            while depth and i < len(tokens):
+                depth += {'{': 1, '}': -1}.get(tokens[i], 0)
+                i += 1
+            body = tokens[start:i - 1]
+            layout, storage, rest = _qualifiers(statement)
+            if storage is None:
+                statement = []  # a function or struct
+                continue
+            # An interface block; its instance name, if any, comes next.
+            end = tokens.index(';', i)
+            instance = tokens[i] if end > i else None
+            i = end + 1
+            statement = []
+            if storage == 'uniform':
+                members = []
+                for member in _split(body, ';'):
+                    member_layout, _, member = _qualifiers(member)
+                    members += _variables('uniform', member_layout, member)
+                blocks.append(UniformBlock(rest[0], tuple(members),
+                                           layout.get('binding'), instance))
+        else:
+            statement.append(token)
+    return Reflection(int(version.group(1)) if version else None,
+                      tuple(uniforms), tuple(blocks), tuple(inputs),
+                      tuple(outputs))
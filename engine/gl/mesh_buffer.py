@@ -0,0 +1,373 @@
+'''
+Many static meshes of one vertex format in one big vertex buffer and one
+element buffer, drawn through a single VAO.
+
+A model's own VAO and VBO mean a VAO bind per draw. Packed into a
+MeshBuffer, every model of a format draws from the same VAO at its own
+offset (glDrawArrays with a first vertex, glDrawElementsBaseVertex with a
+base vertex), so consecutive draws bind nothing, and several models can go
+in one glMultiDrawArrays or glMultiDrawElementsBaseVertex call.
+
+Space is handed out first fit from a free list. Freed ranges merge with
+their neighbours; when no range is big enough the buffer is compacted if
+that would make room, and doubled in size otherwise. Changes are written to
+a copy of the buffer in memory and only the changed ranges are uploaded,
+on the next bind.
+'''
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL import glDrawElementsBaseVertex, glMultiDrawArrays, \
+    glMultiDrawElementsBaseVertex
+from OpenGL.arrays.vbo import VBO
+from .stream_buffer import _merge
+from .utils import ReprMixin
+from .vao import INSTANCE_PREFIX, VAO, _pointer_args
+
+INDEX_SIZE = np.dtype(np.uint32).itemsize
+
+
+class FreeList(ReprMixin):
+    "First fit allocation of ranges in [0, capacity)."
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.ranges = [[0, capacity]] if capacity else []  # [start, size]
+
+    @property
+    def free(self):
+        return sum(size for start, size in self.ranges)
+
+    def allocate(self, size):
+        "The start of a free range of size, or None if none is big enough."
+        for i, (start, free) in enumerate(self.ranges):
+            if free >= size:
+                if free == size:
+                    del self.ranges[i]
+                else:
+                    self.ranges[i] = [start + size, free - size]
+                return start
+        return None
+
+    def release(self, start, size):
+        "Frees a range, merging it with free neighbours."
+        if not size:
+            return
+        i = 0
+        while i < len(self.ranges) and self.ranges[i][0] < start:
+            i += 1
+        self.ranges.insert(i, [start, size])
+        if i + 1 < len(self.ranges) and start + size == self.ranges[i + 1][0]:
+            self.ranges[i][1] += self.ranges.pop(i + 1)[1]
+        if i and sum(self.ranges[i - 1]) == start:
+            self.ranges[i - 1][1] += self.ranges.pop(i)[1]
+
+    def grow(self, capacity):
+        self.release(self.capacity, capacity - self.capacity)
+        self.capacity = capacity
+
+    def reset(self, used):
+        "Everything below used is taken and the rest is free."
+        self.ranges = [[used, self.capacity - used]] \
+            if used < self.capacity else []
+
+
+class Allocation(ReprMixin):
+    '''
+    Where one mesh lives in a MeshBuffer: count vertices from first, and
+    index_count indices from index_first if it's indexed. Compacting moves
+    allocations, so read these when drawing rather than keeping copies.
+    '''
+    def __init__(self, first, count, index_first=None, index_count=0):
+        self.first = first
+        self.count = count
+        self.index_first = index_first
+        self.index_count = index_count
+
+    @property
+    def indexed(self):
+        return self.index_first is not None
+
+
+def _floats(locations):
+    "Floats per vertex for the shader inputs at locations."
+    args = _pointer_args({loc: var for loc, var in locations.items()})
+    return args[0][4] // ctypes.sizeof(ctypes.c_float) if args else 0
+
+
+class MeshBuffer(ReprMixin):
+    '''
+    A vertex buffer and an element buffer shared by the meshes of one
+    vertex format, with one VAO. Use for_format to share one between all
+    pipelines whose vertex shaders take the same inputs.
+    '''
+    # One per vertex format; see for_format.
+    _shared = {}
+
+    def __init__(self, locations, capacity=1 << 16, index_capacity=1 << 16):
+        '''
+        :param locations: The vertex shader's VAO_locations.
+        :param capacity: Vertices to make room for at first.
+        :param index_capacity: Indices to make room for at first.
+        '''
+        self.locations = {loc: var for loc, var in locations.items()
+                          if not var.name.startswith('instance_')}
+        self.floats = _floats(self.locations)
+        self.vertices = np.zeros((capacity, self.floats), 'f')
+        self.indices = np.zeros(index_capacity, np.uint32)
+        self.vbo = VBO(self.vertices, usage=GL_STATIC_DRAW,
+                       target=GL_ARRAY_BUFFER)
+        self.ibo = VBO(self.indices, usage=GL_STATIC_DRAW,
+                       target=GL_ELEMENT_ARRAY_BUFFER)
+        self._vertex_space = FreeList(capacity)
+        self._index_space = FreeList(index_capacity)
+        # Row ranges written since the buffer's last upload, per buffer.
+        self._dirty = {self.vbo: [], self.ibo: []}
+        self.allocations = []
+        self.vao = None  # made on the first bind, which needs a context
+
+    @classmethod
+    def for_format(cls, locations):
+        "The shared MeshBuffer for the vertex format of locations."
+        key = tuple(sorted((loc, var.type) for loc, var in locations.items()
+                           if not var.name.startswith('instance_')))
+        if key not in cls._shared:
+            cls._shared[key] = cls(locations)
+        return cls._shared[key]
+
+    def add(self, vertices, indices=None):
+        '''
+        Copies a mesh into the buffer. Returns its Allocation.
+
+        :param vertices: A float32 array with a row of floats per vertex,
+          interleaved in the order of the shader's input locations.
+        :param indices: Optional element indices into vertices.
+        '''
+        allocation = Allocation(0, 0)
+        self._place(allocation, vertices, indices)
+        return allocation
+
+    def update(self, allocation, vertices, indices=None):
+        '''
+        Replaces a mesh's data, in place if the sizes are the same.
+        The allocation is kept up to date either way.
+        '''
+        vertices = np.asarray(vertices, 'f')
+        if len(vertices) == allocation.count and (
+                (indices is None and not allocation.indexed) or
+                (indices is not None and
+                 np.size(indices) == allocation.index_count)):
+            self._write(self.vbo, allocation.first, vertices)
+            if indices is not None:
+                self._write(self.ibo, allocation.index_first,
+                            np.asarray(indices, np.uint32).reshape(-1))
+            return
+        self.remove(allocation)
+        self._place(allocation, vertices, indices)
+
+    def _place(self, allocation, vertices, indices):
+        vertices = np.asarray(vertices, 'f')
+        if vertices.ndim != 2 or vertices.shape[1] != self.floats:
+            raise ValueError(f"Expected vertices with {self.floats} floats "
+                             f"each, got an array of shape {vertices.shape}.")
+        allocation.first = self._allocate_vertices(len(vertices))
+        allocation.count = len(vertices)
+        allocation.index_first, allocation.index_count = None, 0
+        self._write(self.vbo, allocation.first, vertices)
+        # Listed before the indices are placed, so compacting moves it too.
+        self.allocations.append(allocation)
+        if indices is not None:
+            indices = np.asarray(indices, np.uint32).reshape(-1)
+            allocation.index_first = self._allocate_indices(len(indices))
+            allocation.index_count = len(indices)
+            self._write(self.ibo, allocation.index_first, indices)
+
+    def remove(self, allocation):
+        "Frees a mesh's space."
+        self.allocations.remove(allocation)
+        self._vertex_space.release(allocation.first, allocation.count)
+        if allocation.indexed:
+            self._index_space.release(allocation.index_first,
+                                      allocation.index_count)
+
+    def compact(self):
+        "Moves every mesh down to close the gaps between them."
+        vertex_end = index_end = 0
+        vertices = np.zeros_like(self.vertices)
+        indices = np.zeros_like(self.indices)
+        for allocation in self.allocations:
+            first, count = allocation.first, allocation.count
+            vertices[vertex_end:vertex_end + count] = \
+                self.vertices[first:first + count]
+            allocation.first = vertex_end
+            vertex_end += count
+            if allocation.indexed:
+                first, count = allocation.index_first, allocation.index_count
+                indices[index_end:index_end + count] = \
+                    self.indices[first:first + count]
+                allocation.index_first = index_end
+                index_end += count
+        self.vertices, self.indices = vertices, indices
+        self._replace(self.vbo, vertices)
+        self._replace(self.ibo, indices)
+        self._vertex_space.reset(vertex_end)
+        self._index_space.reset(index_end)
+
+    def _allocate_vertices(self, count):
+        first = self._allocate(self._vertex_space, count)
+        if first is None:
+            self.vertices = self._grown(self.vertices, self._vertex_space,
+                                        count)
+            self._replace(self.vbo, self.vertices)
+            first = self._vertex_space.allocate(count)
+        return first
+
+    def _allocate_indices(self, count):
+        first = self._allocate(self._index_space, count)
+        if first is None:
+            self.indices = self._grown(self.indices, self._index_space,
+                                       count)
+            self._replace(self.ibo, self.indices)
+            first = self._index_space.allocate(count)
+        return first
+
+    def _allocate(self, space, count):
+        first = space.allocate(count)
+        if first is None and space.free >= count:
+            self.compact()  # there's room, only not in one piece
+            first = space.allocate(count)
+        return first
+
+    @staticmethod
+    def _grown(array, space, count):
+        "array at least doubled and big enough for count more rows."
+        capacity = max(2 * len(array), space.capacity - space.free + count)
+        grown = np.zeros((capacity,) + array.shape[1:], array.dtype)
+        grown[:len(array)] = array
+        space.grow(capacity)
+        return grown
+
+    def _replace(self, vbo, array):
+        "Swaps in a new array, all of which is uploaded on the next bind."
+        vbo.set_array(array)
+        self._dirty[vbo] = []
+
+    def _write(self, vbo, first, rows):
+        # Updates the copy in memory and, once the buffer's on the GPU,
+        # queues the range for glBufferSubData on the next bind.
+        if len(rows):
+            vbo.data[first:first + len(rows)] = rows
+            if vbo.copied:
+                self._dirty[vbo].append((first, first + len(rows)))
+
+    def bind(self):
+        '''
+        Binds the VAO unless it's bound already and uploads any changes.
+        Returns the number of GL calls made.
+        '''
+        calls = 0
+        if self.vao is None:
+            self.vao = VAO(self.locations)
+            self.vao.bind()
+            self.vao.add_VBO(self.vbo)
+            self.vao.add_IBO(self.ibo)
+            calls += 4
+        elif VAO.bound is not self.vao:
+            self.vao.bind()
+            calls += 1
+        return calls + self.flush()
+
+    def attach_instances(self, vbo, locations):
+        '''
+        Feeds the instance_* inputs among a shader's locations from vbo, a
+        row per instance, e.g. RenderQueue's per draw data. Shaders that
+        don't read them ignore them. Returns the GL calls made.
+        '''
+        calls = self.bind()
+        self.vao.instance_vptr_args = _pointer_args(
+            {loc: var for loc, var in locations.items()
+             if var.name.startswith(INSTANCE_PREFIX)})
+        self.vao.add_instance_VBO(vbo)
+        return calls + 2 + 3 * len(self.vao.instance_vptr_args)
+
+    def flush(self):
+        '''
+        Uploads changes made since the last flush; the VAO has to be bound.
+        Returns the GL calls made.
+        '''
+        calls = 0
+        for vbo in (self.vbo, self.ibo):
+            ranges = _merge(self._dirty[vbo])
+            if vbo.copied and not ranges:
+                continue
+            vbo.bind()  # uploads all of it if it isn't on the GPU yet
+            calls += 1 + len(ranges)
+            data = vbo.data
+            stride = data[:1].nbytes
+            for start, end in ranges:
+                glBufferSubData(vbo.target, start * stride,
+                                (end - start) * stride, data[start:end])
+            self._dirty[vbo] = []
+        return calls
+
+    def draw(self, allocation, mode):
+        "Draws one mesh. The buffer has to be bound."
+        if allocation.indexed:
+            glDrawElementsBaseVertex(
+                mode, allocation.index_count, GL_UNSIGNED_INT,
+                ctypes.c_void_p(allocation.index_first * INDEX_SIZE),
+                allocation.first)
+        else:
+            glDrawArrays(mode, allocation.first, allocation.count)
+
+    def multi_draw(self, allocations, mode):
+        '''
+        Draws several meshes with one call per kind (indexed or not), e.g.
+        ones that share a model matrix. The buffer has to be bound.
+        Returns the number of draw calls made.
+        '''
+        plain = [a for a in allocations if not a.indexed]
+        indexed = [a for a in allocations if a.indexed]
+        if plain:
+            glMultiDrawArrays(mode,
+                              np.array([a.first for a in plain], np.int32),
+                              np.array([a.count for a in plain], np.int32),
+                              len(plain))
+        if indexed:
+            offsets = (ctypes.c_void_p * len(indexed))(
+                *(a.index_first * INDEX_SIZE for a in indexed))
+            glMultiDrawElementsBaseVertex(
+                mode, np.array([a.index_count for a in indexed], np.int32),
+                GL_UNSIGNED_INT, offsets, len(indexed),
+                np.array([a.first for a in indexed], np.int32))
+        return bool(plain) + bool(indexed)
+
+
+class BufferSlice(ReprMixin):
+    '''
+    Stands in for a model's own VAO when its mesh is in a MeshBuffer, with
+    the bind and draw calls VBOGameLoop.render makes on a VAO.
+    '''
+    def __init__(self, buffer, allocation):
+        self.buffer = buffer
+        self.allocation = allocation
+
+    def bind(self):
+        "Binds the shared VAO unless it's bound. Returns the GL calls made."
+        return self.buffer.bind()
+
+    def unbind(self):
+        self.buffer.vao.unbind()
+
+    def upload(self, vbo, index_buffer=None):
+        '''
+        Copies a model's recompiled vertices into its range and uploads
+        them. Returns the GL calls made.
+        '''
+        self.buffer.update(self.allocation, vbo.data,
+                           None if index_buffer is None else index_buffer.data)
+        # The model's own buffer is never drawn; mark its data as handled.
+        vbo.copied = True
+        return self.buffer.flush()
+
+    def draw(self, mode, count=None, instances=None):
+        self.buffer.draw(self.allocation, mode)
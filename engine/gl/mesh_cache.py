@@ -0,0 +1,218 @@
+'''
+A binary cache for loaded .obj assets.
+
+Parsing a .obj file and compiling it to a VBO is slow, so the compiled
+result is saved next to the asset in a .meshcache directory:
+
+    <name>.json          format string, cache version and source stamps
+    <name>.vertices.npy  the unique interleaved vertices (float32)
+    <name>.indices.npy   an index into the vertices for each drawn vertex
+
+Both arrays are plain .npy files that load with np.load(mmap_mode='r').
+A cache is rebuilt when the cache version, the load options or the
+contents of the .obj file or any .mtl file it references change.
+
+Prebuild the caches for every asset in assets/pingpong.assets with:
+
+    python -m engine.gl.mesh_cache
+'''
+import argparse
+import hashlib
+import json
+import os
+import re
+import numpy as np
+from .obj_loader import OBJ_to_arrays
+from ._drawable.Mesh import Mesh
+from ._drawable.Shape3D import Shape3D
+from .utils import indexing
+
+CACHE_VERSION = 4
+CACHE_DIR = '.meshcache'
+MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', '..', 'assets', 'pingpong.assets')
+
+_MTLLIB = re.compile(rb'^mtllib[ \t]+(.+?)\s*$', re.M)
+
+
+def cache_paths(filename):
+    "Returns the (metadata, vertices, indices) cache paths for an asset."
+    folder, name = os.path.split(os.path.abspath(filename))
+    base = os.path.join(folder, CACHE_DIR, name)
+    return base + '.json', base + '.vertices.npy', base + '.indices.npy'
+
+
+def _sources(filename):
+    "The .obj file followed by the .mtl files it references."
+    folder = os.path.dirname(os.path.abspath(filename))
+    with open(filename, 'rb') as f:
+        libs = _MTLLIB.findall(f.read())
+    return [os.path.abspath(filename)] + \
+        [os.path.join(folder, lib.decode()) for lib in libs]
+
+
+def _stamp(path):
+    "The mtime and size of a source file, or None if it's missing."
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _digest(paths):
+    "A content hash over all source files."
+    sha = hashlib.sha1()
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                sha.update(f.read())
+        except OSError:
+            sha.update(b'\0missing')
+    return sha.hexdigest()
+
+
+def _options(swapyz, gen_normals):
+    return {'swapyz': bool(swapyz), 'gen_normals': bool(gen_normals)}
+
+
+def is_valid(filename, swapyz=False, gen_normals=True):
+    '''
+    True if the cache for filename exists and matches the current sources.
+    Matching mtimes are trusted; if they differ the sources are hashed and
+    the cache is still valid when the contents haven't changed.
+    '''
+    meta_path, vert_path, index_path = cache_paths(filename)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if meta.get('version') != CACHE_VERSION or \
+            meta.get('options') != _options(swapyz, gen_normals) or \
+            not (os.path.exists(vert_path) and os.path.exists(index_path)):
+        return False
+
+    sources = _sources(filename)
+    stamps = [_stamp(path) for path in sources]
+    if meta.get('sources') == sources and meta.get('stamps') == stamps:
+        return True
+    if meta.get('hash') != _digest(sources):
+        return False
+    # Touched but unchanged; refresh the stamps so the next check is cheap.
+    meta['sources'], meta['stamps'] = sources, stamps
+    _write_json(meta_path, meta)
+    return True
+
+
+def _write_json(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, path)
+
+
+def _write_array(path, array):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def build(filename, swapyz=False, gen_normals=True):
+    '''
+    Loads the .obj file, interleaves its vertices and writes its cache.
+    Returns the Mesh it was built from.
+
+    The mesh is made straight from the parsed arrays, with the vertices
+    shared by position only like the faces of OBJ_to_shape, so smooth
+    normals don't split at texture seams.
+    '''
+    sources = _sources(filename)
+    stamps = [_stamp(path) for path in sources]
+    digest = _digest(sources)
+
+    arrays = OBJ_to_arrays(filename, swapyz=swapyz)
+    triangles, _ = indexing.triangulate(arrays.face_sizes)
+    mesh = Mesh(arrays.positions, indices=arrays.corners[:, 0][triangles])
+    if gen_normals:
+        mesh.gen_normals()
+    vertices, indices = indexing.deduplicate(mesh.interleave()[mesh.indices])
+
+    meta_path, vert_path, index_path = cache_paths(filename)
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+    _write_array(vert_path, vertices)
+    _write_array(index_path, indices)
+    _write_json(meta_path, {
+        'version': CACHE_VERSION,
+        'options': _options(swapyz, gen_normals),
+        'format': mesh.VBO_format,
+        'mode': int(mesh.mode),
+        'sources': sources,
+        'stamps': stamps,
+        'hash': digest,
+        })
+    return mesh
+
+
+def load(filename):
+    '''
+    Memory maps an existing cache and returns a tuple of
+    (vertices, indices, format, mode). Doesn't check if it's valid.
+    '''
+    meta_path, vert_path, index_path = cache_paths(filename)
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return (np.load(vert_path, mmap_mode='r'),
+            np.load(index_path, mmap_mode='r'),
+            meta['format'],
+            meta['mode'])
+
+
+def load_shape(filename, swapyz=False, gen_normals=True):
+    '''
+    Loads a .obj file as a compiled Shape3D, (re)building the cache first
+    if it isn't valid. The shape is always made from the cache, so it's
+    indexed and has no faces whether or not the cache was just built.
+
+    :param filename: The path of the .obj file.
+    :param swapyz: Swaps the y and z axes.
+    :param gen_normals: Calls gen_normals on the shape before compiling.
+    '''
+    if not is_valid(filename, swapyz, gen_normals):
+        build(filename, swapyz, gen_normals)
+    vertices, indices, arr_format, mode = load(filename)
+    return Shape3D.from_VBO(vertices, arr_format, mode, indices=indices)
+
+
+def read_manifest(manifest=MANIFEST):
+    "Lists the asset paths in a manifest, relative to the manifest's folder."
+    folder = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest) as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(folder, line) for line in lines
+            if line and not line.startswith('#')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Prebuilds the mesh caches for .obj assets.')
+    parser.add_argument('manifest', nargs='?', default=MANIFEST,
+                        help='asset list, one path per line '
+                             '(default: assets/pingpong.assets)')
+    parser.add_argument('--force', action='store_true',
+                        help='rebuild caches even if they are up to date')
+    args = parser.parse_args(argv)
+
+    for path in read_manifest(args.manifest):
+        if not path.endswith('.obj'):
+            continue
+        if not args.force and is_valid(path):
+            print('up to date', path)
+            continue
+        build(path)
+        print('built     ', path)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,25 @@
 '''.obj file loader from https://www.pygame.org/wiki/OBJFileLoader'''
 
 import pygame
+import numpy as np
+from collections import namedtuple
 from OpenGL.GL import *
-from .drawable import Point3D, Shape2D, Shape3D
+from ._drawable.Point3D import Point3D
+from ._drawable.Shape2D import Shape2D
+from ._drawable.Shape3D import Shape3D
+from ._drawable.Mesh import Mesh
+from .utils import indexing
+
+# Bulk-parsed contents of a .obj file.
+#   positions, texcoords, normals: float32 arrays of shape (n, 3), (n, 2), (n, 3)
+#   corners: int32 array of shape (n, 3) holding zero-based (v, vt, vn)
+#     indices for every face corner, -1 where the element is absent.
+#   face_sizes: int32 array with the number of corners in each face.
+OBJArrays = namedtuple('OBJArrays',
+                       'positions texcoords normals corners face_sizes')
+
+_SPACE, _TAB, _NEWLINE, _RETURN, _SLASH = 32, 9, 10, 13, 47
+_MAX_RUNS = 2048  # see _select_lines
 
 
 def MTL(filename):
@@ -109,6 +126,172 @@ class OBJ:
         glEndList()
 
 
+def _select_lines(buf, starts, lengths, mask, keyword_len):
+    '''
+    Copies the bytes of every line flagged in mask into one contiguous
+    array and blanks out the leading keyword, leaving only the values.
+    '''
+    # Records of a kind usually come in a few long runs of lines, which
+    # are cheaper to copy as slices than to pick out byte by byte.
+    edges = np.flatnonzero(np.diff(mask, prepend=False, append=False))
+    if len(edges) <= _MAX_RUNS:
+        bounds = np.append(starts - starts[0], len(buf))[edges]
+        body = np.concatenate([buf[start:end] for start, end
+                               in zip(bounds[::2], bounds[1::2])] or
+                              [buf[:0]])
+    else:
+        body = buf[np.repeat(mask, lengths)]
+    heads = np.cumsum(lengths[mask]) - lengths[mask]
+    for i in range(keyword_len):
+        body[heads + i] = _SPACE
+    return body, heads
+
+
+def _parse_floats(body, rows, width):
+    "Parses the values in body into a (rows, width) float32 array."
+    if not rows:
+        return np.zeros((0, width), 'f')
+    try:
+        values = np.fromstring(body.tobytes(), dtype='f', sep=' ')
+    except ValueError:
+        values = None
+    if values is None or values.size != rows * width:
+        # Some lines carry optional extra components (v x y z w, vt u v w).
+        values = [line.split()[:width]
+                  for line in body.tobytes().split(b'\n') if line.strip()]
+    return np.array(values, 'f').reshape(rows, width)
+
+
+def _parse_corners(body, heads):
+    '''
+    Parses the face records in body into an (n, 3) array of raw .obj
+    (v, vt, vn) indices, with 0 marking an absent element, and returns
+    it along with the number of corners in each face.
+    '''
+    if not heads.size:
+        return np.zeros((0, 3), np.int64), np.zeros(0, np.int32)
+    blank = ((body == _SPACE) | (body == _TAB) |
+             (body == _NEWLINE) | (body == _RETURN))
+    token_starts = np.flatnonzero(~blank[1:] & blank[:-1]) + 1
+    face_sizes = np.diff(np.searchsorted(token_starts, heads),
+                         append=token_starts.size).astype(np.int32)
+    count = int(face_sizes.sum())
+
+    # Every corner in a file almost always shares one format: v, v/t,
+    # v/t/n or v//n. Detect it from the first corner and check every
+    # corner's slashes agree before taking the vectorized path.
+    end = heads[1] if heads.size > 1 else body.size
+    first = body[:end].tobytes().split(None, 1)[0] if count else b''
+    slashes = np.flatnonzero(body == _SLASH)
+    per_corner = first.count(b'/')
+    skips_tex = b'//' in first
+    uniform = slashes.size == per_corner * count
+    if uniform and per_corner:
+        # The i-th slash has to fall in corner i // per_corner, and the two
+        # slashes of a corner are only next to each other in v//n.
+        corner = np.arange(slashes.size) // per_corner
+        ends = np.append(token_starts[1:], body.size)
+        uniform = bool((slashes > token_starts[corner]).all() and
+                       (slashes < ends[corner]).all())
+        if uniform and per_corner == 2:
+            uniform = bool(((slashes[1::2] - slashes[::2] == 1) ==
+                            skips_tex).all())
+    if uniform:
+        body[slashes] = _SPACE
+        values = np.fromstring(body.tobytes(), dtype=np.int64, sep=' ')
+        corners = np.zeros((count, 3), np.int64)
+        if skips_tex:
+            columns = [0, 2]
+        else:
+            columns = list(range(per_corner + 1))
+        corners[:, columns] = values.reshape(count, len(columns))
+    else:
+        corners = np.zeros((count, 3), np.int64)
+        for i, token in enumerate(body.tobytes().split()):
+            for j, item in enumerate(token.split(b'/')[:3]):
+                if item:
+                    corners[i, j] = int(item)
+    return corners, face_sizes
+
+
+def OBJ_to_arrays(filename, swapyz=False, suppress_not_implemented=True):
+    '''
+    Loads a wavefront file straight into NumPy arrays and returns an
+    OBJArrays tuple. The whole file is read at once and every record type
+    is parsed in bulk instead of line by line.
+
+    Face indices are converted to zero-based indices. Negative (relative)
+    indices and the v, v/t, v/t/n and v//n corner forms are supported.
+
+    :param filename: The absolute path of the file to load.
+    :param swapyz: Swaps the y and z axes.
+    :param suppress_not_implemented: See OBJ_to_shape.
+    '''
+    with open(filename, 'rb') as f:
+        data = f.read()
+    size = len(data)
+    # Pad so the keyword lookahead below never reads past the end.
+    buf = np.frombuffer(data + b'\n\n\n', np.uint8)
+
+    starts = np.flatnonzero(buf[:size] == _NEWLINE) + 1
+    starts = np.concatenate(([0], starts[starts < size]))
+    indented = (buf[starts] == _SPACE) | (buf[starts] == _TAB)
+    if indented.any():
+        # Classify indented lines by their first word, like line.split().
+        filled = np.flatnonzero((buf != _SPACE) & (buf != _TAB))
+        starts[indented] = filled[np.searchsorted(filled,
+                                                  starts[indented])]
+    lengths = np.diff(np.append(starts, size))
+    text = buf[starts[0]:size]
+    c0, c1, c2 = buf[starts], buf[starts + 1], buf[starts + 2]
+    sep1 = (c1 == _SPACE) | (c1 == _TAB)
+    sep2 = (c2 == _SPACE) | (c2 == _TAB)
+    is_v = (c0 == ord('v')) & sep1
+    is_vt = (c0 == ord('v')) & (c1 == ord('t')) & sep2
+    is_vn = (c0 == ord('v')) & (c1 == ord('n')) & sep2
+    is_f = (c0 == ord('f')) & sep1
+
+    if not suppress_not_implemented:
+        for i in np.flatnonzero(~(is_v | is_vt | is_vn | is_f)):
+            values = data[starts[i]:starts[i] + lengths[i]].split()
+            if not values or values[0].startswith(b'#'):
+                continue
+            if values[0] not in (b'usemtl', b'usemat'):
+                raise NotImplementedError(
+                    f"Unable to parse .obj files with {values[0].decode()}\
+                        elements. To suppress this warning, pass \
+                        suppress_not_implemented=True.")
+
+    body, _ = _select_lines(text, starts, lengths, is_v, 1)
+    positions = _parse_floats(body, int(is_v.sum()), 3)
+    body, _ = _select_lines(text, starts, lengths, is_vt, 2)
+    texcoords = _parse_floats(body, int(is_vt.sum()), 2)
+    body, _ = _select_lines(text, starts, lengths, is_vn, 2)
+    normals = _parse_floats(body, int(is_vn.sum()), 3)
+    if swapyz:
+        positions = positions[:, [0, 2, 1]]
+        normals = normals[:, [0, 2, 1]]
+
+    body, heads = _select_lines(text, starts, lengths, is_f, 1)
+    corners, face_sizes = _parse_corners(body, heads)
+
+    # Positive indices are 1-based, negative ones count back from the
+    # number of elements declared before the face, 0 means absent.
+    resolved = corners - 1
+    relative = corners < 0
+    if relative.any():
+        for column, declared in enumerate((is_v, is_vt, is_vn)):
+            before = np.cumsum(declared)[is_f]
+            before = np.repeat(before, face_sizes)
+            resolved[:, column] = np.where(relative[:, column],
+                                           before + corners[:, column],
+                                           resolved[:, column])
+    resolved[corners == 0] = -1
+
+    return OBJArrays(positions, texcoords, normals,
+                     resolved.astype(np.int32), face_sizes)
+
+
 def OBJ_to_shape(filename, swapyz=False, suppress_not_implemented=True):
     '''
     Loads a wavefront file and returns a Shape3D.
@@ -122,97 +305,50 @@ def OBJ_to_shape(filename, swapyz=False, suppress_not_implemented=True):
       potentially detect invalid .obj files.
     '''
 
-    # TODO: Add additonal support for .obj files.
     # TODO: Add material support to the Shape2D class.
+    arrays = OBJ_to_arrays(filename, swapyz, suppress_not_implemented)
 
-    # These functions handle one declaration in the obj file.
-    # example: 'v .1 .2 .3' calls addVertex('v', '.1', '.2', '.3')
-
-    def addVertex(state, values):
-        v = map(float, values[1:4])
-        if swapyz:
-            v = (v[0], v[2], v[1])
-        state['points'].append(Point3D(*v))
-
-    def addNormal(state, values):
-        v = map(float, values[1:4])
-        if state['swapyz']:
-            v = v[0], v[2], v[1]
-        state['normals'].append(v)
-
-    def addTexture(state, values):
-        state['texcoords'].append(map(float, values[1:3]))
-
-    def setMaterial(state, values):
-        state['curmat'] = values[1]
-
-    def setMTL(state, values):
-        state['mtl'] = MTL(values[1])
-
-    def addPolygon(state, values):
-        pcoords = []
-        texcoords = []
-        tex_arg = None
-        norms = []
-        norms_arg = None
-        for v in values[1:]:
-            # Split the vert/texture/normal triplet into the elements,
-            # which refer to the index of their corresponding point object.
-            items = v.split('/')
-            items = [int(i) for i in items]
-            pcoords.append(state['points'][items[0] - 1])
-            if len(items) >= 2:
-                texcoords.append(state['texcoords'][items[1] - 1])
-                tex_arg = texcoords
-            if len(items) >= 3:
-                norms.append(state['normals'][items[2] - 1])
-                norms_arg = norms
-        state['shapes'].append(
-            Shape2D(pcoords,
-                    texcoords=tex_arg,
-                    normal=norms_arg,
-                    mode=GL_POLYGON
-                    ))
-
-    state = {
-        'points': [],
-        'normals': [],
-        'texcoords': [],
-        'shapes': [],
-        'curmat': None,  # the currently selected material
-        'swapyz': swapyz
-    }
-
-    calls = {  # 'a': b means b is called for lines starting with 'a'.
-        'v': addVertex,
-        'vn': addNormal,
-        'vt': addTexture,
-        'usemtl': setMaterial,
-        'usemat': setMaterial,
-        'f': addPolygon}
-
-    with open(filename, "r") as f:
-        for line in f:
-            if line.startswith('#'):  # line is a comment
-                continue
-            values = line.split()
-            if not values:  # line is blank
-                continue
+    points = [Point3D(*v) for v in arrays.positions.tolist()]
+    vertex_ids = arrays.corners[:, 0].tolist()
+    ends = np.cumsum(arrays.face_sizes).tolist()
+    shapes = []
+    start = 0
+    for end in ends:
+        shapes.append(
+            Shape2D([points[i] for i in vertex_ids[start:end]],
+                    mode=GL_POLYGON))
+        start = end
+    return Shape3D(shapes, color=(.5, .5, .5))
+
+
+def OBJ_to_mesh(filename, swapyz=False, suppress_not_implemented=True):
+    '''
+    Loads a wavefront file and returns an indexed Mesh. Polygons are
+    triangulated and every distinct v/vt/vn combination becomes a vertex.
+
+    See OBJ_to_shape for the parameters.
+    '''
+    arrays = OBJ_to_arrays(filename, swapyz, suppress_not_implemented)
+    # Pack each (v, vt, vn) triplet into one integer so np.unique can work
+    # on a flat array, which is much faster than unique rows.
+    corners = arrays.corners.astype(np.int64) + 1
+    spans = np.array([len(arrays.texcoords) + 1, len(arrays.normals) + 1])
+    keys = (corners[:, 0] * spans[0] + corners[:, 1]) * spans[1] + \
+        corners[:, 2]
+    keys, first, indices = np.unique(keys, return_index=True,
+                                     return_inverse=True)
+    unique = arrays.corners[first]
+    triangles, _ = indexing.triangulate(arrays.face_sizes)
+    indices = indices.reshape(-1)[triangles]
+
+    def gather(values, column):
+        ids = unique[:, column]
+        if not len(values) or (ids < 0).any():
+            return None
+        return values[ids]
 
-            # call appropriate function
-            try:
-                calls[values[0]](state, values)
-            except KeyError:
-                if not suppress_not_implemented:
-                    raise NotImplementedError(
-                        f"Unable to parse .obj files with {values[0]} elements.\
-                            To suppress this warning, pass \
-                            suppress_not_implemented=True."
-                        )
-
-    normsarg, texarg = False, False
-    if len(state['normals']):
-        normsarg = True
-    if len(state['texcoords']):
-        texarg = True
-    return Shape3D(state['shapes'], color=(.5,.5,.5))
+    return Mesh(arrays.positions[unique[:, 0]],
+                normals=gather(arrays.normals, 2),
+                texcoords=gather(arrays.texcoords, 1),
+                indices=indices,
+                color=(.5, .5, .5))
@@ -0,0 +1,154 @@
+'''
+Offscreen rendering without a window, through EGL. On Linux machines
+without a GPU, Mesa's llvmpipe renders on the CPU, so the render path can be
+run and timed in CI.
+
+PyOpenGL picks its platform when OpenGL is first imported, so import this
+module before anything else that imports OpenGL (e.g. engine.gl.shader), or
+set PYOPENGL_PLATFORM=egl in the environment:
+
+    from engine.gl.offscreen import OffscreenContext
+    with OffscreenContext(800, 600) as context:
+        ...  # build shaders and pipelines
+        loop.benchmark(context, frames=300)
+'''
+import ctypes
+import os
+import sys
+
+if 'OpenGL' not in sys.modules:
+    os.environ.setdefault('PYOPENGL_PLATFORM', 'egl')
+
+import numpy as np
+from OpenGL import EGL
+from OpenGL.GL import *
+from .utils import ReprMixin
+
+# From EGL_MESA_platform_surfaceless: a display that needs no window system.
+EGL_PLATFORM_SURFACELESS_MESA = 0x31DD
+
+
+class OffscreenError(RuntimeError):
+    pass
+
+
+def _surfaceless_display():
+    "A Mesa surfaceless display if there is one, else the default display."
+    extensions = EGL.eglQueryString(EGL.EGL_NO_DISPLAY, EGL.EGL_EXTENSIONS)
+    if extensions and b'EGL_MESA_platform_surfaceless' in extensions:
+        from OpenGL.EGL.EXT.platform_base import eglGetPlatformDisplayEXT
+        return eglGetPlatformDisplayEXT(EGL_PLATFORM_SURFACELESS_MESA,
+                                        None, None)
+    return EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+
+
+def _attributes(*pairs):
+    values = [value for pair in pairs for value in pair] + [EGL.EGL_NONE]
+    return (EGL.EGLint * len(values))(*values)
+
+
+class OffscreenContext(ReprMixin):
+    '''
+    An OpenGL compatibility profile context with no window, drawing into a
+    framebuffer object of the given size.
+
+    It stands in for the pygame display: VBOGameLoop.GLsetup reads its size,
+    and VBOGameLoop.render calls its flip instead of pygame.display.flip.
+    '''
+    def __init__(self, width=800, height=600, version=(4, 2)):
+        '''
+        :param version: The OpenGL version to ask for; the shaders need 4.2.
+        '''
+        platform = os.environ.get('PYOPENGL_PLATFORM')
+        if platform != 'egl':
+            raise OffscreenError(
+                f"PyOpenGL is using the {platform or 'default'} platform. "
+                "Import engine.gl.offscreen before OpenGL, or set "
+                "PYOPENGL_PLATFORM=egl.")
+        self.width, self.height = width, height
+        self._display = _surfaceless_display()
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        try:
+            EGL.eglInitialize(self._display, ctypes.pointer(major),
+                              ctypes.pointer(minor))
+        except EGL.EGLError as e:
+            raise OffscreenError("Couldn't initialize EGL.") from e
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+
+        config, count = EGL.EGLConfig(), EGL.EGLint()
+        EGL.eglChooseConfig(
+            self._display,
+            _attributes((EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT),
+                        (EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT)),
+            ctypes.pointer(config), 1, ctypes.pointer(count))
+        if not count.value:
+            raise OffscreenError("EGL has no config for desktop OpenGL.")
+        self._context = EGL.eglCreateContext(
+            self._display, config, EGL.EGL_NO_CONTEXT, _attributes(
+                (EGL.EGL_CONTEXT_MAJOR_VERSION, version[0]),
+                (EGL.EGL_CONTEXT_MINOR_VERSION, version[1]),
+                (EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK,
+                 EGL.EGL_CONTEXT_OPENGL_COMPATIBILITY_PROFILE_BIT)))
+        if not self._context:
+            raise OffscreenError(
+                f"Couldn't create an OpenGL {version[0]}.{version[1]} "
+                "context.")
+        # No surface: everything is drawn into the framebuffer below.
+        EGL.eglMakeCurrent(self._display, EGL.EGL_NO_SURFACE,
+                           EGL.EGL_NO_SURFACE, self._context)
+        self.renderer = glGetString(GL_RENDERER).decode()
+
+        self.framebuffer = glGenFramebuffers(1)
+        self._renderbuffers = glGenRenderbuffers(2)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        for renderbuffer, storage, attachment in zip(
+                self._renderbuffers, (GL_RGBA8, GL_DEPTH_COMPONENT24),
+                (GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT)):
+            glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer)
+            glRenderbufferStorage(GL_RENDERBUFFER, storage, width, height)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment,
+                                      GL_RENDERBUFFER, renderbuffer)
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != \
+                GL_FRAMEBUFFER_COMPLETE:
+            raise OffscreenError("The framebuffer is incomplete.")
+        glViewport(0, 0, width, height)
+
+    # The parts of a pygame display surface the game loop uses.
+    def get_width(self):
+        return self.width
+
+    def get_height(self):
+        return self.height
+
+    def get_size(self):
+        return self.width, self.height
+
+    def flip(self):
+        "Ends a frame: waits until it's drawn, as a buffer swap would."
+        glFinish()
+
+    def read_pixels(self):
+        "The framebuffer as an (height, width, 4) RGBA array, top row first."
+        glReadBuffer(GL_COLOR_ATTACHMENT0)
+        data = glReadPixels(0, 0, self.width, self.height, GL_RGBA,
+                            GL_UNSIGNED_BYTE)
+        pixels = np.frombuffer(data, np.uint8)
+        return pixels.reshape(self.height, self.width, 4)[::-1]
+
+    def close(self):
+        if self._context is None:
+            return
+        glDeleteRenderbuffers(2, self._renderbuffers)
+        glDeleteFramebuffers(1, [self.framebuffer])
+        EGL.eglMakeCurrent(self._display, EGL.EGL_NO_SURFACE,
+                           EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+        EGL.eglDestroyContext(self._display, self._context)
+        EGL.eglTerminate(self._display)
+        self._context = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,160 @@
+'''
+An on-disk cache of linked shader programs.
+
+Compiling and linking GLSL, then asking the driver where every uniform and
+attribute ended up, is most of the time it takes to build a Pipeline. With
+a warm cache the linked program is handed straight back to the driver with
+glProgramBinary and the locations are read from the cache, so no shader is
+compiled at all. Each program is saved as:
+
+    <key>.json  cache version, binary format and the reflected locations
+    <key>.bin   the program binary from glGetProgramBinary
+
+The key hashes the shader sources with the GL vendor, renderer and version
+strings, as a binary only loads on the driver that made it. A driver may
+still reject a binary, e.g. after an update that kept its version string;
+then the program is linked from source and the cache rewritten. Drivers
+with no binary formats, e.g. Mesa with its own shader cache switched off,
+link every time.
+
+The cache lives in $PINGPONG_PROGRAM_CACHE, or else in
+$XDG_CACHE_HOME/pingpong/programs (~/.cache/pingpong/programs).
+'''
+import ctypes
+import hashlib
+import json
+import os
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+
+CACHE_VERSION = 2
+ENVIRONMENT = 'PINGPONG_PROGRAM_CACHE'
+
+
+def cache_dir():
+    "The folder the programs are cached in."
+    folder = os.environ.get(ENVIRONMENT)
+    if folder:
+        return folder
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'pingpong', 'programs')
+
+
+def supported():
+    "True if the current context can save and load program binaries."
+    return glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+
+
+def _driver():
+    return [(glGetString(name) or b'').decode()
+            for name in (GL_VENDOR, GL_RENDERER, GL_VERSION)]
+
+
+def cache_key(*sources):
+    "A key for the program linked from sources on the current driver."
+    sha = hashlib.sha1(str(CACHE_VERSION).encode())
+    for part in _driver() + list(sources):
+        sha.update(part.encode())
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def cache_paths(key, folder=None):
+    "Returns the (metadata, binary) cache paths for a key."
+    base = os.path.join(folder or cache_dir(), key)
+    return base + '.json', base + '.bin'
+
+
+def link(*compiled_shaders):
+    '''
+    Links compiled shaders into a program that can be saved with save.
+    Like shaders.compileProgram, but asks the driver to keep the binary.
+    '''
+    program = glCreateProgram()
+    glProgramParameteri(program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
+    for shader in compiled_shaders:
+        glAttachShader(program, shader)
+    glLinkProgram(program)
+    if glGetProgramiv(program, GL_LINK_STATUS) != GL_TRUE:
+        log = glGetProgramInfoLog(program)
+        glDeleteProgram(program)
+        raise shaders.ShaderLinkError(f"Link failure: {log}")
+    for shader in compiled_shaders:
+        glDetachShader(program, shader)
+    return program
+
+
+def load(key, folder=None):
+    '''
+    Loads a cached program. Returns (program, reflection), where
+    reflection is the dict passed to save, or None if the program isn't
+    cached or the driver rejects the binary.
+    '''
+    meta_path, binary_path = cache_paths(key, folder)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        with open(binary_path, 'rb') as f:
+            binary = f.read()
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_VERSION:
+        return None
+
+    program = glCreateProgram()
+    try:
+        glProgramBinary(program, meta['format'], binary, len(binary))
+        linked = glGetProgramiv(program, GL_LINK_STATUS) == GL_TRUE
+    except GLError:
+        linked = False
+    if not linked:
+        glDeleteProgram(program)
+        return None
+    return program, meta['reflection']
+
+
+def save(key, program, reflection, folder=None):
+    '''
+    Writes a linked program and its reflection, a JSON serializable dict,
+    to the cache. Returns False if the driver has no binary to give or the
+    cache can't be written.
+    '''
+    length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+    if not length:
+        return False
+    binary = np.empty(length, np.uint8)
+    written, binary_format = GLsizei(), GLenum()
+    glGetProgramBinary(program, length, ctypes.byref(written),
+                       ctypes.byref(binary_format),
+                       binary.ctypes.data_as(ctypes.c_void_p))
+
+    meta_path, binary_path = cache_paths(key, folder)
+    try:
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        tmp = binary_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(binary[:written.value].tobytes())
+        os.replace(tmp, binary_path)
+        # The metadata goes last so a half written cache is never loaded.
+        tmp = meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': CACHE_VERSION,
+                       'format': binary_format.value,
+                       'driver': _driver(),
+                       'reflection': reflection}, f, indent=1)
+        os.replace(tmp, meta_path)
+    except OSError:
+        return False
+    return True
+
+
+def clear(folder=None):
+    "Deletes every cached program."
+    folder = folder or cache_dir()
+    if not os.path.isdir(folder):
+        return
+    for name in os.listdir(folder):
+        if name.endswith(('.json', '.bin')):
+            os.remove(os.path.join(folder, name))
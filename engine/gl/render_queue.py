@@ -0,0 +1,298 @@
+'''
+A frame's draws sorted by the GL state they need, with runs that share it
+merged into multi draw calls.
+
+Each visible model is one draw item. Its state goes into a 64 bit sort
+key: the pipeline, the VAO or MeshBuffer, whether it's indexed and its
+material, then its distance from the camera. Opaque draws sort by state
+first and front to back within it, so the depth test rejects hidden
+fragments early; transparent ones sort back to front first, after every
+opaque draw, so they blend in the right order. The keys are sorted with an
+LSD radix sort on 16 bit digits, NumPy's stable sort for uint16 being a
+counting sort, and digits that are the same for every key are skipped.
+
+Consecutive draws from one MeshBuffer with one pipeline become a single
+glMultiDrawArraysIndirect or glMultiDrawElementsIndirect call. Every
+command's base instance picks a row of per draw data, the model matrix and
+a color tint laid out like Instances, which the vertex shader's INSTANCED
+variant reads through its instance_* inputs. Without GL 4.3 the runs are
+still sorted, but drawn one model at a time.
+'''
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL import glMultiDrawArraysIndirect, glMultiDrawElementsIndirect
+from OpenGL.arrays.vbo import VBO
+from .mesh_buffer import BufferSlice
+from .utils import ReprMixin, bounds
+
+# Sort key fields, from the low bit up. Opaque keys are
+# state << DEPTH_BITS | depth, transparent ones put the depth above the
+# state, inverted. Ids wider than their field wrap around, which only
+# makes the sort group less well; runs are found from the real state.
+DEPTH_BITS = 32
+MATERIAL_BITS = 10
+INDEXED_BITS = 1
+BUFFER_BITS = 12
+PIPELINE_BITS = 8
+STATE_BITS = MATERIAL_BITS + INDEXED_BITS + BUFFER_BITS + PIPELINE_BITS
+TRANSPARENT = np.uint64(1 << 63)
+
+# Below this many keys one np.argsort is quicker than the radix passes.
+RADIX_MIN = 4096
+
+# A draw command: count, instance count, first (vertex or index), then
+# base vertex and base instance for elements, or base instance and an
+# unused word for arrays, so both kinds share one stride.
+COMMAND = np.dtype((np.uint32, 5))
+# Floats per draw in the per draw data: a mat4 and a vec3 color tint.
+ROW_FLOATS = 19
+
+
+def radix_argsort(keys):
+    '''
+    The indices that sort an array of uint64 keys, like np.argsort with
+    kind='stable'.
+    '''
+    keys = np.asarray(keys, np.uint64)
+    if len(keys) < RADIX_MIN:
+        return np.argsort(keys, kind='stable')
+    order = np.arange(len(keys))
+    for shift in range(0, 64, 16):
+        digits = ((keys >> np.uint64(shift)) & np.uint64(0xffff)).astype(
+            np.uint16)[order]
+        if digits.min() != digits.max():
+            order = order[np.argsort(digits, kind='stable')]
+    return order
+
+
+def sort_keys(pipelines, buffers, indexed, materials, depths, transparent):
+    '''
+    The sort key of each draw, from arrays of small integer ids, the
+    distance in front of the camera and whether it's transparent.
+    '''
+    def field(ids, bits):
+        return np.asarray(ids, np.uint64) & np.uint64((1 << bits) - 1)
+
+    state = field(pipelines, PIPELINE_BITS)
+    for ids, bits in ((buffers, BUFFER_BITS), (indexed, INDEXED_BITS),
+                      (materials, MATERIAL_BITS)):
+        state = state << np.uint64(bits) | field(ids, bits)
+    # Positive floats order like their bits; anything behind the camera
+    # counts as 0.
+    depths = np.asarray(depths, np.float32)
+    depth = np.where(depths > 0, depths, np.float32(0)).view(np.uint32) \
+        .astype(np.uint64)
+    opaque = state << np.uint64(DEPTH_BITS) | depth
+    back_to_front = TRANSPARENT | \
+        (np.uint64(0xffffffff) - depth) << np.uint64(STATE_BITS) | state
+    return np.where(np.asarray(transparent, bool), back_to_front, opaque)
+
+
+class RenderQueue(ReprMixin):
+    '''
+    Collects a frame's draws from every pipeline, sorts them and draws
+    them. Per frame: clear, submit the visible models of each pipeline,
+    sort, then draw the opaque ones and afterwards the transparent ones.
+
+    Models are transparent if they have a true transparent attribute, and
+    draws with the same material attribute are kept together.
+    '''
+    def __init__(self, batching=True):
+        '''
+        :param batching: Merge draws from one MeshBuffer into multi draw
+          calls where the pipeline has an INSTANCED variant.
+        '''
+        self.batching = batching
+        self._rows = self._commands = None  # made on the first draw
+        self._indirect = None  # multi draw indirect support, once known
+        self.clear()
+
+    def clear(self):
+        "Forgets the last frame's draws."
+        self.items = []  # (pipeline, vao, vbo, mode, index_buffer)
+        self._matrices = []
+        self._ids = [], [], [], [], []  # see submit
+        self._state_ids = {}
+        self.order = np.zeros(0, np.intp)
+        self.runs = []
+        self._split = 0
+        self._uploaded = False
+
+    def _state_id(self, kind, value):
+        "A small int per pipeline, buffer and material seen this frame."
+        key = (kind, id(value))
+        ids = self._state_ids.get(key)
+        if ids is None:
+            ids = self._state_ids[key] = len(self._state_ids)
+        return ids
+
+    def submit(self, pipeline, models_and_VAOs, matrices):
+        '''
+        Queues models to draw with pipeline.
+
+        :param models_and_VAOs: (model, VAO or BufferSlice) pairs, as in
+          Pipeline._models_and_VAOs.
+        :param matrices: The model matrix to draw each with, glm.mat4s.
+        '''
+        pipeline_ids, buffers, indexed, materials, transparent = self._ids
+        pipeline_id = self._state_id('pipeline', pipeline)
+        for mdl, vao in models_and_VAOs:
+            vbo, mode = mdl.render_data
+            buffer = vao.buffer if isinstance(vao, BufferSlice) else vao
+            self.items.append((pipeline, vao, vbo, mode,
+                               getattr(mdl, 'index_buffer', None)))
+            pipeline_ids.append(pipeline_id)
+            buffers.append(self._state_id(mode, buffer))
+            indexed.append(vao.IBO is not None
+                           if not isinstance(vao, BufferSlice)
+                           else vao.allocation.indexed)
+            material = getattr(mdl, 'material', None)
+            materials.append(0 if material is None
+                             else self._state_id('material', material))
+            transparent.append(bool(getattr(mdl, 'transparent', False)))
+        self._matrices.extend(matrices)
+
+    def sort(self, view):
+        '''
+        Orders the queued draws and finds the runs that can be drawn
+        together.
+
+        :param view: The camera's view matrix, a glm.mat4.
+        '''
+        if not self.items:
+            return
+        pipeline_ids, buffers, indexed, materials, transparent = \
+            (np.array(ids) for ids in self._ids)
+        self.matrices = bounds.matrix_array(self._matrices)
+        v = bounds.matrix_array([view])[0]
+        # The model origin's distance along the view direction.
+        depths = -(self.matrices[:, 3, :3] @ v[:3, 2] + v[3, 2])
+        order = radix_argsort(sort_keys(pipeline_ids, buffers, indexed,
+                                        materials, depths, transparent))
+
+        # Draws that can share a multi draw get the same group; the rest
+        # one each.
+        count = len(self.items)
+        batched = np.array([
+            self.batching and isinstance(vao, BufferSlice) and
+            pipeline.instanced_variant() is not None
+            for pipeline, vao, *_ in self.items], bool)
+        groups = np.where(batched, pipeline_ids.astype(np.int64) << 32 |
+                          buffers.astype(np.int64) << 1 | indexed,
+                          -1 - np.arange(count))[order]
+        self._split = count - int(transparent.sum())
+        starts = np.flatnonzero(groups[1:] != groups[:-1]) + 1
+        edges = np.unique(np.concatenate(([0], starts, [self._split, count])))
+        self.runs = [(int(start), int(end), bool(batched[order[start]]))
+                     for start, end in zip(edges[:-1], edges[1:])]
+        self.order = order
+        self._uploaded = False
+
+    def _upload(self):
+        "Uploads changed models, per draw data and commands for the frame."
+        calls = 0
+        for pipeline, vao, vbo, mode, index_buffer in self.items:
+            if not vbo.copied:
+                calls += vao.bind() + vao.upload(vbo, index_buffer)
+        if self._indirect is None:
+            self._indirect = bool(glMultiDrawArraysIndirect) and \
+                bool(glMultiDrawElementsIndirect)
+        self._uploaded = True
+        if not self._indirect or not any(batch for *_, batch in self.runs):
+            return calls
+
+        rows = np.ones((len(self.order), ROW_FLOATS), 'f')
+        rows[:, :16] = self.matrices[self.order].reshape(-1, 16)
+        commands = np.zeros(len(self.order), COMMAND)
+        commands[:, 1] = 1  # one instance each
+        for slot, item in enumerate(self.order):
+            vao = self.items[item][1]
+            if isinstance(vao, BufferSlice):
+                allocation = vao.allocation
+                if allocation.indexed:
+                    commands[slot, 0] = allocation.index_count
+                    commands[slot, 2] = allocation.index_first
+                    commands[slot, 3] = allocation.first
+                    commands[slot, 4] = slot
+                else:
+                    commands[slot, 0] = allocation.count
+                    commands[slot, 2] = allocation.first
+                    commands[slot, 3] = slot
+        if self._rows is None:
+            self._rows = VBO(rows, usage=GL_STREAM_DRAW)
+            self._commands = VBO(commands, usage=GL_STREAM_DRAW,
+                                 target=GL_DRAW_INDIRECT_BUFFER)
+        else:
+            # A new store for each frame's data, so GL never waits for the
+            # last frame's draws to finish reading the old one.
+            self._rows.set_array(rows)
+            self._commands.set_array(commands)
+        self._rows.bind()
+        self._rows.unbind()
+        return calls + 2
+
+    def draw(self, frame=None, transparent=False):
+        '''
+        Draws the sorted opaque draws, or the transparent ones. Returns the
+        number of GL calls made.
+
+        :param frame: Values for uniforms of the same names, for
+          pipelines that don't read them from the Frame block.
+        '''
+        if not self.runs:
+            return 0
+        calls = 0 if self._uploaded else self._upload()
+        if self._indirect and self._commands is not None:
+            self._commands.bind()
+            calls += 1
+        current = None
+        for start, end, batch in self.runs:
+            if (start >= self._split) != transparent:
+                continue
+            pipeline, vao, vbo, mode, _ = self.items[self.order[start]]
+            batch = batch and self._indirect
+            if batch:
+                pipeline = pipeline.instanced_variant()
+            if pipeline is not current:
+                current = pipeline
+                calls += self._use(pipeline, frame)
+            if batch:
+                calls += self._multi_draw(pipeline, vao, mode, start,
+                                          end - start)
+                continue
+            for slot in range(start, end):
+                item = self.order[slot]
+                _, vao, vbo, mode, _ = self.items[item]
+                calls += pipeline.set_uniform('model', self.matrices[item])
+                calls += vao.bind()
+                vao.draw(mode, len(vbo))
+                calls += 1
+        if current is not None:
+            glUseProgram(0)
+            calls += 1
+        return calls
+
+    @staticmethod
+    def _use(pipeline, frame):
+        pipeline.link()
+        glUseProgram(pipeline._program)
+        calls = 1
+        for name, value in (frame or {}).items():
+            if name in pipeline.uniforms:
+                calls += pipeline.set_uniform(name, value)
+        return calls
+
+    def _multi_draw(self, pipeline, slice_, mode, first, count):
+        buffer = slice_.buffer
+        calls = buffer.bind()
+        if buffer.vao.instance_VBO is not self._rows:
+            calls += buffer.attach_instances(self._rows,
+                                             pipeline.vert.VAO_locations)
+        offset = ctypes.c_void_p(first * COMMAND.itemsize)
+        if slice_.allocation.indexed:
+            glMultiDrawElementsIndirect(mode, GL_UNSIGNED_INT, offset, count,
+                                        COMMAND.itemsize)
+        else:
+            glMultiDrawArraysIndirect(mode, offset, count, COMMAND.itemsize)
+        return calls + 1
@@ -1,6 +1,11 @@
 '''A home for uncompiled strings of shaders.'''
 from importlib import import_module
+from . import glsl, program_cache
+from .mesh_buffer import BufferSlice, MeshBuffer
+from .stream_buffer import StreamBuffer
 from .vao import VAO
+from .ubo import FRAME_BLOCK, FRAME_BINDING
+from ._drawable.Instances import Instances
 from OpenGL.GL import *
 from OpenGL.GL import shaders,\
     GL_VERTEX_SHADER,\
@@ -8,48 +13,102 @@ from OpenGL.GL import shaders,\
     glGetUniformLocation,\
     glGetAttribLocation
 from contextlib import contextmanager
-from collections import namedtuple
+import numpy as np
 import os
+import time
 
-ShaderVar = namedtuple('ShaderVar', 'cls type name')
-# UNI_FUNCS = {
-#     "mat4": glUniformMatrix4fv,
-#     "mat3": glUniformMatrix3fv,
-#     "mat2": glUniformMatrix2fv,
-#     "vec4": glUniform4fv,
-#     "vec3": glUniform3fv,
-#     "vec2": glUniform2fv,
-#     "float": glUniform1f
-# }
+
+def _upload_matrix(func):
+    return lambda loc, data: func(loc, 1, GL_FALSE, data)
+
+
+def _upload_vector(func):
+    return lambda loc, data: func(loc, 1, data)
+
+
+UNI_FUNCS = {
+    "mat4": _upload_matrix(glUniformMatrix4fv),
+    "mat3": _upload_matrix(glUniformMatrix3fv),
+    "mat2": _upload_matrix(glUniformMatrix2fv),
+    "vec4": _upload_vector(glUniform4fv),
+    "vec3": _upload_vector(glUniform3fv),
+    "vec2": _upload_vector(glUniform2fv),
+    "float": _upload_vector(glUniform1fv),
+    "int": _upload_vector(glUniform1iv),
+    "sampler2D": _upload_vector(glUniform1iv),
+}
+
+
+def _uniform_data(typ, value):
+    "A value as a contiguous array GL can read, column major for matrices."
+    if hasattr(value, 'to_bytes'):  # a glm type
+        return np.frombuffer(value.to_bytes(), 'f')
+    dtype = 'i' if typ in ('int', 'sampler2D') else 'f'
+    return np.ascontiguousarray(value, dtype).reshape(-1)
+
+
+# The GLSL names of the uniform and attribute types glGetActive* reports.
+GL_TYPES = {
+    GL_FLOAT_MAT4: "mat4",
+    GL_FLOAT_MAT3: "mat3",
+    GL_FLOAT_MAT2: "mat2",
+    GL_FLOAT_VEC4: "vec4",
+    GL_FLOAT_VEC3: "vec3",
+    GL_FLOAT_VEC2: "vec2",
+    GL_FLOAT: "float",
+    GL_INT: "int",
+    GL_SAMPLER_2D: "sampler2D",
+}
+
+
+def _key(file, shadertype, defines):
+    "The compiledShaders key of a shader variant."
+    return (file, shadertype,
+            tuple(sorted((name, str(value))
+                         for name, value in (defines or {}).items())))
 
 
 class Shader:
     '''
-    A shader, compiled from c code. This shader takes a file and
-    compiles it. It also parses the c code for `in`, `out`, `uniform`,
-    `varying`, `attribute` statements and makes a note of them for validation.
+    A shader, compiled from c code. This shader takes a file, runs it
+    through the preprocessor in glsl and compiles it. It also scans the
+    code for `in`, `out`, `uniform`, `varying`, `attribute` declarations
+    and uniform blocks and makes a note of them in `reflection`.
+    The code is compiled when the shader object is first needed, which it
+    isn't if a Pipeline finds its program in the program cache.
+
+    Variants of one file are made with defines, e.g.
+    Shader('litvert', GL_VERTEX_SHADER, defines={'INSTANCED': 1}).
 
     references:
     https://gamedev.stackexchange.com/questions/29672/in-out-keywords-in-glsl
     https://gamedev.stackexchange.com/questions/29672/in-out-keywords-in-glsl
     '''
     # Store compiled shaders in a dict to avoid recompiling of the same shader.
+    # Keyed by (file, shadertype, defines), see _key.
     compiledShaders = {}
+    # Their compiled shader objects, by the same key. Loading a shader again
+    # copies the first one, so the objects live here for every copy to
+    # share, whichever compiles first.
+    compiledObjects = {}
 
-    def __init__(self, file, shadertype, abspath=False):
+    def __init__(self, file, shadertype, abspath=False, defines=None):
         '''
         :param file: the filename. if abspath=True, file is the fully qualified
           absolute path.
         :param shadertype: GL_VERTEX_SHADER or GL_FRAGMENT_SHADER
         :abspath: Lets the shader know the file path you're passing in is
           an absolute path.
+        :param defines: Optional {name: value} to #define before the code,
+          to pick a variant of the shader.
         '''
         if file is None:
             return  # allow alternate constructors
-        if file in Shader.compiledShaders:
+        key = _key(file, shadertype, defines)
+        if key in Shader.compiledShaders:
             # If we've already loaded this shader, just copy it
             # and remove the models.
-            other = Shader.compiledShaders[file]
+            other = Shader.compiledShaders[key]
             self.__dict__ = other.__dict__.copy()
             # TODO - avoid using copy here.
             return
@@ -57,7 +116,10 @@ class Shader:
         if shadertype not in (GL_VERTEX_SHADER, GL_FRAGMENT_SHADER):
             raise TypeError("Type should be GL_VERTEX or GL_FRAGMENT")
         self.file = file
+        self.abspath = abspath
         self.shadertype = shadertype
+        self.defines = dict(defines or {})
+        self._key = key
 
         try:
             if abspath:
@@ -66,13 +128,14 @@ class Shader:
                 here = os.path.dirname(os.path.abspath(__file__))
                 fullpath = os.path.join(here, '_shaders', file + '.shader')
             with open(fullpath) as f:
-                self._code = f.read()
+                source = f.read()
         except Exception as e:
-            raise ValueError(f"'{name}' is not an available shader.", e)
+            raise ValueError(f"'{file}' is not an available shader.", e)
+
+        self._code = glsl.preprocess(source, self.defines, path=fullpath)
 
-        self.shader = shaders.compileShader(self._code, shadertype)
         self.parse()
-        Shader.compiledShaders[file] = self
+        Shader.compiledShaders[key] = self
 
     @classmethod
     def from_raw_code(cls, code, shadertype):
@@ -84,96 +147,310 @@ class Shader:
             raise TypeError("Type should be GL_VERTEX_SHADER or GL_FRAGMENT_SHADER")
         self = cls(None, shadertype)
         self.file = None
-        self._code = code
+        self.shadertype = shadertype
+        self.defines = {}
+        self._code = glsl.preprocess(code)
+        # Not in compiledShaders, but shares a compiled object with raw
+        # shaders of the same code.
+        self._key = (None, shadertype, self._code)
         self.VAO_locs = None
-        self.shader = shaders.compileShader(self._code, shadertype)
         self.parse()
         return self
 
+    @property
+    def _shader(self):
+        "The compiled shader object, or None if it hasn't been needed yet."
+        return Shader.compiledObjects.get(self._key)
+
+    @property
+    def shader(self):
+        "The compiled shader object, compiled on first use."
+        compiled = self._shader
+        if compiled is None:
+            compiled = Shader.compiledObjects[self._key] = \
+                shaders.compileShader(self._code, self.shadertype)
+        return compiled
+
     def parse(self):
-        self.vars = []
-        locations = {}
-        vartypes = {'in', 'out', 'inout', 'uniform', 'attribute', 'varying'}
-        for line in self._code.split('\n'):
-            line = line.strip()
-            words = line.split()
-            is_layout = False
-            if not len(words):
-                continue
-            if words[0] == 'layout':
-                # example: layout (location=0) in vec4 potato;
-                layout, vars = line.split(')')
-                words = vars.split()
-                if 'location' in layout:
-                    loc = int(layout.split('=')[1].strip())
-                    is_layout = True
-
-            if words[0] in vartypes:
-                if is_layout:
-                    if words[1] in ('highp', 'mediump', 'lowp'):
-                        # Skip the precision
-                        locations[loc] =\
-                            ShaderVar(words[0], words[2], words[3].rstrip(';'))
-                    else:
-                        locations[loc] =\
-                            ShaderVar(words[0], words[1], words[2].rstrip(';'))
-                else:
-                    if words[1] in ('highp', 'mediump', 'lowp'):
-                        # Skip the precision
-                        self.vars.append(
-                            ShaderVar(words[0], words[2], words[3].rstrip(';')))
-                    else:
-                        self.vars.append(
-                            ShaderVar(words[0], words[1], words[2].rstrip(';')))
-        if len(locations.keys()) and self.shadertype == GL_VERTEX_SHADER:
+        '''
+        Scans the code for declarations. Sets reflection, the full table
+        from glsl.reflect, and from it vars, the variables without a
+        layout location, uniform_blocks, the block names, and for vertex
+        shaders VAO_locations, {location: input}.
+        '''
+        vertex = self.shadertype == GL_VERTEX_SHADER
+        self.reflection = reflection = glsl.reflect(self._code, vertex)
+        self.vars = [var for var in reflection.uniforms + reflection.inputs +
+                     reflection.outputs if var.location is None]
+        self.uniform_blocks = [block.name for block in reflection.blocks]
+        locations = {var.location: var for var in reflection.inputs
+                     if var.location is not None}
+        if len(locations.keys()) and vertex:
             self.VAO_locations = locations
 
 
 class Pipeline:
+    # Load linked programs from, and save them to, the program cache when
+    # the driver supports program binaries. See program_cache.
+    use_program_cache = True
+    # Put models in a MeshBuffer per vertex format; see add_model.
+    share_buffers = True
+
     def __init__(self, vertex_shader, fragment_shader):
         self.vert = vertex_shader
         self.frag = fragment_shader
         self._models_and_VAOs = []
-        self._program = shaders.compileProgram(self.vert.shader, self.frag.shader)
+        self._instances_and_VAOs = []
         self.VAOs = []
+        # The last value sent to each uniform location, to skip repeats.
+        self._uniform_cache = {}
+        # Linked on first use, see link.
+        self._program = None
+        self._uniforms = self._ins = None
+        self._instanced = False  # not looked for yet, see instanced_variant
+
+    @property
+    def linked(self):
+        return self._program is not None
+
+    def link(self):
+        '''
+        Compiles and links the program, or loads it from the program cache,
+        unless that's done. Pipelines link when they're first used; link
+        them up front, or a few a frame with warm_up, so the first frame
+        that draws with them doesn't wait for the compiler.
+        '''
+        if self._program is not None:
+            return
+        self._program = self._load_program()
+
+        # Point uniform blocks at the binding the shared buffers use.
+        for block in set(self.vert.uniform_blocks + self.frag.uniform_blocks):
+            index = glGetUniformBlockIndex(self._program, block)
+            if block == FRAME_BLOCK and index != GL_INVALID_INDEX:
+                glUniformBlockBinding(self._program, index, FRAME_BINDING)
+
+    @property
+    def uniforms(self):
+        "{name: (location, type)} of the active uniforms; links if needed."
+        self.link()
+        return self._uniforms
+
+    @property
+    def ins(self):
+        "{name: (location, type)} of the active vertex inputs."
+        self.link()
+        return self._ins
+
+    def instanced_variant(self):
+        '''
+        This pipeline with its vertex shader's INSTANCED variant, which
+        reads the model matrix and a color tint per instance, laid out like
+        Instances, instead of the model uniform. RenderQueue draws with it
+        to merge the draws of models in one MeshBuffer. None if the vertex
+        shader doesn't come from a file with such a variant.
+        '''
+        if self._instanced is not False:
+            return self._instanced
+        self._instanced = None
+        vert = self.vert
+        if vert.file is None or 'INSTANCED' in vert.defines:
+            return None
+        variant = Shader(vert.file, GL_VERTEX_SHADER, vert.abspath,
+                         defines={**vert.defines, 'INSTANCED': 1})
+        locations = getattr(variant, 'VAO_locations', {})
+        per_instance = sorted(var.name for var in locations.values()
+                              if var.name.startswith('instance_'))
+        per_vertex = {loc: var for loc, var in locations.items()
+                      if not var.name.startswith('instance_')}
+        if per_instance == ['instance_color', 'instance_model'] and \
+                per_vertex == getattr(vert, 'VAO_locations', None):
+            self._instanced = Pipeline(variant, self.frag)
+        return self._instanced
+
+    def _load_program(self):
+        '''
+        Links the program and finds the uniform and attribute locations,
+        or loads both from the program cache when the driver can.
+        '''
+        if not (Pipeline.use_program_cache and program_cache.supported()):
+            program = shaders.compileProgram(self.vert.shader,
+                                             self.frag.shader)
+            self._uniforms, self._ins = self._reflect(program)
+            return program
+
+        key = program_cache.cache_key(self.vert._code, self.frag._code)
+        cached = program_cache.load(key)
+        if cached is not None:
+            program, reflection = cached
+            self._uniforms = {name: tuple(value) for name, value
+                              in reflection['uniforms'].items()}
+            self._ins = {name: tuple(value) for name, value
+                         in reflection['ins'].items()}
+            return program
+        program = program_cache.link(self.vert.shader, self.frag.shader)
+        self._uniforms, self._ins = self._reflect(program)
+        program_cache.save(key, program, {'uniforms': self._uniforms,
+                                          'ins': self._ins})
+        return program
+
+    def _reflect(self, program):
+        '''
+        Returns the {name: (location, type)} of the program's active
+        uniforms outside uniform blocks, and of its vertex inputs. The
+        program lists what's active, so declared variables the compiler
+        dropped are never looked up, and locations the source gives with
+        layout(location=...) aren't looked up at all.
+        '''
+        declared = {var.name: var for var in self.vert.reflection.uniforms +
+                    self.frag.reflection.uniforms}
+        uniforms = {}
+        count = glGetProgramiv(program, GL_ACTIVE_UNIFORMS)
+        block_index = np.full(count, -1, np.int32)
+        if count:
+            glGetActiveUniformsiv(program, count, np.arange(count, dtype='I'),
+                                  GL_UNIFORM_BLOCK_INDEX, block_index)
+        for index in np.flatnonzero(block_index == -1):
+            name, size, typ = glGetActiveUniform(program, int(index))
+            name = name.decode().removesuffix('[0]')
+            var = declared.get(name)
+            loc = var.location if var and var.location is not None else \
+                glGetUniformLocation(program, name)
+            uniforms[name] = (loc, GL_TYPES.get(typ, var and var.type))
 
-        # get uniform locations
-        self.uniforms = {}
-        self.ins = {}
-        for var in self.vert.vars:
-            if var.cls == "uniform":
-                loc = glGetUniformLocation(self._program, var.name)
-                if loc == -1:
-                    print("WARNING: Uniform " + var.name + " returned -1; this indicates that the var is not being used by the program.")
-                else:
-                    self.uniforms[var.name] = (loc, var.type)
-            if var.cls == "in" or var.cls == "inout" or var.cls == "varying":
-                loc = glGetAttribLocation(self._program, var.name)
-                if loc == -1:
-                    print("WARNING: Attribute " + var.name + " returned -1; this indicates that the var is not being used by the program.")
-                self.ins[var.name] = (loc, var.type)
-
-        for var in self.frag.vars:
-            if var.cls == "uniform" and var.name not in self.uniforms:
-                loc = glGetUniformLocation(self._program, var.name)
-                if loc == -1:
-                    print("WARNING: Attribute " + var.name + " location returned -1; this indicates that the var is not being used by the program.")
-                self.uniforms[var.name] = [loc, var.type]
-
-    def add_model(self, model):
-        "Add a Shape3D model to be rendered with this shader pair."
+        declared_ins = {var.name: var for var in self.vert.reflection.inputs}
+        ins = {}
+        for index in range(glGetProgramiv(program, GL_ACTIVE_ATTRIBUTES)):
+            name, size, typ = glGetActiveAttrib(program, index)
+            name = name.decode().removesuffix('[0]')
+            if name.startswith('gl_'):
+                continue
+            var = declared_ins.get(name)
+            loc = var.location if var and var.location is not None else \
+                glGetAttribLocation(program, name)
+            ins[name] = (loc, GL_TYPES.get(typ, var and var.type))
+
+        unused = [name for name in list(declared) + list(declared_ins)
+                  if name not in uniforms and name not in ins and
+                  not any(key.startswith((name + '.', name + '['))
+                          for key in uniforms)]
+        if unused:
+            print("WARNING: " + ", ".join(unused) + " are not used by the "
+                  "program; the compiler removed them.")
+        return uniforms, ins
+
+    def add_model(self, model, shared=None):
+        '''
+        Add a Shape3D model to be rendered with this shader pair.
+
+        :param shared: Put the model's mesh in the MeshBuffer shared by
+          every model with this vertex format, instead of giving it a VAO
+          of its own. Defaults to Pipeline.share_buffers. Dynamic models,
+          with a StreamBuffer, always get their own. Shared models whose
+          vertices don't match the vertex shader's inputs raise a
+          ValueError.
+        '''
+        if isinstance(model.render_data[0], StreamBuffer):
+            shared = False
+        if Pipeline.share_buffers if shared is None else shared:
+            buffer = MeshBuffer.for_format(self.vert.VAO_locations)
+            vbo = model.render_data[0]
+            index_buffer = getattr(model, 'index_buffer', None)
+            # Raises a ValueError for rows of another width, which no VAO
+            # for this shader could read either.
+            allocation = buffer.add(vbo.data, None if index_buffer is None
+                                    else index_buffer.data)
+            # The model's own buffers are never drawn, so never uploaded.
+            vbo.copied = True
+            self._models_and_VAOs.append(
+                (model, BufferSlice(buffer, allocation)))
+            return
         try:
             newVAO = VAO(self.vert.VAO_locations)
             newVAO.bind()
             newVAO.add_VBO(model.render_data[0])
+            index_buffer = getattr(model, 'index_buffer', None)
+            if index_buffer is not None:
+                newVAO.add_IBO(index_buffer)
         except Exception as e:
             print(e)
         finally:
             newVAO.unbind()
         self._models_and_VAOs.append((model, newVAO))
 
+    def add_instances(self, model, matrices=None, colors=None):
+        '''
+        Add many copies of a model, drawn with one instanced draw call.
+        The vertex shader needs instance_* inputs, e.g. litvert_instanced.
+
+        :param model: A Mesh or Shape3D, or an existing Instances object.
+        :param matrices: A model matrix for each copy.
+        :param colors: Optional color tint for each copy.
+        :returns: The Instances object; call its update method to move the
+          copies.
+        '''
+        if isinstance(model, Instances):
+            instances = model
+        else:
+            instances = Instances(model, matrices, colors)
+        try:
+            newVAO = VAO(self.vert.VAO_locations)
+            newVAO.bind()
+            newVAO.add_VBO(instances.render_data[0])
+            index_buffer = instances.index_buffer
+            if index_buffer is not None:
+                newVAO.add_IBO(index_buffer)
+            newVAO.add_instance_VBO(instances.instance_buffer)
+        except Exception as e:
+            print(e)
+        finally:
+            newVAO.unbind()
+        self._instances_and_VAOs.append((instances, newVAO))
+        return instances
+
+    def set_uniform(self, name, value):
+        '''
+        Uploads a uniform unless its location already holds the same value.
+        The program has to be in use, i.e. inside rendering(). Returns True
+        if a GL call was made.
+
+        :param value: A glm type, a number or a sequence of numbers.
+        '''
+        loc, typ = self.uniforms[name]
+        data = _uniform_data(typ, value)
+        key = data.tobytes()
+        if self._uniform_cache.get(loc) == key:
+            return False
+        UNI_FUNCS[typ](loc, data)
+        self._uniform_cache[loc] = key
+        return True
+
+    def forget_uniforms(self):
+        "Clears the uniform cache, e.g. after setting uniforms directly."
+        self._uniform_cache.clear()
+
     @contextmanager
     def rendering(self):
+        self.link()
         shaders.glUseProgram(self._program)
         yield
         shaders.glUseProgram(0)
+
+
+def warm_up(pipelines, budget=None):
+    '''
+    Links pipelines that haven't been used yet, e.g. the variants a match
+    will need, so drawing with them later doesn't stall. Linked pipelines
+    are taken off the list.
+
+    :param pipelines: A list of Pipelines.
+    :param budget: Seconds to spend, e.g. a slice of each frame; at least
+      one pipeline is linked per call. None links them all.
+    :returns: How many are left.
+    '''
+    start = time.perf_counter()
+    while pipelines:
+        pipelines.pop(0).link()
+        if budget is not None and time.perf_counter() - start >= budget:
+            break
+    return len(pipelines)
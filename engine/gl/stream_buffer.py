@@ -0,0 +1,226 @@
+'''
+A vertex buffer for data that changes every frame, such as deforming
+meshes and particle trails, written in place instead of recompiled.
+
+With GL 4.4 (or ARB_buffer_storage) the buffer holds several copies of the
+data, frames of them, in immutable storage that stays mapped: data is a
+NumPy view straight into the current copy, so writes need no GL calls at
+all. Once a copy has been drawn from, the next write moves on to the next
+copy. A fence placed then marks when the GPU is done with the one left
+behind; it's only waited on when the ring comes back around to it, which
+with three copies is two frames later. Rows written since a copy was last
+current are copied into it when it becomes current again, so partial
+updates only ever touch the rows that changed.
+
+Older contexts get one copy kept in memory. Changed row ranges are sent
+with glBufferSubData on the next bind; if every row changed the old store
+is orphaned first with glBufferData, so the driver doesn't have to wait for
+draws still reading it.
+'''
+import ctypes
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL import glBufferStorage, glClientWaitSync, glDeleteSync, \
+    glFenceSync, glMapBufferRange
+from .utils import ReprMixin
+
+MAP_FLAGS = GL_MAP_WRITE_BIT | GL_MAP_READ_BIT | GL_MAP_PERSISTENT_BIT | \
+    GL_MAP_COHERENT_BIT
+WAIT_TIMEOUT = 1000000000  # nanoseconds a glClientWaitSync call waits
+
+
+def _merge(ranges):
+    "Sorted, non-overlapping [start, end) ranges covering ranges."
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class StreamBuffer(ReprMixin):
+    '''
+    Stands in for a PyOpenGL VBO of rows of vertex data that's rewritten
+    often, in whole or in part. Write with slice assignment, like a VBO:
+
+        stream[first:first + len(rows)] = rows
+
+    or into data, followed by dirty(first, count) for the rows changed.
+    VAO.draw starts from the current copy's first vertex.
+    '''
+    # Use persistent mapped storage when the context has it; False to
+    # always take the glBufferSubData path.
+    use_persistent = True
+
+    def __init__(self, data, frames=3, target=GL_ARRAY_BUFFER):
+        '''
+        :param data: The initial (rows, floats) float32 array. Its size is
+          fixed; make a new StreamBuffer for a different size.
+        :param frames: Copies to cycle through with persistent storage.
+          Three lets the CPU write one while the GPU still reads the last
+          two frames'.
+        '''
+        data = np.array(data, 'f', copy=True)
+        self.frames = frames
+        self.target = target
+        self.buffer = None  # made on the first bind, which needs a context
+        self.persistent = False
+        self._copies = data[None]  # [copy][row], mapped once persistent
+        self._current = 0
+        self._in_use = False  # drawn from since it became current
+        self._fences = [None] * frames
+        self._stale = [[] for _ in range(frames)]  # rows to catch up on
+        self._dirty = []  # rows to upload, without persistent storage
+        self._orphan = False
+
+    def __len__(self):
+        return self._copies.shape[1]
+
+    @property
+    def stride(self):
+        "Bytes per row."
+        return self._copies.shape[2] * self._copies.itemsize
+
+    @property
+    def data(self):
+        '''
+        The current copy, to write into; the next one if the current one
+        has been drawn from. Call dirty for the rows written.
+        '''
+        if self._in_use:
+            self._next_copy()
+        return self._copies[self._current]
+
+    @property
+    def copied(self):
+        "False while there are changes that need a bind to reach GL."
+        return self.buffer is not None and not self._dirty
+
+    def __setitem__(self, key, rows):
+        first, stop, step = key.indices(len(self))
+        if step != 1:
+            raise ValueError("Only contiguous slices can be written.")
+        self.data[first:stop] = rows
+        self.dirty(first, stop - first)
+
+    def dirty(self, first=0, count=None):
+        "Marks rows as changed, all of them by default."
+        end = len(self) if count is None else first + count
+        if end <= first:
+            return
+        if self.persistent:
+            for copy, stale in enumerate(self._stale):
+                if copy != self._current:
+                    stale.append((first, end))
+        else:
+            self._dirty.append((first, end))
+            self._orphan = self._orphan or (first == 0 and end == len(self))
+
+    def set_array(self, data):
+        "Replaces every row, like VBO.set_array, keeping the size."
+        current = self.data
+        if data is not current:
+            if np.shape(data) != current.shape:
+                raise ValueError(f"Expected an array of shape "
+                                 f"{current.shape}, got {np.shape(data)}.")
+            current[:] = data
+        self.dirty()
+
+    def draw_first(self):
+        '''
+        The first vertex of the current copy, for the draw about to be
+        made. Marks the copy as in use, so the next write goes to another.
+        '''
+        self._in_use = self.persistent
+        return self._current * len(self)
+
+    def _next_copy(self):
+        "Fences the current copy and moves on to the next free one."
+        self._fences[self._current] = glFenceSync(
+            GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        previous, self._current = \
+            self._current, (self._current + 1) % self.frames
+        fence = self._fences[self._current]
+        if fence is not None:
+            flags = GL_SYNC_FLUSH_COMMANDS_BIT
+            status = glClientWaitSync(fence, flags, WAIT_TIMEOUT)
+            while status == GL_TIMEOUT_EXPIRED:
+                status = glClientWaitSync(fence, 0, WAIT_TIMEOUT)
+            if status == GL_WAIT_FAILED:
+                raise StreamBufferError(
+                    "glClientWaitSync failed on a StreamBuffer's fence.")
+            glDeleteSync(fence)
+            self._fences[self._current] = None
+        # Catch up on what was written to the others since.
+        copies = self._copies
+        for start, end in _merge(self._stale[self._current]):
+            copies[self._current, start:end] = copies[previous, start:end]
+        self._stale[self._current] = []
+        self._in_use = False
+
+    def _create(self):
+        self.buffer = glGenBuffers(1)
+        glBindBuffer(self.target, self.buffer)
+        data = self._copies[0]
+        if self.use_persistent and bool(glBufferStorage) and \
+                bool(glMapBufferRange):
+            size = data.nbytes * self.frames
+            glBufferStorage(self.target, size, None, MAP_FLAGS)
+            address = glMapBufferRange(self.target, 0, size, MAP_FLAGS)
+            mapped = np.frombuffer((ctypes.c_byte * size).from_address(
+                address), 'f').reshape((self.frames,) + data.shape)
+            mapped[:] = data
+            self._copies = mapped
+            self.persistent = True
+        else:
+            glBufferData(self.target, data.nbytes, data, GL_STREAM_DRAW)
+        self._dirty = []
+        self._orphan = False
+
+    def bind(self):
+        "Binds the buffer, making it or uploading the changed rows first."
+        if self.buffer is None:
+            self._create()
+            return
+        glBindBuffer(self.target, self.buffer)
+        if not self._dirty:
+            return
+        data = self._copies[0]
+        if self._orphan:
+            glBufferData(self.target, data.nbytes, None, GL_STREAM_DRAW)
+            glBufferSubData(self.target, 0, data.nbytes, data)
+        else:
+            for start, end in _merge(self._dirty):
+                glBufferSubData(self.target, start * self.stride,
+                                (end - start) * self.stride, data[start:end])
+        self._dirty = []
+        self._orphan = False
+
+    def unbind(self):
+        glBindBuffer(self.target, 0)
+
+    def delete(self):
+        "Frees the GL buffer; the data stays, in memory, to make it again."
+        if self.buffer is None:
+            return
+        for fence in self._fences:
+            if fence is not None:
+                glDeleteSync(fence)
+        self._fences = [None] * self.frames
+        if self.persistent:
+            self._copies = self._copies[self._current][None].copy()
+            glBindBuffer(self.target, self.buffer)
+            glUnmapBuffer(self.target)
+            glBindBuffer(self.target, 0)
+        glDeleteBuffers(1, [self.buffer])
+        self.buffer = None
+        self.persistent = False
+        self._current = 0
+        self._in_use = False
+        self._stale = [[] for _ in range(self.frames)]
+
+
+class StreamBufferError(Exception):
+    pass
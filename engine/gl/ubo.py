@@ -0,0 +1,133 @@
+'''
+Uniform buffer objects (UBOs) with the std140 layout.
+
+A uniform block is shared by every program that declares it, so values
+that are the same for every shader, like the camera and the lights, are
+uploaded once per frame instead of once per shader. Only changed values
+are written, and the buffer is only re-uploaded when something changed.
+'''
+import numpy as np
+from OpenGL.GL import GL_UNIFORM_BUFFER, glBindBufferBase
+from OpenGL.arrays.vbo import VBO
+from .utils import ReprMixin
+
+# (base alignment, size) in bytes of each supported std140 member type.
+# Matrix columns are stored like vec4s.
+STD140 = {
+    'float': (4, 4),
+    'int': (4, 4),
+    'vec2': (8, 8),
+    'vec3': (16, 12),
+    'vec4': (16, 16),
+    'mat3': (16, 48),
+    'mat4': (16, 64),
+}
+
+# The block shared by the lit shaders; see litvert.shader.
+FRAME_BLOCK = 'Frame'
+FRAME_BINDING = 0
+FRAME_FIELDS = (
+    ('view', 'mat4'),
+    ('projection', 'mat4'),
+    ('light_pos', 'vec3'),
+    ('light_ambient_weight', 'float'),
+    ('light_ambient_color', 'vec3'),
+    ('light_glare', 'float'),
+    ('light_color', 'vec3'),
+)
+
+
+def std140_layout(fields):
+    '''
+    Returns ({name: byte offset}, block size) for a uniform block with the
+    std140 layout.
+
+    :param fields: (name, type) pairs in the order they're declared.
+    '''
+    offsets = {}
+    offset = 0
+    for name, typ in fields:
+        if typ not in STD140:
+            raise TypeError("Unsupported type for a uniform block: " + typ)
+        align, size = STD140[typ]
+        offset = -(-offset // align) * align
+        offsets[name] = offset
+        offset += size
+    return offsets, -(-offset // 16) * 16
+
+
+def std140_bytes(typ, value):
+    "The bytes of a value as stored in a std140 block."
+    if hasattr(value, 'to_bytes'):  # a glm type; column major
+        data = np.frombuffer(value.to_bytes(), 'f')
+    else:
+        data = np.asarray(value, 'i' if typ == 'int' else 'f').reshape(-1)
+    if typ == 'mat3':
+        # every column is padded to a vec4
+        data = np.pad(data.reshape(3, 3), ((0, 0), (0, 1))).reshape(-1)
+    if data.nbytes != STD140[typ][1]:
+        raise ValueError(f"A {typ} needs {STD140[typ][1]} bytes, "
+                         f"got {data.nbytes}.")
+    return data.tobytes()
+
+
+class UniformBuffer(ReprMixin):
+    '''
+    A uniform block's data in a GL buffer bound to a binding point.
+    Programs read it through a block declared with the same binding, e.g.
+    layout (std140, binding=0) uniform Frame {...};
+    '''
+    def __init__(self, fields=FRAME_FIELDS, binding=FRAME_BINDING):
+        '''
+        :param fields: (name, type) pairs in the order they're declared in
+          the shader's uniform block.
+        :param binding: The uniform buffer binding point.
+        '''
+        self.types = dict(fields)
+        self.offsets, self.size = std140_layout(fields)
+        self.binding = binding
+        self.data = np.zeros(self.size, np.uint8)
+        self._VBO = None
+        self._dirty = True
+
+    def set(self, name, value):
+        '''
+        Writes a value into the block. Returns False without marking the
+        buffer for upload if it already holds that value.
+        '''
+        raw = std140_bytes(self.types[name], value)
+        start = self.offsets[name]
+        current = self.data[start:start + len(raw)]
+        if current.tobytes() == raw:
+            return False
+        current[:] = np.frombuffer(raw, np.uint8)
+        self._dirty = True
+        return True
+
+    def update(self, values):
+        "Sets several values from a dict. Returns True if any changed."
+        changed = False
+        for name, value in values.items():
+            changed = self.set(name, value) or changed
+        return changed
+
+    def upload(self):
+        '''
+        Sends the block to the GPU if it changed since the last upload.
+        The first upload creates the buffer and binds it to its binding
+        point, where it stays for every program.
+        '''
+        if self._VBO is None:
+            self._VBO = VBO(self.data, usage='GL_DYNAMIC_DRAW',
+                            target=GL_UNIFORM_BUFFER)
+            self._VBO.bind()
+            glBindBufferBase(GL_UNIFORM_BUFFER, self.binding, int(self._VBO))
+        elif self._dirty:
+            self._VBO.set_array(self.data)
+            self._VBO.bind()
+        else:
+            return False
+        self._VBO.unbind()
+        self._dirty = False
+        return True
+
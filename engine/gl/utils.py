@@ -3,3 +3,6 @@
 from ._utils.ReprMixin import ReprMixin
 from ._utils import vector
 from ._utils import transformations
+from ._utils import indexing
+from ._utils import normals
+from ._utils import bounds
@@ -1,10 +1,15 @@
-from .utils import ReprMixin
+from .utils import ReprMixin, indexing
 from contextlib import contextmanager
 from collections import namedtuple
 from OpenGL.GL import *
 from OpenGL.GL import shaders,\
                       glVertexAttribPointer,\
                       glEnableVertexAttribArray,\
+                      glVertexAttribDivisor,\
+                      glDrawArraysInstanced,\
+                      glDrawElementsInstanced,\
+                      glDrawElementsBaseVertex,\
+                      glDrawElementsInstancedBaseVertex,\
                       glDeleteVertexArrays,\
                       glGetIntegerv,\
                       sizeof, ctypes, GLuint
@@ -13,12 +18,53 @@ from OpenGL.raw.GL.ARB.vertex_array_object import glGenVertexArrays, \
 
 VptrArgs = namedtuple("VptrArgs", "index size typ normalized stride pointer")
 
+# Vertex shader inputs named like this are read once per instance from the
+# instance buffer instead of once per vertex.
+INSTANCE_PREFIX = 'instance_'
+
+
+def _pointer_args(locations):
+    '''
+    Arguments for a glVertexAttribPointer call per attribute location, for
+    attributes packed one after another in a single interleaved buffer.
+    A matN attribute takes N consecutive locations, one per column.
+    '''
+    vptr_args = []
+    offset = 0
+    for loc, attribs in locations.items():
+        if 'vec' in attribs.type:
+            columns, size = 1, int(attribs.type[3])
+        elif 'mat' in attribs.type:
+            columns = size = int(attribs.type[3])
+        elif 'float' in attribs.type:
+            columns, size = 1, 1
+        else:
+            raise TypeError("Unsupported type for VAO: " + attribs.type)
+        for column in range(columns):
+            vptr_args.append(
+                [loc + column,
+                 size,
+                 GL_FLOAT,
+                 GL_FALSE,
+                 0,  # mulitply by stride later
+                 ctypes.c_void_p(offset)
+                 ])
+            offset += size * sizeof(ctypes.c_float)
+    for arg in vptr_args:
+        arg[4] = offset
+    return vptr_args
+
 
 class VAO(ReprMixin):
+    # The VAO last bound through bind, or None.
+    bound = None
+
     def __init__(self, locations):
         self.locations = locations
         self.VBOs = []
-        self.vptr_args = []
+        self.IBO = None
+        self.index_type = None
+        self.instance_VBO = None
 
         # VAO index or 'name' in OpenGL
         self._index = GLuint(0)
@@ -27,31 +73,12 @@ class VAO(ReprMixin):
         # Plan: Store the arguments for a glVertex call,
         # then, when a buffer is added, activate the VBO
         # and call glVertexAttribPointer with stored arguments.
-        offset = 0
-        count = 0
-        stride = 0
-        for loc, attribs in self.locations.items():
-            if 'vec' in attribs.type:
-                size = int(attribs.type[3])
-            elif 'mat' in attribs.type:
-                size = int(attribs.type[3]) ** 2
-            elif 'float' in attribs.type:
-                size = 1
-            else:
-                raise TypeError("Unsupported type for VAO: " + attribs.type)
-            self.vptr_args.append(
-                [loc,
-                 size,
-                 GL_FLOAT,
-                 GL_FALSE,
-                 0,  # mulitply by stride later
-                 ctypes.c_void_p(offset)
-                 ])
-            offset += size * sizeof(ctypes.c_float)
-            stride += size
-        for arg in self.vptr_args:
-            arg[4] = stride * sizeof(ctypes.c_float)
-
+        per_vertex = {loc: attribs for loc, attribs in locations.items()
+                      if not attribs.name.startswith(INSTANCE_PREFIX)}
+        per_instance = {loc: attribs for loc, attribs in locations.items()
+                        if attribs.name.startswith(INSTANCE_PREFIX)}
+        self.vptr_args = _pointer_args(per_vertex)
+        self.instance_vptr_args = _pointer_args(per_instance)
 
     def add_VBO(self, VBO):
         if not (self._bound):
@@ -66,13 +93,95 @@ class VAO(ReprMixin):
         finally:
             VBO.unbind()
 
+    def add_IBO(self, IBO):
+        '''
+        Attaches an element (index) buffer. The binding is stored in the VAO,
+        so it stays attached after the VAO is unbound.
+        '''
+        if not (self._bound):
+            raise VAOError("VAO is not currently bound.")
+
+        self.IBO = IBO
+        self.index_type = indexing.INDEX_TYPES[IBO.data.dtype]
+        IBO.bind()  # don't unbind; that would detach it from the VAO.
+
+    def add_instance_VBO(self, VBO):
+        '''
+        Attaches the per-instance buffer that feeds the shader's
+        instance_* inputs. Those attributes advance once per instance.
+        '''
+        if not (self._bound):
+            raise VAOError("VAO is not currently bound.")
+        if not self.instance_vptr_args:
+            raise VAOError("The shader has no instance_* inputs.")
+
+        self.instance_VBO = VBO
+        try:
+            VBO.bind()
+            for args in self.instance_vptr_args:
+                glEnableVertexAttribArray(args[0])
+                glVertexAttribPointer(*args)
+                glVertexAttribDivisor(args[0], 1)
+        finally:
+            VBO.unbind()
+
+    def draw(self, mode, count, instances=None):
+        '''
+        Draws count vertices, through the element buffer if there is one.
+        If instances is given, draws that many instances in one call.
+        '''
+        # A StreamBuffer's current copy starts part way into the buffer.
+        draw_first = getattr(self.VBOs[0], 'draw_first', None) \
+            if self.VBOs else None
+        first = draw_first() if draw_first is not None else 0
+        if instances is None:
+            if self.IBO is not None and first:
+                glDrawElementsBaseVertex(mode, len(self.IBO),
+                                         self.index_type, None, first)
+            elif self.IBO is not None:
+                glDrawElements(mode, len(self.IBO), self.index_type, None)
+            else:
+                glDrawArrays(mode, first, count)
+        elif self.IBO is not None and first:
+            glDrawElementsInstancedBaseVertex(mode, len(self.IBO),
+                                              self.index_type, None,
+                                              instances, first)
+        elif self.IBO is not None:
+            glDrawElementsInstanced(mode, len(self.IBO), self.index_type,
+                                    None, instances)
+        else:
+            glDrawArraysInstanced(mode, first, count, instances)
+
+    def upload(self, VBO, IBO=None):
+        '''
+        Sends a changed VBO's data, and its element buffer's, to GL.
+        Buffers that replaced the attached ones, as when a model is
+        recompiled at a new size, are attached in their place. Returns the
+        GL calls made.
+        '''
+        if self.VBOs and VBO is not self.VBOs[0]:
+            self.VBOs = []
+            self.add_VBO(VBO)
+            calls = 2 + 2 * len(self.vptr_args)
+        else:
+            VBO.bind()
+            calls = 2
+        if IBO is not None and (IBO is not self.IBO or not IBO.copied):
+            self.add_IBO(IBO)
+            calls += 1
+        return calls
+
     def bind(self):
+        "Binds the VAO. Returns True, for a GL call made."
         glBindVertexArray(self._index)
         self._bound = True
+        VAO.bound = self
+        return True
 
     def unbind(self):
         glBindVertexArray(0)
         self._bound = False
+        VAO.bound = None
 
 
 class VAOError(Exception):
@@ -6,33 +6,71 @@ import glm
 
 METRE_CONV = .3
 
-drawables = {}
-collisions = {}
-
-
-drawables['table'] = box(.1 * METRE_CONV, 1.525 * METRE_CONV, 2.74 * METRE_CONV, Point3D(-.5, -.5, -1), color=(.8, .2, .2))
-drawables['ball'] = sphere(.02, Point3D(0., 3., 0.), color=(.8, .8, .8))
-drawables['floor'] = box(.001, 10, 5, Point3D(-5, -2, -3), color=(.5, .6, .7))
-drawables['back_wall'] = box(25, 25, .001, Point3D(-12.5, -12.5, -2), color=(1, .2, .2))
-gravity = GravityAnimator(.003)
-gravity.apply_to(drawables['ball'])
-
-ball_collision = CollisionBox.from_shape(drawables['ball'])
-ball_collision.handler = bounce
-ball_collision.handler_targets.append(gravity)
-
-table_collision = CollisionBox.from_shape(drawables['table'])
-floor_collision = CollisionBox.from_shape(drawables['floor'])
-back_wall_collision = CollisionBox.from_shape(drawables['back_wall'])
-
-table_collision.bounce_normal = floor_collision.bounce_normal = glm.vec3(1, -1, 1)
-back_wall_collision.bounce_normal = glm.vec3(1, 1, -1)
-floor_collision.bounce_rebound = .7
-back_wall_collision.bounce_rebound = .7
-table_collision.bounce_rebound = .95
-
-collision_system = CollisionSystem()
-collision_system.add(ball_collision)
-collision_system.add(table_collision)
-collision_system.add(floor_collision)
-collision_system.add(back_wall_collision)
+
+def rally(ball_position=(0., 0., 0.), ball_velocity=(0., 0., -.02),
+          spin=(0., 0., 0.), gravity=.003, rebound=.95):
+    '''
+    Builds the table scene with a ball served from ball_position. Returns
+    (drawables, collisions, gravity, collision_system); nothing here needs
+    a display, so a HeadlessLoop can run it.
+
+    :param ball_velocity: The ball's starting velocity per tick (see
+      engine.gameloop.timing.TICK).
+    :param spin: The ball's spin, axis * radians per tick.
+    :param gravity: Velocity the ball gains downwards per tick.
+    :param rebound: The table's bounce_rebound.
+    '''
+    drawables = {}
+    collisions = {}
+
+    drawables['table'] = box(.1 * METRE_CONV, 1.525 * METRE_CONV, 2.74 * METRE_CONV, Point3D(-.5, -.5, -1), color=(.8, .2, .2))
+    drawables['ball'] = sphere(.02, Point3D(0., 0., 0.), color=(.8, .8, .8))
+    drawables['ball'].move(*ball_position)
+    drawables['floor'] = box(.001, 10, 5, Point3D(-5, -2, -3), color=(.5, .6, .7))
+    drawables['back_wall'] = box(25, 25, .001, Point3D(-12.5, -12.5, -2), color=(1, .2, .2))
+    for name in ('table', 'floor', 'back_wall'):
+        drawables[name].gen_normals('flat')  # litvert reads a normal
+    gravity = GravityAnimator(gravity)
+    gravity.momentum = glm.vec3(ball_velocity)
+    gravity.spin = glm.vec3(spin)
+    gravity.apply_to(drawables['ball'])
+
+    collisions['ball'] = ball_collision = CollisionBox.from_shape(drawables['ball'])
+    ball_collision.handler = bounce
+    ball_collision.handler_targets.append(gravity)
+
+    collisions['table'] = table_collision = CollisionBox.from_shape(drawables['table'])
+    collisions['floor'] = floor_collision = CollisionBox.from_shape(drawables['floor'])
+    collisions['back_wall'] = back_wall_collision = CollisionBox.from_shape(drawables['back_wall'])
+
+    table_collision.bounce_normal = floor_collision.bounce_normal = glm.vec3(1, -1, 1)
+    back_wall_collision.bounce_normal = glm.vec3(1, 1, -1)
+    floor_collision.bounce_rebound = .7
+    back_wall_collision.bounce_rebound = .7
+    table_collision.bounce_rebound = rebound
+
+    collision_system = CollisionSystem()
+    collision_system.add(ball_collision)
+    collision_system.add(table_collision)
+    collision_system.add(floor_collision)
+    collision_system.add(back_wall_collision)
+
+    # Sweep the ball so fast shots can't pass through the thin table or floor.
+    gravity.sweep_with(drawables['ball'], collision_system, ball_collision,
+                       sphere=True)
+    return drawables, collisions, gravity, collision_system
+
+
+_scene = None
+
+
+def get_scene():
+    '''
+    The game's scene, rally() with its defaults. It's built on the first
+    call rather than on import, so modules that only need rally, like the
+    sweep workers, don't build one each.
+    '''
+    global _scene
+    if _scene is None:
+        _scene = rally()
+    return _scene
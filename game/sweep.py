@@ -0,0 +1,127 @@
+'''
+Parameter sweeps: many independent rallies (see drawables.rally) run in
+worker processes.
+
+Every worker builds its own scenes and writes one row of numbers per rally
+into a shared memory array, so only the parameters and the name of the
+shared block cross between processes, not scenes or trajectories.
+
+    runs = grid(spin=[(0, 0, 0), (.1, 0, 0)], rebound=[.8, .95])
+    summaries = sweep(runs, seconds=5)
+    summaries['bounces']  # one per run, in order
+'''
+import contextlib
+import io
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from engine.gameloop.HeadlessLoop import HeadlessLoop
+from .drawables import rally
+
+# One row per rally: where the ball's center went. The fields of a bounce
+# that didn't happen are NaN.
+SUMMARY = np.dtype([
+    ('bounces', 'f8'),            # times the ball turned upwards
+    ('first_bounce_time', 'f8'),  # simulated seconds
+    ('first_bounce_x', 'f8'),
+    ('first_bounce_y', 'f8'),
+    ('first_bounce_z', 'f8'),
+    ('apex_y', 'f8'),             # highest point after the first bounce
+    ('final_x', 'f8'),
+    ('final_y', 'f8'),
+    ('final_z', 'f8'),
+])
+
+
+def grid(**values):
+    '''
+    Every combination of the given rally arguments as a list of dicts,
+    e.g. grid(spin=[...], rebound=[...], gravity=[...]).
+    '''
+    names = list(values)
+    return [dict(zip(names, combination))
+            for combination in itertools.product(*values.values())]
+
+
+def summarize(trajectories):
+    "A SUMMARY row from a rally's trajectories (see simulate)."
+    summary = np.full((), np.nan, SUMMARY)
+    position = trajectories['ball']
+    vy = trajectories['velocity'][:, 1]
+    bounces = np.flatnonzero((vy[:-1] < 0) & (vy[1:] > 0)) + 1
+    summary['bounces'] = len(bounces)
+    if len(bounces):
+        first = bounces[0]
+        summary['first_bounce_time'] = trajectories['time'][first]
+        (summary['first_bounce_x'], summary['first_bounce_y'],
+         summary['first_bounce_z']) = position[first]
+        summary['apex_y'] = position[first:, 1].max()
+    summary['final_x'], summary['final_y'], summary['final_z'] = \
+        position[-1]
+    return summary
+
+
+def simulate(seconds=10., sim_rate=120, **params):
+    '''
+    Plays one rally headless and returns its SUMMARY row.
+
+    :param params: Arguments for drawables.rally.
+    '''
+    with contextlib.redirect_stdout(io.StringIO()):  # box size prints
+        drawables, _, gravity, collision_system = rally(**params)
+    loop = HeadlessLoop([gravity], [collision_system], sim_rate)
+    loop.track('ball', drawables['ball'])
+    loop.track('velocity', probe=lambda: gravity.momentum)
+    trajectories = loop.run(seconds=seconds)
+    return summarize(trajectories)
+
+
+def _simulate_chunk(name, count, start, runs, seconds, sim_rate):
+    "Worker: simulates runs into rows start... of the shared summaries."
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        summaries = np.ndarray(count, SUMMARY, buffer=block.buf)
+        for i, params in enumerate(runs, start):
+            summaries[i] = simulate(seconds, sim_rate, **params)
+        del summaries  # release the buffer before closing
+    finally:
+        block.close()
+
+
+def sweep(runs, seconds=10., sim_rate=120, workers=None, chunksize=None):
+    '''
+    Simulates a rally for every dict of rally arguments in runs and returns
+    their summaries as a SUMMARY array, in the same order.
+
+    :param workers: Number of processes; all CPUs if None. 0 simulates
+      in this process.
+    :param chunksize: Rallies per task. By default the runs are split in
+      4 tasks per worker, few enough to keep the overhead small and enough
+      to even out rallies that take longer.
+    '''
+    count = len(runs)
+    if workers == 0 or not count:
+        return np.array([simulate(seconds, sim_rate, **params)
+                         for params in runs], SUMMARY)
+    workers = workers or os.cpu_count()
+    chunksize = chunksize or max(1, -(-count // (4 * workers)))
+
+    block = shared_memory.SharedMemory(create=True,
+                                       size=count * SUMMARY.itemsize)
+    try:
+        summaries = np.ndarray(count, SUMMARY, buffer=block.buf)
+        with ProcessPoolExecutor(workers) as executor:
+            tasks = [executor.submit(_simulate_chunk, block.name, count,
+                                     start, runs[start:start + chunksize],
+                                     seconds, sim_rate)
+                     for start in range(0, count, chunksize)]
+            for task in tasks:
+                task.result()  # raises a worker's exception here
+        result = summaries.copy()
+        del summaries
+    finally:
+        block.close()
+        block.unlink()
+    return result
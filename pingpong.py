@@ -11,12 +11,12 @@ from OpenGL.GLU import *
 from engine.gl.drawable import cube, box, Point3D
 from engine.gl.shader import Shader, Pipeline
 from engine.gl.camera import Camera
-from engine.gl.obj_loader import OBJ_to_shape
+from engine.gl import mesh_cache
 from engine.gl.constants import WIDTH, HEIGHT
 from engine.gameloop.VBOGameLoop import VBOGameLoop
 from engine.gameloop.GameLoop import GameLoop
 
-from game.drawables import drawables, collision_system, gravity
+from game.drawables import get_scene
 
 # Game Variables
 GAME_PACE_SCALAR = 1.
@@ -28,8 +28,7 @@ pygame.display.set_caption('Ping Pong')
 clock = pygame.time.Clock()
 
 model = r'C:\Users\Alex\Documents\pingpong\assets\pingponggame\Paddle.obj'
-paddle = OBJ_to_shape(model)
-paddle.gen_normals()
+paddle = mesh_cache.load_shape(model)
 # paddle.center_and_normalize()
 c = cube(.5, Point3D(-.25, -.25, .25))
 c.gen_normals()
@@ -43,6 +42,7 @@ camera = Camera()
 camera.move(0, .1, -1.2)
 camera.rotate(0, 0, 20)
 
+drawables, collisions, gravity, collision_system = get_scene()
 for d in drawables.values():
     pipeline.add_model(d)
 
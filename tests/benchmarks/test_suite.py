@@ -0,0 +1,81 @@
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from benchmarks import suite
+
+
+class SuiteTests(unittest.TestCase):
+    def test_compare(self):
+        baselines = {'a': {'1': 1., '10': 10.}}
+        results = {'a': {'1': 1.4, '10': 16., '100': 500.}, 'b': {'1': 9.}}
+        self.assertEqual(suite.compare(results, baselines, .5),
+                         [('a', '10', 16., 10.)])
+
+    def test_run_and_save(self):
+        cases = {'euler_matrix': (suite.euler_matrix, (1, 10))}
+        results = suite.run(cases, repeat=1, budget=.01,
+                            log=lambda line: None)
+        self.assertEqual(list(results['euler_matrix']), ['1', '10'])
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'baselines.json')
+            self.assertEqual(suite.load(path), {})
+            suite.save(results, path)
+            self.assertEqual(suite.load(path), results)
+            slower = {'euler_matrix': {size: ms * 3 for size, ms
+                                       in results['euler_matrix'].items()}}
+            self.assertEqual(len(suite.compare(slower, suite.load(path))), 2)
+
+    def test_cases_are_headless(self):
+        for name, (setup, sizes) in suite.CASES.items():
+            if name not in ('sphere', 'OBJ_to_shape'):  # slow to set up
+                setup(sizes[0])()
+
+    def test_gate_against_reference(self):
+        # A reference tree whose euler_matrix returns straight away makes
+        # the working tree's look like a regression.
+        with tempfile.TemporaryDirectory() as folder:
+            shutil.copytree(os.path.join(suite.ROOT, 'engine'),
+                            os.path.join(folder, 'engine'),
+                            ignore=shutil.ignore_patterns('__pycache__'))
+            path = os.path.join(folder, 'engine', 'gl', '_utils',
+                                'transformations.py')
+            with open(path, 'a') as f:
+                f.write('\ndef euler_matrix(*args):\n    return None\n')
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                status = suite.main(['--against', folder, '-k', 'euler',
+                                     '--rounds', '1', '--repeat', '1',
+                                     '--budget', '.01'])
+        self.assertEqual(status, 1)
+        self.assertIn('REGRESSION euler_matrix [1000]', out.getvalue())
+
+    def test_older_reference(self):
+        # The first commit has no Mesh, so the case that needs one is left
+        # out instead of stopping the run.
+        first = subprocess.run(
+            ['git', 'rev-list', '--max-parents=0', 'HEAD'], cwd=suite.ROOT,
+            capture_output=True, text=True, check=True).stdout.split()[-1]
+        cases = {name: (setup, sizes[:1]) for name, (setup, sizes)
+                 in suite.CASES.items()
+                 if name in ('GravityAnimator.step', 'euler_matrix')}
+        lines = []
+        current, reference = suite.against(first, cases, rounds=1, repeat=1,
+                                           budget=.01, log=lines.append)
+        self.assertEqual(list(current['euler_matrix']), ['1'])
+        self.assertEqual(list(reference['euler_matrix']), ['1'])
+        self.assertEqual(current['GravityAnimator.step'], {})
+        self.assertIn('skipped', lines[0])
+
+    def test_saved_baselines(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'baselines.json')
+            args = ['--baselines', path, '-k', 'euler', '--repeat', '1',
+                    '--budget', '.01']
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(suite.main(args + ['--save']), 0)
+                self.assertEqual(suite.main(args + ['--threshold', '100']),
+                                 0)
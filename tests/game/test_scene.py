@@ -0,0 +1,31 @@
+import contextlib
+import io
+import os
+import unittest
+from OpenGL.GL import GL_VERTEX_SHADER
+from engine.gl.glsl import preprocess
+from engine.gl.mesh_buffer import _floats
+from engine.gl.shader import Shader
+import game.drawables
+
+SHADERS = os.path.join(os.path.dirname(__file__), '..', '..', 'engine', 'gl',
+                       '_shaders')
+
+
+class SceneTests(unittest.TestCase):
+    def test_vertex_layout(self):
+        # Every drawable goes into the litvert pipeline's shared buffer,
+        # so its rows must be as wide as the shader's inputs.
+        shader = Shader(None, GL_VERTEX_SHADER)
+        shader.shadertype = GL_VERTEX_SHADER
+        with open(os.path.join(SHADERS, 'litvert.shader')) as f:
+            shader._code = preprocess(f.read())
+        shader.parse()
+        floats = _floats(shader.VAO_locations)
+        with contextlib.redirect_stdout(io.StringIO()):  # box size prints
+            drawables = game.drawables.get_scene()[0]
+        self.addCleanup(setattr, game.drawables, '_scene', None)
+        for name, drawable in drawables.items():
+            self.assertEqual(drawable.render_data[0].data.shape[1], floats,
+                             name)
+            self.assertEqual(drawable._VBO_format, 'vnc', name)
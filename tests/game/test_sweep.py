@@ -0,0 +1,81 @@
+import contextlib
+import io
+import unittest
+import numpy as np
+from engine.gameloop.HeadlessLoop import HeadlessLoop
+import game.drawables
+from game.drawables import rally
+from game.sweep import SUMMARY, grid, summarize, sweep
+
+
+class SweepTests(unittest.TestCase):
+    def setUp(self):
+        # Other tests may have built the shared scene already.
+        game.drawables._scene = None
+
+    def test_grid(self):
+        runs = grid(rebound=[.5, .9], gravity=[.003])
+        self.assertEqual(runs, [{'rebound': .5, 'gravity': .003},
+                                {'rebound': .9, 'gravity': .003}])
+
+    def test_summarize(self):
+        trajectories = {
+            'time': np.arange(5.),
+            'ball': np.array([[0, 3, 0], [0, 1, 0], [0, 0, 1],
+                              [0, 2, 2], [0, 1, 3.]]),
+            'velocity': np.array([[0, -2, 0], [0, -1, 1], [0, 2, 1],
+                                  [0, -1, 1], [0, -1, 1.]]),
+        }
+        summary = summarize(trajectories)
+        self.assertEqual(summary['bounces'], 1)
+        self.assertEqual(summary['first_bounce_time'], 2)
+        self.assertEqual(summary['first_bounce_z'], 1)
+        self.assertEqual(summary['apex_y'], 2)
+        self.assertEqual(summary['final_z'], 3)
+
+    def test_no_bounce(self):
+        trajectories = {'time': np.arange(2.), 'ball': np.zeros((2, 3)),
+                        'velocity': -np.ones((2, 3))}
+        summary = summarize(trajectories)
+        self.assertEqual(summary['bounces'], 0)
+        self.assertTrue(np.isnan(summary['apex_y']))
+
+    def test_scene_built_on_first_use(self):
+        drawables, _, gravity, _ = game.drawables.get_scene()
+        self.addCleanup(setattr, game.drawables, '_scene', None)
+        # built once, then shared
+        self.assertIs(game.drawables.get_scene()[0], drawables)
+        self.assertIn(drawables['ball'], gravity.targets)
+
+    def test_processes_match_inline(self):
+        runs = grid(ball_position=[(-.25, 0, 0)], rebound=[.5, .95],
+                    spin=[(0, 0, 0), (0, .05, 0)])
+        inline = sweep(runs, seconds=1, workers=0)
+        pooled = sweep(runs, seconds=1, workers=2, chunksize=3)
+        self.assertEqual(pooled.dtype, SUMMARY)
+        self.assertEqual(inline.tobytes(), pooled.tobytes())
+        # the livelier table sends the ball higher
+        self.assertGreater(inline['apex_y'][2], inline['apex_y'][0])
+        # and sidespin curves it
+        self.assertNotEqual(inline['final_x'][1], inline['final_x'][0])
+
+
+class SimRateTests(unittest.TestCase):
+    def path(self, sim_rate, **params):
+        "The ball's position every 1/20 s of a 2 s rally."
+        with contextlib.redirect_stdout(io.StringIO()):  # box size prints
+            drawables, _, gravity, collision_system = rally(**params)
+        loop = HeadlessLoop([gravity], [collision_system], sim_rate)
+        loop.track('ball', drawables['ball'])
+        loop.track('velocity', probe=lambda: gravity.momentum)
+        trajectories = loop.run(seconds=2., every=sim_rate // 20)
+        self.assertGreaterEqual(summarize(trajectories)['bounces'], 2)
+        return trajectories['ball']
+
+    def test_same_path_at_any_rate(self):
+        for params in ({}, {'ball_position': (-.25, 0, 0),
+                            'spin': (0, .05, 0)}):
+            expected = self.path(1000, **params)
+            for sim_rate in (60, 120):
+                np.testing.assert_allclose(self.path(sim_rate, **params),
+                                           expected, atol=.005)
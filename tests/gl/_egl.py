@@ -0,0 +1,42 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# PyOpenGL can only use EGL if it's picked before OpenGL is first imported,
+# which the other tests have done, so GL scenes are run in a new process.
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+
+def run_scene(test, source, *argv, cache=None):
+    '''
+    Runs source, a script whose last line of output is a JSON object, with
+    an offscreen EGL context and returns that object. Skips test if there's
+    no EGL, or if the object has an 'error', which the scene sets when it
+    can't get a context.
+
+    :param argv: Arguments for the script, in sys.argv[1:].
+    :param cache: The program cache folder; a new empty one by default.
+    '''
+    folder = None
+    if cache is None:
+        folder = tempfile.TemporaryDirectory()
+        cache = folder.name
+    try:
+        env = dict(os.environ, PYOPENGL_PLATFORM='egl',
+                   PINGPONG_PROGRAM_CACHE=cache)
+        out = subprocess.run([sys.executable, '-c', source, *argv], env=env,
+                             capture_output=True, text=True, timeout=120,
+                             cwd=ROOT)
+    finally:
+        if folder is not None:
+            folder.cleanup()
+    if out.returncode and 'OpenGL' in out.stderr and 'EGL' in out.stderr:
+        test.skipTest("EGL is not available: " +
+                      out.stderr.strip().splitlines()[-1])
+    test.assertEqual(out.returncode, 0, out.stderr)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    if 'error' in result:
+        test.skipTest(result['error'])
+    return result
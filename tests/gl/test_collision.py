@@ -0,0 +1,163 @@
+import unittest
+import glm
+import numpy as np
+from engine.gl.broadphase import AllPairs, HashGrid, SweepAndPrune
+from engine.gl.animations import GravityAnimator
+from engine.gl.collision import CollisionBox, CollisionSystem, \
+    box_box_collision, swept_box_box, swept_sphere_box
+from engine.gl.drawable import Point3D, box, sphere
+
+
+def random_boxes(count, seed=0):
+    rng = np.random.default_rng(seed)
+    lower = rng.uniform(0, 10, (count, 3))
+    return lower, lower + rng.uniform(.1, 1.5, (count, 3))
+
+
+class BroadphaseTests(unittest.TestCase):
+    def test_matches_all_pairs(self):
+        lower, upper = random_boxes(300)
+        expected = AllPairs().pairs(lower, upper)
+        self.assertGreater(len(expected), 0)
+        for broadphase in (SweepAndPrune(), SweepAndPrune(axis=2),
+                           HashGrid(), HashGrid(cell_size=.3)):
+            np.testing.assert_array_equal(
+                broadphase.pairs(lower, upper), expected)
+
+    def test_sweep_reuses_order(self):
+        sweep = SweepAndPrune()
+        lower, upper = random_boxes(200)
+        sweep.pairs(lower, upper)
+        lower, upper = lower + .05, upper + .05
+        lower[::7] -= 2  # some boxes move further
+        np.testing.assert_array_equal(sweep.pairs(lower, upper),
+                                      AllPairs().pairs(lower, upper))
+
+    def test_touching_boxes(self):
+        lower = np.array([[0., 0, 0], [1, 0, 0], [2.5, 0, 0]])
+        for broadphase in (SweepAndPrune(), HashGrid()):
+            np.testing.assert_array_equal(
+                broadphase.pairs(lower, lower + 1), [[0, 1]])
+
+
+class CollisionSystemTests(unittest.TestCase):
+    def test_same_collisions_as_all_pairs(self):
+        lower, upper = random_boxes(60, seed=1)
+        boxes = []
+        for near, far in zip(lower, upper):
+            box = CollisionBox(*(far - near))
+            box.attach_to_point(type('P', (), {'vertex': glm.vec3(*near)}))
+            boxes.append(box)
+
+        expected = []
+        areas = boxes.copy()
+        while areas:
+            a = areas.pop()
+            expected += [(a, b) for b in areas if box_box_collision(a, b)]
+
+        for broadphase in (None, HashGrid()):
+            system = CollisionSystem(broadphase)
+            found = []
+            for box in boxes:
+                box.handler = lambda a, b: found.append((a, b))
+                system.add(box)
+            system.detect()
+            self.assertEqual(found, expected)
+
+    def test_moved_boxes_update_their_rows(self):
+        still = CollisionBox(1, 1, 1)
+        point = type('P', (), {'vertex': glm.vec3(5, 0, 0)})()
+        still.attach_to_point(point)
+        shape = box(1, 1, 1, Point3D(0, 0, 0))
+        moving = CollisionBox(1, 1, 1)
+        moving.attach_to_shape(shape)
+        system = CollisionSystem()
+        system.add(still)
+        system.add(moving)
+        found = []
+        moving.handler = lambda a, b: found.append(a)
+        system.detect()
+        self.assertEqual(found, [])
+        self.assertEqual(system._moved, {})
+        shape.move(4.5, 0, 0)  # the shape tells its box
+        self.assertEqual(list(system._moved.values()), [moving])
+        system.detect()
+        self.assertEqual(found, [moving])
+        np.testing.assert_array_equal(system._lower[1], [4.5, 0, 0])
+        # A point moved by hand needs telling.
+        point.vertex = glm.vec3(20, 0, 0)
+        still.moved()
+        system.update_bounds()
+        np.testing.assert_array_equal(system._lower[0], [20, 0, 0])
+        del system[0]
+        self.assertEqual(still._systems, [])
+
+
+class ContinuousCollisionTests(unittest.TestCase):
+    unit_box = (np.zeros((1, 3)), np.ones((1, 3)))
+
+    def test_swept_sphere_face(self):
+        floor = (np.array([[-1, -.001, -1]]), np.array([[1, 0, 1]]))
+        times, normals = swept_sphere_box((0, 1, 0), .1, (0, -2, 0), *floor)
+        np.testing.assert_allclose(times, [.45])
+        np.testing.assert_array_equal(normals, [[0, 1, 0]])
+
+    def test_swept_sphere_edge(self):
+        times, normals = swept_sphere_box((-1, -1, .5), .5, (2, 2, 0),
+                                          *self.unit_box)
+        # the center is .5 from the edge at x = y = 0, not at x = -.5
+        t = (1 - .5 / np.sqrt(2)) / 2
+        np.testing.assert_allclose(times, [t])
+        np.testing.assert_allclose(normals, [[-.5 ** .5, -.5 ** .5, 0]])
+
+    def test_swept_sphere_misses_corner(self):
+        # passes through the corner of the box grown by the radius, but
+        # stays more than the radius from the box's edge
+        args = ((-1, .9, .5), .5, (2, 2, 0))
+        times, _ = swept_sphere_box(*args, *self.unit_box)
+        self.assertEqual(times[0], np.inf)
+        times, _ = swept_box_box((-1.5, .4, 0), (-.5, 1.4, 1), args[2],
+                                 *self.unit_box)
+        self.assertLess(times[0], 1)
+
+    def test_swept_box_ignores_overlap_and_parallel(self):
+        times, _ = swept_box_box((.5, .5, .5), (.7, .7, .7), (3, 0, 0),
+                                 *self.unit_box)
+        self.assertEqual(times[0], np.inf)
+        times, _ = swept_box_box((-1, 2, 0), (-.5, 2.5, 1), (3, 0, 0),
+                                 *self.unit_box)
+        self.assertEqual(times[0], np.inf)
+
+    def fast_shot(self):
+        floor = box(.001, 10, 5, Point3D(-5, -.001, -3))
+        ball = sphere(.02, Point3D(0., 0., 0.))
+        ball.move(0, .5, 0)
+        system = CollisionSystem()
+        ball_area = CollisionBox.from_shape(ball)
+        floor_area = CollisionBox.from_shape(floor)
+        floor_area.bounce_rebound = .5
+        system.add(ball_area)
+        system.add(floor_area)
+        return ball, ball_area, system
+
+    def test_fast_ball_bounces_off_thin_floor(self):
+        ball, area, system = self.fast_shot()
+        velocity = system.move(area, glm.vec3(.3, -1, 0), sphere=True)
+        # it reaches the floor after .48 of the step, then bounces up at
+        # half the speed for the rest of it
+        self.assertEqual(velocity, glm.vec3(.15, .5, 0))
+        self.assertAlmostEqual(area.base.y, .52 * .5, places=4)
+        self.assertAlmostEqual(ball.offset[3].x, .3 * .48 + .15 * .52,
+                               places=4)
+
+    def test_gravity_sweep(self):
+        ball, area, system = self.fast_shot()
+        gravity = GravityAnimator(.05)
+        gravity.apply_to(ball)
+        gravity.sweep_with(ball, system, area, sphere=True)
+        gravity.momentum = glm.vec3(0, -2, 0)
+        heights = []
+        for _ in range(20):
+            gravity.step()
+            heights.append(area.base.y)
+        self.assertGreater(min(heights), 0)
@@ -0,0 +1,60 @@
+import unittest
+import glm
+import numpy as np
+from engine.gl.camera import Camera
+from engine.gl.drawable import Mesh, Point3D, cube
+from engine.gl.utils import bounds
+from engine.gameloop.VBOGameLoop import VBOGameLoop
+
+
+class CullingTests(unittest.TestCase):
+    def test_local_bounds(self):
+        shape = cube(2., Point3D(1, 1, 1))
+        self.assertIsNone(shape.local_bounds)
+        shape.compile_VBO()
+        b = shape.local_bounds
+        np.testing.assert_allclose(b.lower, [1, 1, 1])
+        np.testing.assert_allclose(b.upper, [3, 3, 3])
+        np.testing.assert_allclose(b.center, [2, 2, 2])
+        self.assertAlmostEqual(b.radius, np.sqrt(3))
+
+    def test_include(self):
+        b = bounds.local_bounds([[0, 0, 0], [2, 2, 2]])
+        self.assertIs(bounds.include(b, [[1, 1, 1]]), b)
+        grown = bounds.include(b, [[4, 1, 1]])
+        np.testing.assert_allclose(grown.upper, [4, 2, 2])
+        np.testing.assert_allclose(grown.center, [2, 1, 1])
+        self.assertAlmostEqual(grown.radius, np.sqrt(6))
+
+    def test_frustum(self):
+        projection = glm.perspective(glm.radians(90.), 1., .1, 10.)
+        planes = bounds.frustum_planes(projection)  # looking down -z
+        centers = np.array([[0, 0, -5], [0, 0, 5], [0, 0, -20],
+                            [7, 0, -5], [5.5, 0, -5]], 'f')
+        inside = bounds.spheres_in_frustum(planes, centers, np.ones(5))
+        np.testing.assert_array_equal(inside, [1, 0, 0, 0, 1])
+
+    def test_world_spheres(self):
+        matrices = bounds.matrix_array([
+            glm.translate(glm.vec3(1, 2, 3)),
+            glm.scale(glm.vec3(1, 4, 2))])
+        centers, radii = bounds.world_spheres(
+            matrices, np.array([[1., 0, 0], [0, 1, 0]]), np.ones(2))
+        np.testing.assert_allclose(centers, [[2, 2, 3], [0, 4, 0]])
+        np.testing.assert_allclose(radii, [1, 4])
+
+    def test_cull_models(self):
+        camera = Camera()
+        loop = VBOGameLoop(cameras=[camera])
+        models = []
+        for x in (0, 50, -50):
+            mesh = Mesh.from_shape(cube(.5, Point3D(0, 0, 0)))
+            mesh.compile_VBO()
+            mesh.move(x, 0, -2)
+            models.append((mesh, None))
+        projection = glm.perspective(45, 1., .02, 5)
+        planes = camera.frustum_planes(projection)
+        visible = loop.cull(models, planes)
+        self.assertEqual(visible, models[:1])
+        self.assertEqual(loop.frame_stats['drawn'], 1)
+        self.assertEqual(loop.frame_stats['culled'], 2)
@@ -1,4 +1,134 @@
 import unittest
+import glm
+import numpy as np
+from engine.gl.drawable import Instances, Mesh, Point3D, cube, sphere
+from engine.gl.glsl import ShaderVar
+from engine.gl.vao import _pointer_args
+
 
 class DrawableTests(unittest.TestCase):
-    pass
\ No newline at end of file
+    def test_mesh_from_shape(self):
+        shape = sphere(1., Point3D(0, 0, 0), detail=1)
+        shape.compile_VBO()
+        mesh = Mesh.from_shape(shape)
+        # shared icosphere vertices are stored once
+        self.assertEqual(len(mesh.positions), 42)
+        self.assertEqual(len(mesh), len(shape.index_buffer))
+        mesh.compile_VBO()
+        self.assertEqual(mesh._VBO_format, shape._VBO_format)
+        np.testing.assert_array_equal(
+            mesh.render_data[0].data[mesh.index_buffer.data],
+            shape._VBO.data[shape.index_buffer.data])
+
+    def test_mesh_transform(self):
+        mesh = Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]])
+        self.assertEqual(mesh.VBO_format, 'vc')
+        mesh.move(1, 2, 3)
+        self.assertEqual(mesh.model_matrix[3].xyz, glm.vec3(1, 2, 3))
+        shape = cube(1., Point3D(0, 0, 0))
+        shape.move(1, 2, 3)
+        mesh = Mesh.from_shape(shape)
+        self.assertEqual(mesh.model_matrix, shape.model_matrix)
+        # The mesh has its own copy of the transform.
+        mesh.move(1, 0, 0)
+        self.assertEqual(shape.offset[3].xyz, glm.vec3(1, 2, 3))
+        self.assertEqual(mesh.model_matrix[3].xyz, glm.vec3(2, 2, 3))
+
+    def test_mesh_attribute_length(self):
+        with self.assertRaises(ValueError):
+            Mesh([[0, 0, 0], [1, 0, 0]], normals=[[0, 0, 1]])
+
+    def test_compile_in_place(self):
+        shape = cube(1., Point3D(0, 0, 0))
+        shape.compile_VBO()
+        data = shape._VBO.data
+        self.assertEqual(data.shape, (36, 6))
+        shape.shapes[0].points[0].vertex = glm.vec3(5, 5, 5)
+        shape.compile_VBO(force=True)
+        self.assertIs(shape._VBO.data, data)
+        np.testing.assert_array_equal(data[0, :3], (5, 5, 5))
+
+        out = np.zeros_like(data)
+        shape.compile_VBO(out=out)
+        self.assertIs(shape._VBO.data, out)
+        np.testing.assert_array_equal(out, data)
+        with self.assertRaises(ValueError):
+            shape.compile_VBO(out=np.zeros((3, 6), 'f'))
+        shape.indexed = True
+        with self.assertRaises(ValueError):
+            shape.compile_VBO(out=out)
+
+    def test_update_positions_in_place(self):
+        mesh = Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]])
+        vbo = mesh.render_data[0]
+        data = vbo.data
+        mesh.update_positions([(4, 5, 6)], first=1)
+        self.assertIs(mesh.render_data[0], vbo)
+        self.assertIs(vbo.data, data)
+        np.testing.assert_array_equal(data[1, :3], (4, 5, 6))
+        self.assertEqual(mesh.local_bounds.upper.tolist(), [4, 5, 6])
+
+    def test_smooth_normals(self):
+        shape = sphere(1., Point3D(0, 0, 0), detail=2)
+        for point in (p for s in shape.shapes for p in s.points):
+            # on a unit sphere the smooth normal is the position itself
+            self.assertAlmostEqual(glm.dot(point.normal, point.vertex), 1.,
+                                   places=2)
+
+    def test_flat_and_angle_normals(self):
+        for mode in ('flat', 'angle'):
+            shape = cube(1., Point3D(0, 0, 0))
+            shape.gen_normals(mode)
+            for face in shape.shapes:
+                for point in face.points:
+                    self.assertEqual(point.normal, face.normal)
+            _, arrays, _ = shape.vertex_arrays()
+            self.assertEqual(len(arrays[0]), 24)  # 8 corners x 3 faces
+
+        shape = cube(1., Point3D(0, 0, 0))
+        shape.gen_normals('angle', angle=100.)
+        _, arrays, _ = shape.vertex_arrays()
+        self.assertEqual(len(arrays[0]), 8)
+
+    def test_mesh_normals(self):
+        mesh = Mesh.from_shape(cube(1., Point3D(0, 0, 0)))
+        mesh.gen_normals()
+        self.assertEqual(len(mesh.normals), 8)
+        np.testing.assert_allclose(np.linalg.norm(mesh.normals, axis=1), 1,
+                                   rtol=1e-6)
+        # every corner normal points away from the center of the cube
+        outward = np.sign(mesh.positions - .5)
+        np.testing.assert_array_equal(np.sign(mesh.normals), outward)
+        mesh.gen_normals('flat')
+        self.assertEqual(len(mesh.positions), 24)
+        self.assertEqual(len(mesh), 36)
+        np.testing.assert_allclose(np.abs(mesh.normals).sum(1), 1)
+
+    def test_instance_data(self):
+        matrices = [glm.translate(glm.vec3(i, 2, 3)) for i in range(4)]
+        instances = Instances(cube(1., Point3D(0, 0, 0)), matrices)
+        self.assertEqual(len(instances), 4)
+        data = instances.instance_data()
+        self.assertEqual(data.shape, (4, 19))
+        # same bytes as the glm matrix, i.e. column major
+        np.testing.assert_array_equal(
+            data[2, :16], np.frombuffer(matrices[2].to_bytes(), 'f'))
+        np.testing.assert_array_equal(data[:, 16:], 1)
+
+        instances.compile_VBO()
+        vbo = instances.instance_buffer
+        instances.update(colors=[(1, 0, 0)] * 4)
+        instances.update(matrices[:2])
+        instances.compile_VBO()
+        # the buffer is rewritten, not replaced
+        self.assertIs(instances.instance_buffer, vbo)
+        self.assertEqual(vbo.data.shape, (2, 19))
+        np.testing.assert_array_equal(vbo.data[:, 16:], 1)
+
+    def test_instance_attributes(self):
+        args = _pointer_args({3: ShaderVar('in', 'mat4', 'instance_model'),
+                              7: ShaderVar('in', 'vec3', 'instance_color')})
+        self.assertEqual([a[0] for a in args], [3, 4, 5, 6, 7])
+        self.assertEqual([a[1] for a in args], [4, 4, 4, 4, 3])
+        self.assertEqual({a[4] for a in args}, {19 * 4})
+        self.assertEqual(args[-1][5].value, 16 * 4)
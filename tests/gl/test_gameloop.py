@@ -0,0 +1,253 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import unittest
+from types import SimpleNamespace
+import glm
+import numpy as np
+from engine.gl.animations import PhysicsWorld
+from engine.gl.camera import Camera
+from engine.gl.drawable import Mesh
+from engine.gameloop.HeadlessLoop import HeadlessLoop
+from engine.gameloop.timing import TICK
+from engine.gameloop.Profiler import PHASES, Profiler
+from engine.gameloop.SnapshotBuffer import SnapshotBuffer
+from engine.gameloop.VBOGameLoop import VBOGameLoop
+
+
+def simulation(rate=100, max_steps=8, **kwargs):
+    "A loop with one falling mesh and a shader stand-in; no GL needed."
+    mesh = Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]])
+    world = PhysicsWorld(gravity=(0, 0, 0))
+    world.apply_to(mesh)
+    world.velocity[0] = (rate * TICK, 0., 0.)  # a unit a step
+    shader = SimpleNamespace(_models_and_VAOs=[(mesh, None)],
+                             _instances_and_VAOs=[])
+    loop = VBOGameLoop([shader], cameras=[], sim_rate=rate,
+                       max_sim_steps=max_steps, **kwargs)
+    loop.animators.append(world)
+    return loop, mesh, world
+
+
+class FixedTimestepTests(unittest.TestCase):
+    def test_steps_per_frame(self):
+        loop, mesh, world = simulation()
+        steps = []
+        for elapsed in (.025, .025, .005, .005):
+            loop.advance(elapsed)
+            steps.append(loop.frame_stats['sim_steps'])
+        self.assertEqual(steps, [2, 3, 0, 1])
+        self.assertAlmostEqual(world.position[0, 0], 6.)
+
+    def test_catch_up_cap(self):
+        loop, mesh, world = simulation(max_steps=4)
+        loop.advance(1.)  # a long stall
+        self.assertEqual(loop.frame_stats['sim_steps'], 4)
+        loop.advance(.01)
+        self.assertEqual(loop.frame_stats['sim_steps'], 1)
+
+    def test_interpolation(self):
+        loop, mesh, world = simulation()
+        # Drawing runs a step behind, halfway from the first step's state
+        # to the second's.
+        loop.advance(.025)
+        self.assertAlmostEqual(mesh.model_matrix[3].x, 2.)
+        self.assertAlmostEqual(loop.render_matrix(mesh)[3].x, 1.5)
+        loop.advance(.005)  # on a step boundary
+        self.assertAlmostEqual(mesh.model_matrix[3].x, 3.)
+        self.assertAlmostEqual(loop.render_matrix(mesh)[3].x, 2.)
+
+    def test_still_models_are_not_interpolated(self):
+        loop, mesh, world = simulation()
+        world.velocity[0] = 0.
+        loop.advance(.025)
+        self.assertEqual(loop._render_matrices, {})
+        self.assertEqual(loop.render_matrix(mesh), mesh.model_matrix)
+
+
+class HeadlessLoopTests(unittest.TestCase):
+    def test_no_display_imports(self):
+        code = ('import sys; import engine.gameloop.HeadlessLoop; '
+                'print(any(m.split(".")[0] in ("pygame", "OpenGL") '
+                'for m in sys.modules))')
+        out = subprocess.run([sys.executable, '-c', code], check=True,
+                             capture_output=True, text=True).stdout
+        self.assertEqual(out.strip(), 'False')
+
+    def test_trajectories(self):
+        mesh = Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]])
+        world = PhysicsWorld(gravity=(0, -1, 0))
+        world.apply_to(mesh)
+        world.add(velocity=(1, 0, 0))
+        loop = HeadlessLoop([world], sim_rate=60)  # a tick a step
+        loop.track('mesh', mesh)
+        loop.track('bodies', probe=lambda: world.position)
+        trajectories = loop.run(seconds=5 * TICK, every=2)
+        np.testing.assert_allclose(trajectories['time'],
+                                   np.array([0, 2, 4, 5]) * TICK)
+        np.testing.assert_allclose(trajectories['mesh'][:, 1],
+                                   [0, -3, -10, -15])
+        self.assertEqual(trajectories['bodies'].shape, (4, 2, 3))
+        np.testing.assert_allclose(trajectories['bodies'][:, 1, 0],
+                                   [0, 2, 4, 5])
+        self.assertEqual(loop.steps, 5)
+
+    def test_until(self):
+        world = PhysicsWorld(gravity=(0, -1, 0))
+        world.add(position=(0, 10, 0))
+        loop = HeadlessLoop([world], sim_rate=60)
+        loop.track('y', probe=lambda: world.position[0, 1])
+        trajectories = loop.run(steps=100,
+                                until=lambda: world.position[0, 1] <= 0)
+        self.assertEqual(loop.steps, 4)  # 10 - (1 + 2 + 3 + 4)
+        np.testing.assert_allclose(trajectories['y'], [10, 9, 7, 4, 0])
+        self.assertRaises(ValueError, loop.run)
+        self.assertRaises(ValueError, loop.track, 'y')
+
+
+class ThreadedTests(unittest.TestCase):
+    def test_snapshots(self):
+        snapshots = SnapshotBuffer(['a', 'b'])
+        for x in (1, 2, 3):
+            matrices = np.tile(np.eye(4, dtype='f'), (2, 1, 1))
+            matrices[:, 3, 0] = x
+            snapshots.publish(matrices, float(x))
+        with snapshots.read() as snapshot:
+            self.assertEqual(snapshot.time, 3.)
+            np.testing.assert_array_equal(snapshot.previous[:, 3, 0], 2)
+            np.testing.assert_array_equal(snapshot.current[:, 3, 0], 3)
+            self.assertFalse(snapshot.current.flags.writeable)
+
+    def test_writer_waits_for_reader(self):
+        snapshots = SnapshotBuffer(['a'])
+        snapshots.publish(np.eye(4, dtype='f')[None], 1.)
+        with snapshots.read() as snapshot:
+            # the back buffer is free, then the reader holds the next one
+            snapshots.publish(np.eye(4, dtype='f')[None], 2.)
+            writer = threading.Thread(target=snapshots.publish,
+                                      args=(np.eye(4, dtype='f')[None], 3.))
+            writer.start()
+            writer.join(.05)
+            self.assertTrue(writer.is_alive())
+            self.assertEqual(snapshot.time, 1.)
+        writer.join(1.)
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(snapshots.published, 3)
+
+    def test_simulation_thread(self):
+        loop, mesh, world = simulation(rate=1000)
+        loop.threaded = True
+        loop.snapshots = SnapshotBuffer([mesh])
+        handled = []
+        loop.define_handler(1, lambda loop, event: handled.append(event))
+        loop._events.put(SimpleNamespace(type=1))
+        loop.exit_flag = False
+        thread = threading.Thread(target=loop.simulate)
+        thread.start()
+        time.sleep(.05)
+        loop.interpolate_snapshot()
+        loop.exit_flag = True
+        thread.join()
+        self.assertEqual(len(handled), 1)
+        self.assertGreater(loop.frame_stats['sim_steps'], 5)
+        x = loop.render_matrix(mesh)[3].x
+        self.assertGreater(x, 5.)
+        self.assertLessEqual(x, world.position[0, 0])
+
+    def test_render_thread_state(self):
+        loop, mesh, _ = simulation()
+        loop.view = Camera()
+        loop.threaded = True
+        loop.snapshots = SnapshotBuffer([mesh], [loop.view])
+        loop.snapshots.publish(loop._snapshot_matrices(), 1.)
+        loop.interpolate_snapshot()
+        drawn = glm.mat4(loop.view_matrix())
+        # The simulation thread moves the camera; frames keep drawing the
+        # published view until the next snapshot.
+        loop.view.rotate(10, 0, 0)
+        self.assertEqual(loop.view_matrix(), drawn)
+        loop.snapshots.publish(loop._snapshot_matrices(), 2.)
+        loop.interpolate_snapshot()
+        self.assertEqual(loop.view_matrix(), loop.view.matrix)
+        self.assertNotEqual(loop.view_matrix(), drawn)
+        # Vertex changes wait for the main thread.
+        loop.on_render_thread(mesh.update_positions, [(5, 5, 5)])
+        self.assertEqual(mesh.positions[0].tolist(), [0, 0, 0])
+        loop.run_render_tasks()
+        self.assertEqual(mesh.positions[0].tolist(), [5, 5, 5])
+
+    def test_frame_time_histogram(self):
+        loop, _, _ = simulation()
+        loop.frame_times.extend([.016, .017, .016, .040])
+        counts, edges = loop.frame_time_histogram()
+        self.assertEqual(counts.sum(), 4)
+        self.assertEqual(counts[np.searchsorted(edges, 16.5) - 1], 2)
+        self.assertEqual(counts[np.searchsorted(edges, 40) - 1], 1)
+
+
+class ProfilerTests(unittest.TestCase):
+    def test_ring_buffer(self):
+        profiler = Profiler(capacity=4, phases=('a',), counters=('n',))
+        for n in range(6):
+            profiler.start_frame()
+            profiler.mark('a')
+            profiler.end_frame({'n': n, 'other': 1})
+        self.assertEqual(profiler.frames, 6)
+        recent = profiler.recent()
+        np.testing.assert_array_equal(recent[:, 2], [2, 3, 4, 5])
+        self.assertTrue((recent[:, 0] <= recent[:, 1]).all())
+        stats = profiler.percentiles((0, 50, 100))
+        np.testing.assert_allclose(stats['n'], [2, 3.5, 5])
+
+    def test_loop_phases(self):
+        loop, mesh, world = simulation(profile=True)
+        profiler = loop.profiler
+        profiler.start_frame()
+        loop.advance(.025)
+        profiler.mark('interpolate')
+        profiler.end_frame(loop.frame_stats)
+        frame = dict(zip(profiler.columns, profiler.recent()[0]))
+        self.assertGreater(frame['animators'], 0)
+        self.assertGreater(frame['collision'], 0)
+        self.assertEqual(frame['render'], 0)
+        self.assertEqual(frame['sim_steps'], 2)
+        self.assertAlmostEqual(sum(frame[p] for p in PHASES), frame['frame'],
+                               places=4)
+        self.assertTrue(profiler.overlay_lines()[0].startswith('frame'))
+
+    def test_dump(self):
+        profiler = Profiler()
+        for _ in range(3):
+            profiler.start_frame()
+            profiler.mark('render')
+            profiler.end_frame({'drawn': 7})
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'frames.csv')
+            profiler.dump(path)
+            with open(path) as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual(len(rows), 3)
+            self.assertEqual(float(rows[0]['drawn']), 7)
+            path = os.path.join(folder, 'frames.json')
+            profiler.dump(path)
+            with open(path) as f:
+                data = json.load(f)
+            self.assertEqual(data['percentiles']['drawn']['p99'], 7)
+            self.assertEqual(len(data['data']), 3)
+
+    def test_overhead(self):
+        profiler = Profiler()
+
+        def frame():
+            profiler.start_frame()
+            for phase in PHASES:
+                profiler.mark(phase)
+            profiler.end_frame({'drawn': 1, 'gl_calls': 10})
+        seconds = min(timeit.repeat(frame, number=100, repeat=5)) / 100
+        self.assertLess(seconds, .02 / 60)  # 2% of a 60 fps frame
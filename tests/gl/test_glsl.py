@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+from engine.gl.glsl import GLSLError, ShaderVar, preprocess, reflect
+
+SOURCE = '''#version 420
+#define NUM_LIGHTS 4
+// uniform float commented_out;
+#ifdef NUM_LIGHTS
+uniform vec3 light_pos[NUM_LIGHTS], light_color[NUM_LIGHTS]; /* two
+lines */ uniform float glare = 16.;
+#else
+uniform vec3 light_pos;
+#endif
+#if defined(TEXTURED) && NUM_LIGHTS > 2
+uniform sampler2D tex;
+#elif NUM_LIGHTS > 2
+uniform float untextured;
+#endif
+layout (location=3) in mat4 instance_model;
+layout (std140, binding=0) uniform Frame {
+    mat4 view;
+    vec3 eye;  // camera
+};
+out VS { vec3 x; } vs;
+out vec4 fragment_color;
+struct Light { vec3 position; };
+float brightness(in float x) { return x; }
+'''
+
+
+class PreprocessTests(unittest.TestCase):
+    def test_conditionals_and_macros(self):
+        code = preprocess(SOURCE)
+        self.assertTrue(code.startswith('#version 420\n'))
+        self.assertIn('uniform vec3 light_pos[4], light_color[4];', code)
+        self.assertIn('uniform float untextured;', code)
+        for missing in ('commented_out', 'sampler2D', 'vec3 light_pos;'):
+            self.assertNotIn(missing, code)
+        # Line numbers are kept for compiler errors.
+        self.assertEqual(len(code.split('\n')), len(SOURCE.split('\n')))
+
+    def test_defines(self):
+        code = preprocess(SOURCE, defines={'TEXTURED': 1})
+        self.assertTrue(code.startswith(
+            '#version 420\n#define TEXTURED 1\n#line 2\n'))
+        # the #line directive numbers the lines after it as in SOURCE
+        self.assertEqual(len(code.split('\n')), len(SOURCE.split('\n')) + 2)
+        # which before GLSL 3.30 numbered its own line
+        for source, line in (('#version 120\nx;', 1), ('x;', 0),
+                             ('#version 300 es\nx;', 2)):
+            self.assertIn(f'#define A 1\n#line {line}\nx;',
+                          preprocess(source, defines={'A': 1}))
+        self.assertIn('uniform sampler2D tex;', code)
+        self.assertNotIn('untextured', code)
+
+    def test_include(self):
+        with tempfile.TemporaryDirectory() as folder:
+            with open(os.path.join(folder, 'lights.glsl'), 'w') as f:
+                f.write('#ifndef LIGHTS\n#define LIGHTS\n'
+                        'uniform vec3 light_pos;\n#endif\n')
+            path = os.path.join(folder, 'main.shader')
+            code = preprocess('#include "lights.glsl"\n'
+                              '#include "lights.glsl"\n', path=path)
+            self.assertEqual(code.count('uniform vec3 light_pos;'), 1)
+            with self.assertRaises(GLSLError):
+                preprocess('#include "missing.glsl"\n', path=path)
+
+    def test_errors(self):
+        for code in ('#if 1\n', '#endif\n', '#error no\n', '#if x(\n#endif'):
+            with self.assertRaises(GLSLError):
+                preprocess(code)
+
+
+class ReflectTests(unittest.TestCase):
+    def test_declarations(self):
+        reflection = reflect(preprocess(SOURCE), vertex=False)
+        self.assertEqual(reflection.version, 420)
+        self.assertEqual(reflection.uniforms, (
+            ShaderVar('uniform', 'vec3', 'light_pos', 4),
+            ShaderVar('uniform', 'vec3', 'light_color', 4),
+            ShaderVar('uniform', 'float', 'glare'),
+            ShaderVar('uniform', 'float', 'untextured')))
+        self.assertEqual(reflection.inputs, (
+            ShaderVar('in', 'mat4', 'instance_model', location=3),))
+        self.assertEqual(reflection.outputs, (
+            ShaderVar('out', 'vec4', 'fragment_color'),))
+        block, = reflection.blocks
+        self.assertEqual((block.name, block.binding, block.instance),
+                         ('Frame', 0, None))
+        self.assertEqual([var.name for var in block.members], ['view', 'eye'])
+
+    def test_varying(self):
+        code = 'varying vec4 vertex_color;'
+        self.assertEqual(reflect(code, vertex=True).outputs[0].name,
+                         'vertex_color')
+        self.assertEqual(reflect(code, vertex=False).inputs[0].name,
+                         'vertex_color')
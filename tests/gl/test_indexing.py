@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+from engine.gl.drawable import Mesh, Point3D, cube, sphere
+from engine.gl.utils import indexing
+
+
+class IndexingTests(unittest.TestCase):
+    def test_deduplicate(self):
+        data = np.array([[0, 0], [1, 1], [0, 0], [2, 2], [1, 1]], 'f')
+        vertices, indices = indexing.deduplicate(data)
+        np.testing.assert_array_equal(vertices, [[0, 0], [1, 1], [2, 2]])
+        np.testing.assert_array_equal(indices, [0, 1, 0, 2, 1])
+        self.assertEqual(indices.dtype, np.uint16)
+
+    def test_indexed_cube(self):
+        expanded = cube(1., Point3D(0, 0, 0))
+        expanded.compile_VBO()
+        indexed = cube(1., Point3D(0, 0, 0))
+        indexed.indexed = True
+        indexed.compile_VBO()
+        self.assertIsNone(expanded.index_buffer)
+        self.assertEqual(len(indexed._VBO), 8)
+        np.testing.assert_array_equal(
+            indexed._VBO.data[indexed.index_buffer.data], expanded._VBO.data)
+
+    def test_optimize_vertex_cache(self):
+        shape = sphere(1., Point3D(0, 0, 0), detail=3)
+        shape.compile_VBO()
+        indices = shape.index_buffer.data
+        # scramble the triangle order, then optimize it
+        triangles = indices.reshape(-1, 3)
+        shuffled = triangles[np.random.RandomState(0).permutation(
+            len(triangles))].reshape(-1)
+        optimized = indexing.optimize_vertex_cache(shuffled)
+
+        def triangle_set(i):
+            return sorted(map(tuple, np.asarray(i).reshape(-1, 3).tolist()))
+
+        self.assertEqual(triangle_set(optimized), triangle_set(shuffled))
+        self.assertLess(indexing.cache_miss_ratio(optimized), 1.)
+        self.assertLess(indexing.cache_miss_ratio(optimized),
+                        indexing.cache_miss_ratio(shuffled) / 2)
+
+    def test_mesh_optimize(self):
+        positions = np.tile(np.random.RandomState(1).rand(3, 3), (2, 1))
+        mesh = Mesh(positions)
+        mesh.optimize_vertex_cache()
+        self.assertEqual(len(mesh.positions), 3)
+        self.assertEqual(len(mesh), 6)
+        np.testing.assert_array_equal(mesh.positions[mesh.indices],
+                                      positions.astype('f'))
@@ -0,0 +1,164 @@
+import unittest
+import numpy as np
+from engine.gl.glsl import ShaderVar
+from engine.gl.mesh_buffer import FreeList, MeshBuffer
+from _egl import run_scene
+
+LOCATIONS = {0: ShaderVar('in', 'vec3', 'vertex_attrib'),
+             1: ShaderVar('in', 'vec3', 'normal_attrib'),
+             2: ShaderVar('in', 'vec3', 'color_attrib')}
+
+# Drawing needs a GL context, so it's run in a new process.
+# Two cubes on the left and right, drawn from one MeshBuffer that has to
+# grow, one indexed and one not, then drawn again with one multi draw.
+SCENE = r"""
+import json
+from engine.gl.offscreen import OffscreenContext, OffscreenError
+try:
+    context = OffscreenContext(64, 48)
+except OffscreenError as e:
+    print(json.dumps({'error': str(e)}))
+    raise SystemExit
+import glm
+from OpenGL.GL import *
+from engine.gameloop.VBOGameLoop import VBOGameLoop
+from engine.gl.camera import Camera
+from engine.gl.drawable import Point3D, cube
+from engine.gl.mesh_buffer import MeshBuffer
+from engine.gl.shader import Pipeline, Shader
+with context:
+    pipeline = Pipeline(Shader('litvert', GL_VERTEX_SHADER),
+                        Shader('litfrag', GL_FRAGMENT_SHADER,
+                               defines={'UNLIT': 1}))
+    buffer = MeshBuffer(pipeline.vert.VAO_locations, capacity=8,
+                        index_capacity=8)
+    MeshBuffer._shared.clear()
+    shapes = []
+    for x, color, indexed in ((-.5, (1, 0, 0), False), (.5, (0, 1, 0), True)):
+        shape = cube(.4, Point3D(-.2, -.2, -.2), color=color)
+        shape.indexed = indexed
+        shape.gen_normals()
+        shape.compile_VBO()
+        shape.move(x, 0, -2)
+        shapes.append(shape)
+    allocations = [buffer.add(shape._VBO.data, None if shape._IBO is None
+                              else shape._IBO.data) for shape in shapes]
+    loop = VBOGameLoop([pipeline], cameras=[Camera()])
+    loop.GLsetup(context)
+    loop.frame_buffer.update(loop.frame_uniforms())
+    loop.frame_buffer.upload()
+
+    def frame(multi):
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        draws = 0
+        with pipeline.rendering():
+            buffer.bind()
+            if multi:
+                centered = glm.translate(glm.vec3(0, 0, -2))
+                pipeline.set_uniform('model', centered)
+                draws = buffer.multi_draw(allocations, GL_TRIANGLES)
+            else:
+                for shape, allocation in zip(shapes, allocations):
+                    pipeline.set_uniform('model', shape.model_matrix)
+                    buffer.draw(allocation, GL_TRIANGLES)
+        context.flip()
+        pixels = context.read_pixels()
+        return [pixels[24, x].tolist() for x in (16, 32, 48)] + [draws]
+
+    separate, multi = frame(False), frame(True)
+    try:  # positions and colors only, without the normals litvert reads
+        pipeline.add_model(cube(.4, Point3D(0, 0, 0), color=(0, 0, 1)))
+        rejected = False
+    except ValueError:
+        rejected = True
+    # Turn the left cube blue in place, uploading just its rows.
+    blue = shapes[0]._VBO.data.copy()
+    blue[:, 6:] = (0, 0, 1)
+    buffer.update(allocations[0], blue)
+    print(json.dumps({'separate': separate, 'multi': multi,
+                      'updated': frame(False), 'rejected': rejected,
+                      'capacity': len(buffer.vertices)}))
+"""
+
+
+def vertices(count, value):
+    return np.full((count, 9), value, 'f')
+
+
+class FreeListTests(unittest.TestCase):
+    def test_first_fit_and_merge(self):
+        space = FreeList(10)
+        self.assertEqual([space.allocate(n) for n in (3, 3, 3)], [0, 3, 6])
+        self.assertIsNone(space.allocate(2))
+        space.release(0, 3)
+        space.release(6, 3)
+        self.assertEqual(space.ranges, [[0, 3], [6, 4]])
+        space.release(3, 3)
+        self.assertEqual(space.ranges, [[0, 10]])
+        space.allocate(10)
+        space.grow(16)
+        self.assertEqual(space.ranges, [[10, 6]])
+
+
+class MeshBufferTests(unittest.TestCase):
+    def test_allocate_grow_and_compact(self):
+        buffer = MeshBuffer(LOCATIONS, capacity=8, index_capacity=4)
+        self.assertEqual(buffer.floats, 9)
+        a = buffer.add(vertices(4, 1))
+        b = buffer.add(vertices(4, 2), indices=[0, 1, 2, 2, 3, 0])
+        self.assertEqual((a.first, b.first, b.index_first), (0, 4, 0))
+        self.assertEqual(len(buffer.indices), 8)  # grew to fit 6
+        c = buffer.add(vertices(2, 3))
+        self.assertEqual(len(buffer.vertices), 16)  # doubled
+
+        buffer.remove(a)
+        buffer.remove(c)
+        d = buffer.add(vertices(10, 4))
+        # 10 fit in the holes left by a and c, but only compacted.
+        self.assertEqual(len(buffer.vertices), 16)
+        self.assertEqual((b.first, d.first), (0, 4))
+        np.testing.assert_array_equal(buffer.vertices[:4], vertices(4, 2))
+        np.testing.assert_array_equal(buffer.vertices[4:14], vertices(10, 4))
+        np.testing.assert_array_equal(buffer.indices[:6], [0, 1, 2, 2, 3, 0])
+
+    def test_update(self):
+        buffer = MeshBuffer(LOCATIONS, capacity=8)
+        a = buffer.add(vertices(4, 1))
+        b = buffer.add(vertices(2, 2))
+        buffer.vbo.copied = True  # as if uploaded
+        buffer.update(a, vertices(4, 5))
+        self.assertEqual(a.first, 0)
+        self.assertEqual(buffer._dirty[buffer.vbo], [(0, 4)])
+        np.testing.assert_array_equal(buffer.vertices[:4], vertices(4, 5))
+        buffer.update(a, vertices(5, 6))  # moves
+        # No room after b, so b was compacted down to make it.
+        self.assertEqual((b.first, a.first, a.count), (0, 2, 5))
+        self.assertEqual(buffer.allocations, [b, a])
+        with self.assertRaises(ValueError):
+            buffer.add(np.zeros((3, 6), 'f'))
+
+    def test_shared_per_format(self):
+        shared = MeshBuffer.for_format(LOCATIONS)
+        self.addCleanup(MeshBuffer._shared.clear)
+        instanced = {**LOCATIONS,
+                     3: ShaderVar('in', 'mat4', 'instance_model')}
+        self.assertIs(MeshBuffer.for_format(instanced), shared)
+        self.assertIsNot(MeshBuffer.for_format({0: LOCATIONS[0]}), shared)
+
+    def test_draw(self):
+        result = run_scene(self, SCENE)
+        self.assertGreater(result['capacity'], 8)
+        background = [128, 128, 128, 0]
+        left, middle, right, draws = result['separate']
+        self.assertEqual(left, [255, 0, 0, 255])
+        self.assertEqual(middle, background)
+        self.assertEqual(right, [0, 255, 0, 255])
+        # One matrix for both, so they overlap in the middle, in 2 calls.
+        left, middle, right, draws = result['multi']
+        self.assertEqual(draws, 2)
+        self.assertEqual((left, right), (background, background))
+        self.assertIn(middle, ([255, 0, 0, 255], [0, 255, 0, 255]))
+        self.assertTrue(result['rejected'])
+        left, middle, right, draws = result['updated']
+        self.assertEqual(left, [0, 0, 255, 255])
+        self.assertEqual(right, [0, 255, 0, 255])
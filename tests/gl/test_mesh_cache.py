@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from engine.gl import mesh_cache
+
+SQUARE = '''mtllib square.mtl
+v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+f 1 2 3
+f 1 3 4
+'''
+
+
+class MeshCacheTests(unittest.TestCase):
+    def test_build_and_load(self):
+        built = mesh_cache.build(self.path)
+        drawn = built.interleave()[built.indices]
+        self.assertTrue(mesh_cache.is_valid(self.path))
+        vertices, indices, arr_format, _ = mesh_cache.load(self.path)
+        self.assertIsInstance(vertices, np.memmap)
+        self.assertEqual(arr_format, 'vnc')
+        self.assertEqual(len(vertices), 4)
+        np.testing.assert_array_equal(vertices[indices], drawn)
+
+        shape = mesh_cache.load_shape(self.path)
+        np.testing.assert_array_equal(
+            shape.render_data[0].data[shape.index_buffer.data], drawn)
+
+    def test_cold_and_warm_load(self):
+        cold = mesh_cache.load_shape(self.path)
+        warm = mesh_cache.load_shape(self.path)
+        for shape in (cold, warm):
+            self.assertTrue(shape.indexed)
+            self.assertEqual(shape.shapes, [])
+        np.testing.assert_array_equal(cold.render_data[0].data,
+                                      warm.render_data[0].data)
+        np.testing.assert_array_equal(cold.index_buffer.data,
+                                      warm.index_buffer.data)
+
+    def test_touch_keeps_cache(self):
+        mesh_cache.build(self.path)
+        os.utime(self.path, ns=(0, 0))
+        self.assertTrue(mesh_cache.is_valid(self.path))
+
+    def test_edits_invalidate(self):
+        mesh_cache.build(self.path)
+        self.assertFalse(mesh_cache.is_valid(self.path, swapyz=True))
+        with open(self.mtl, 'a') as f:
+            f.write('Kd 1 0 0\n')
+        self.assertFalse(mesh_cache.is_valid(self.path))
+        mesh_cache.build(self.path)
+        with open(self.path, 'a') as f:
+            f.write('v 2 2 2\n')
+        self.assertFalse(mesh_cache.is_valid(self.path))
+
+    def test_manifest(self):
+        manifest = os.path.join(self.folder, 'test.assets')
+        with open(manifest, 'w') as f:
+            f.write('# models\nsquare.obj\n\n')
+        mesh_cache.main([manifest])
+        self.assertTrue(mesh_cache.is_valid(self.path))
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'square.obj')
+        self.mtl = os.path.join(self.folder, 'square.mtl')
+        with open(self.path, 'w') as f:
+            f.write(SQUARE)
+        with open(self.mtl, 'w') as f:
+            f.write('newmtl None\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
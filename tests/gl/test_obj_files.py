@@ -1,4 +1,25 @@
+import os
+import tempfile
 import unittest
+import numpy as np
+import engine.gl.drawable
+from engine.gl.obj_loader import OBJ_to_arrays, OBJ_to_shape
+
+ASSETS = os.path.join(os.path.dirname(__file__), '..', '..', 'assets',
+                      'pingponggame')
+
+SQUARE = '''# a unit square split into two triangles
+v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+vt 0 0
+vt 1 1
+vn 0 0 1
+usemtl None
+f 1/1/1 2/1/1 3/2/1
+f -4//1 -2//1 -1//1
+'''
 
 
 class ObjFileTests(unittest.TestCase):
@@ -6,10 +27,70 @@ class ObjFileTests(unittest.TestCase):
         pass
 
     def test_Shape3D_loader(self):
-        pass
+        shape = OBJ_to_shape(self.path)
+        self.assertEqual(len(shape.shapes), 2)
+        self.assertEqual([tuple(p.vertex) for p in shape.shapes[1].points],
+                         [(0, 0, 0), (1, 1, 0), (0, 1, 0)])
+        # faces share the Point3D objects of the vertices they reference
+        self.assertIs(shape.shapes[0].points[0], shape.shapes[1].points[0])
+
+    def test_arrays_loader(self):
+        arrays = OBJ_to_arrays(self.path)
+        self.assertEqual(arrays.positions.shape, (4, 3))
+        self.assertEqual(arrays.texcoords.shape, (2, 2))
+        self.assertEqual(arrays.normals.shape, (1, 3))
+        np.testing.assert_array_equal(arrays.face_sizes, [3, 3])
+        # negative indices and the v//n form resolve to zero-based indices
+        np.testing.assert_array_equal(
+            arrays.corners,
+            [[0, 0, 0], [1, 0, 0], [2, 1, 0],
+             [0, -1, 0], [2, -1, 0], [3, -1, 0]])
+
+    def test_mixed_corner_formats(self):
+        # As many slashes as three v/t corners, but one to each format.
+        with open(self.path, 'w') as f:
+            f.write('v 0 0 0\nv 1 0 0\nv 1 1 0\nvt 0 0\nvn 0 0 1\n'
+                    'f 1/1 2/1/1 3\n')
+        arrays = OBJ_to_arrays(self.path)
+        np.testing.assert_array_equal(arrays.corners,
+                                      [[0, 0, -1], [1, 0, 0], [2, -1, -1]])
+
+    def test_indented_records(self):
+        expected = OBJ_to_arrays(self.path)
+        with open(self.path, 'w') as f:
+            for i, line in enumerate(SQUARE.splitlines()):
+                f.write(('  ' if i % 2 else '\t') + line + '\n')
+        indented = OBJ_to_arrays(self.path)
+        self.assertEqual(len(indented.face_sizes), 2)
+        for name in expected._fields:
+            np.testing.assert_array_equal(getattr(indented, name),
+                                          getattr(expected, name))
+
+    def test_arrays_swapyz(self):
+        arrays = OBJ_to_arrays(self.path, swapyz=True)
+        np.testing.assert_array_equal(arrays.positions[3], (0, 0, 1))
+        np.testing.assert_array_equal(arrays.normals[0], (0, 1, 0))
+
+    def test_not_implemented(self):
+        with open(self.path, 'a') as f:
+            f.write('l 1 2\n')
+        OBJ_to_arrays(self.path)
+        with self.assertRaises(NotImplementedError):
+            OBJ_to_arrays(self.path, suppress_not_implemented=False)
+
+    def test_paddle_models(self):
+        for name in ('Paddle.obj', 'PingPongPaddle.obj'):
+            arrays = OBJ_to_arrays(os.path.join(ASSETS, name))
+            self.assertEqual(arrays.corners.shape[0],
+                             arrays.face_sizes.sum())
+            self.assertTrue((arrays.corners[:, 0] >= 0).all())
+            self.assertTrue((arrays.corners[:, 0] <
+                             len(arrays.positions)).all())
 
     def setUp(self):
-        pass
+        fd, self.path = tempfile.mkstemp(suffix='.obj')
+        with os.fdopen(fd, 'w') as f:
+            f.write(SQUARE)
 
     def tearDown(self):
-        pass
+        os.remove(self.path)
@@ -0,0 +1,49 @@
+import unittest
+from _egl import run_scene
+
+# Drawn with EGL in a new process, which run_scene picks before OpenGL is
+# first imported.
+SCENE = r"""
+import json
+from engine.gl.offscreen import OffscreenContext, OffscreenError
+try:
+    context = OffscreenContext(64, 48)
+except OffscreenError as e:
+    print(json.dumps({'error': str(e)}))
+    raise SystemExit
+from OpenGL.GL import GL_FRAGMENT_SHADER, GL_VERTEX_SHADER
+from engine.gameloop.VBOGameLoop import VBOGameLoop
+from engine.gl.camera import Camera
+from engine.gl.drawable import Point3D, cube
+from engine.gl.shader import Pipeline, Shader
+with context:
+    pipeline = Pipeline(Shader('litvert', GL_VERTEX_SHADER),
+                        Shader('litfrag', GL_FRAGMENT_SHADER))
+    shape = cube(.5, Point3D(-.25, -.25, -.25), color=(1, 0, 0))
+    shape.gen_normals()
+    shape.compile_VBO()
+    shape.move(0, 0, -1.5)
+    pipeline.add_model(shape)
+    hidden = cube(.5, Point3D(-.25, -.25, -.25))
+    hidden.gen_normals()
+    hidden.compile_VBO()
+    hidden.move(0, 0, 10)
+    pipeline.add_model(hidden)
+    loop = VBOGameLoop([pipeline], cameras=[Camera()])
+    result = loop.benchmark(context, frames=3, warmup=1)
+    pixels = context.read_pixels()
+    result['center'] = pixels[24, 32].tolist()
+    result['corner'] = pixels[0, 0].tolist()
+    print(json.dumps(result))
+"""
+
+
+class OffscreenTests(unittest.TestCase):
+    def test_render_frames(self):
+        result = run_scene(self, SCENE)
+        self.assertEqual(result['frames'], 3)
+        self.assertEqual((result['drawn'], result['culled']), (1, 1))
+        red, green, blue, alpha = result['center']
+        self.assertGreater(red, 50)
+        self.assertEqual((green, blue), (0, 0))
+        self.assertEqual(result['corner'], [128, 128, 128, 0])
@@ -0,0 +1,108 @@
+import math
+import unittest
+import glm
+import numpy as np
+from engine.gl.animations import GravityAnimator, PhysicsWorld, \
+    model_matrices
+from engine.gl.collision import CollisionBox, CollisionSystem
+from engine.gl.drawable import Mesh
+from engine.gl.utils import bounds
+
+
+class PhysicsWorldTests(unittest.TestCase):
+    def test_free_fall(self):
+        world = PhysicsWorld(gravity=(0, -1, 0), capacity=1)
+        world.add(position=(0, 10, 0), velocity=(1, 0, 0))
+        world.add(position=(5, 0, 0))  # grows the arrays
+        for _ in range(4):
+            world.step(.5)
+        # semi-implicit Euler: y = 10 - g * dt^2 * (1 + 2 + 3 + 4)
+        np.testing.assert_allclose(world.position,
+                                   [[2, 7.5, 0], [5, -2.5, 0]])
+        np.testing.assert_allclose(world.velocity, [[1, -2, 0], [0, -2, 0]])
+
+    def test_zero_capacity(self):
+        world = PhysicsWorld(gravity=(0, 0, 0), capacity=0)
+        world.add(position=(1, 2, 3))
+        world.add(position=(4, 5, 6))
+        np.testing.assert_allclose(world.position, [[1, 2, 3], [4, 5, 6]])
+        with self.assertRaises(ValueError):
+            PhysicsWorld(capacity=-1)
+
+    def test_drag_and_magnus(self):
+        world = PhysicsWorld(gravity=(0, 0, 0), drag=.5, magnus=.1)
+        world.add(velocity=(0, 0, 2), angular_velocity=(1, 0, 0))
+        world.add(velocity=(0, 0, 2), angular_velocity=(-1, 0, 0))
+        np.testing.assert_allclose(world.acceleration().T,
+                                   [[0, -.2, -2], [0, .2, -2]])
+
+    def test_spin(self):
+        world = PhysicsWorld(gravity=(0, 0, 0), spin_decay=.5)
+        world.add(angular_velocity=(0, 0, np.pi / 200))
+        for _ in range(100):
+            world.step()
+        np.testing.assert_allclose(np.linalg.norm(world.spin, axis=1), 1)
+        # the spin halves before every turn: pi / 400 + pi / 800 + ...
+        angle = 2 * np.arctan2(world.spin[0, 3], world.spin[0, 0])
+        self.assertAlmostEqual(angle, np.pi / 200, places=5)
+        np.testing.assert_allclose(world.angular_velocity, 0, atol=1e-30)
+
+    def test_write_back(self):
+        meshes = [Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]]) for _ in range(3)]
+        meshes[1].move(1, 2, 3)
+        world = PhysicsWorld(gravity=(0, 0, 0))
+        for mesh in meshes:
+            world.apply_to(mesh)
+        world.velocity[:] = (0, 0, 1)
+        world.angular_velocity[2] = (0, 0, .01)
+        world.step()
+        self.assertEqual(meshes[1].offset[3].xyz, glm.vec3(1, 2, 4))
+        matrices = world.matrices()
+        for mesh, matrix in zip(meshes, matrices):
+            np.testing.assert_allclose(
+                np.frombuffer(mesh.model_matrix.to_bytes(), 'f'),
+                matrix.reshape(-1), atol=1e-6)
+        self.assertNotEqual(meshes[2].rotate, glm.mat4())
+
+    def test_model_matrices(self):
+        meshes = [Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]]) for _ in range(3)]
+        meshes[0].scale = glm.scale(glm.vec3(2))
+        world = PhysicsWorld(gravity=(0, 0, 0))
+        for mesh in meshes[:2]:
+            world.apply_to(mesh)
+        meshes[1].scale = glm.scale(glm.vec3(1, 3, 1))
+        world.velocity[:] = (0, 1, 0)
+        world.angular_velocity[0] = (.01, 0, 0)
+        world.step()
+        matrices = model_matrices(meshes)
+        # read straight from the world, leaving the models to catch up
+        self.assertEqual(meshes[0]._offset, glm.mat4())
+        expected = bounds.matrix_array(mesh.model_matrix for mesh in meshes)
+        np.testing.assert_allclose(matrices, expected, atol=1e-6)
+
+    def test_collision_box_follows(self):
+        mesh = Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]])
+        area = CollisionBox(1, 1, 1)
+        area.attach_to_shape(mesh)
+        system = CollisionSystem()
+        system.add(area)
+        system.update_bounds()
+        world = PhysicsWorld(gravity=(0, 0, 0))
+        world.apply_to(mesh)  # after the system sorted its boxes
+        world.velocity[:] = (1, 0, 0)
+        world.step()
+        system.update_bounds()
+        np.testing.assert_array_equal(system._lower[0], [1, 0, 0])
+
+
+class SpinTests(unittest.TestCase):
+    def test_magnus(self):
+        mesh = Mesh([[0, 0, 0], [1, 0, 0], [0, 1, 0]])
+        gravity = GravityAnimator(0.)
+        gravity.apply_to(mesh)
+        gravity.momentum = glm.vec3(0, 0, -1)
+        gravity.spin = glm.vec3(.1, 0, 0)  # backspin for a ball going -z
+        gravity.step()
+        # lifts it, turning it by .1 radians
+        self.assertAlmostEqual(gravity.momentum.y, math.sin(.1))
+        self.assertAlmostEqual(glm.length(gravity.momentum), 1.)
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from _egl import run_scene
+
+# Needs a GL context, so each run is a new process.
+PIPELINE = r"""
+import json
+from engine.gl.offscreen import OffscreenContext, OffscreenError
+try:
+    context = OffscreenContext(8, 8)
+except OffscreenError as e:
+    print(json.dumps({'error': str(e)}))
+    raise SystemExit
+import glm
+from OpenGL.GL import GL_FRAGMENT_SHADER, GL_VERTEX_SHADER
+from engine.gl import program_cache
+from engine.gl.shader import Pipeline, Shader
+with context:
+    if not program_cache.supported():
+        print(json.dumps({'error': 'no program binary formats'}))
+        raise SystemExit
+    vert = Shader('litvert', GL_VERTEX_SHADER)
+    frag = Shader('litfrag', GL_FRAGMENT_SHADER)
+    pipeline = Pipeline(vert, frag)
+    with pipeline.rendering():
+        pipeline.set_uniform('model', glm.mat4())
+    print(json.dumps({'compiled': vert._shader is not None,
+                      'uniforms': pipeline.uniforms,
+                      'ins': pipeline.ins}))
+"""
+
+
+class ProgramCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def build(self):
+        return run_scene(self, PIPELINE, cache=self.folder.name)
+
+    def cached(self, extension):
+        return [name for name in os.listdir(self.folder.name)
+                if name.endswith(extension)]
+
+    def test_warm_cache_skips_compiling(self):
+        cold = self.build()
+        self.assertTrue(cold['compiled'])
+        self.assertEqual(len(self.cached('.json')), 1)
+        self.assertEqual(len(self.cached('.bin')), 1)
+
+        warm = self.build()
+        self.assertFalse(warm['compiled'])
+        self.assertEqual(warm['uniforms'], cold['uniforms'])
+        self.assertEqual(warm['ins'], cold['ins'])
+
+    def test_rejected_binary_is_relinked(self):
+        cold = self.build()
+        binary, = self.cached('.bin')
+        with open(os.path.join(self.folder.name, binary), 'wb') as f:
+            f.write(b'not a program')
+
+        again = self.build()
+        self.assertTrue(again['compiled'])
+        self.assertEqual(again['uniforms'], cold['uniforms'])
+        # The cache was rewritten, so the next run loads it.
+        self.assertFalse(self.build()['compiled'])
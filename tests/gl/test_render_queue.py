@@ -0,0 +1,133 @@
+import unittest
+from types import SimpleNamespace
+import glm
+import numpy as np
+from OpenGL.GL import GL_FRAGMENT_SHADER, GL_TRIANGLES, GL_VERTEX_SHADER
+from engine.gl.mesh_buffer import BufferSlice, MeshBuffer
+from engine.gl.render_queue import RenderQueue, radix_argsort, sort_keys
+from engine.gl.shader import Pipeline, Shader
+from _egl import run_scene
+
+# Drawing needs a GL context, so it's run in a new process.
+# Four cubes in a row, three in the shared MeshBuffer (one indexed) and one
+# with its own VAO, drawn with and without the render queue.
+SCENE = r"""
+import json
+from engine.gl.offscreen import OffscreenContext, OffscreenError
+try:
+    context = OffscreenContext(64, 48)
+except OffscreenError as e:
+    print(json.dumps({'error': str(e)}))
+    raise SystemExit
+from OpenGL.GL import GL_FRAGMENT_SHADER, GL_VERTEX_SHADER
+from engine.gameloop.VBOGameLoop import VBOGameLoop
+from engine.gl.camera import Camera
+from engine.gl.drawable import Point3D, cube
+from engine.gl.shader import Pipeline, Shader
+with context:
+    pipeline = Pipeline(Shader('litvert', GL_VERTEX_SHADER),
+                        Shader('litfrag', GL_FRAGMENT_SHADER,
+                               defines={'UNLIT': 1}))
+    colors = ((1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0))
+    for i, color in enumerate(colors):
+        shape = cube(.3, Point3D(-.15, -.15, -.15), color=color)
+        shape.indexed = i == 1
+        shape.gen_normals()
+        shape.compile_VBO()
+        shape.move(-.75 + .5 * i, 0, -2 - i * .1)
+        pipeline.add_model(shape, shared=i < 3)
+    loop = VBOGameLoop([pipeline], cameras=[Camera()])
+    result = {}
+    for name, render_queue in (('queued', loop.render_queue),
+                               ('unqueued', None)):
+        loop.render_queue = render_queue
+        loop.benchmark(context, frames=2, warmup=1)
+        pixels = context.read_pixels()
+        result[name] = [[pixels[24, x].tolist() for x in (14, 26, 37, 47)],
+                        loop.frame_stats['gl_calls']]
+    print(json.dumps(result))
+"""
+
+
+def model(**attributes):
+    "A stand-in model in a MeshBuffer, with what RenderQueue reads."
+    vbo = SimpleNamespace(copied=True)
+    return SimpleNamespace(render_data=(vbo, GL_TRIANGLES), **attributes)
+
+
+class SortTests(unittest.TestCase):
+    def test_radix_argsort(self):
+        keys = np.random.default_rng(1).integers(
+            0, 1 << 40, 10000, dtype=np.uint64) << np.uint64(20)
+        keys[::7] = keys[0]  # ties keep their order
+        np.testing.assert_array_equal(radix_argsort(keys),
+                                      np.argsort(keys, kind='stable'))
+        np.testing.assert_array_equal(radix_argsort(keys[:10]),
+                                      np.argsort(keys[:10], kind='stable'))
+
+    def test_keys(self):
+        keys = sort_keys(pipelines=[1, 0, 0, 0, 0],
+                         buffers=[0, 0, 0, 1, 1],
+                         indexed=[0, 0, 0, 0, 0], materials=[0] * 5,
+                         depths=[1., 5., 2., 3., -1.],
+                         transparent=[False, False, False, True, True])
+        # Opaque by state, then front to back; transparent last, back to
+        # front, with anything behind the camera at 0.
+        self.assertEqual(list(radix_argsort(keys)), [2, 1, 0, 3, 4])
+
+
+class RenderQueueTests(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = Pipeline(Shader('litvert', GL_VERTEX_SHADER),
+                                 Shader('litfrag', GL_FRAGMENT_SHADER))
+        self.buffer = MeshBuffer(self.pipeline.vert.VAO_locations,
+                                 capacity=64)
+        self.vertices = np.zeros((6, self.buffer.floats), 'f')
+
+    def pair(self, mdl, indexed=False):
+        allocation = self.buffer.add(self.vertices,
+                                     [0, 1, 2] if indexed else None)
+        return mdl, BufferSlice(self.buffer, allocation)
+
+    def test_instanced_variant(self):
+        variant = self.pipeline.instanced_variant()
+        self.assertIs(self.pipeline.instanced_variant(), variant)
+        self.assertEqual(variant.vert.defines, {'INSTANCED': 1})
+        self.assertIs(variant.frag, self.pipeline.frag)
+        self.assertIsNone(variant.instanced_variant())
+        raw = Pipeline(Shader.from_raw_code(self.pipeline.vert._code,
+                                            GL_VERTEX_SHADER),
+                       self.pipeline.frag)
+        self.assertIsNone(raw.instanced_variant())
+
+    def test_runs(self):
+        queue = RenderQueue()
+        pairs = [self.pair(model()), self.pair(model(), indexed=True),
+                 self.pair(model()), self.pair(model(transparent=True)),
+                 (model(), SimpleNamespace(IBO=None))]  # its own VAO
+        depths = (3., 2., 1., 4., 5.)
+        queue.submit(self.pipeline, pairs, [glm.translate(glm.vec3(0, 0, -z))
+                                            for z in depths])
+        queue.sort(glm.mat4())
+        self.assertEqual(list(queue.order), [2, 0, 1, 4, 3])
+        # The two plain draws from the buffer go together; the rest are
+        # drawn on their own.
+        self.assertEqual(queue.runs, [(0, 2, True), (2, 3, True),
+                                      (3, 4, False), (4, 5, True)])
+        self.assertEqual(queue._split, 4)
+
+        queue.batching = False
+        queue.sort(glm.mat4())
+        self.assertEqual([batch for *_, batch in queue.runs], [False] * 5)
+        queue.clear()
+        queue.sort(glm.mat4())
+        self.assertEqual(queue.runs, [])
+
+    def test_draw(self):
+        result = run_scene(self, SCENE)
+        queued, queued_calls = result['queued']
+        unqueued, unqueued_calls = result['unqueued']
+        self.assertEqual(queued, [[255, 0, 0, 255], [0, 255, 0, 255],
+                                  [0, 0, 255, 255], [255, 255, 0, 255]])
+        self.assertEqual(queued, unqueued)
+        self.assertLessEqual(queued_calls, unqueued_calls)
@@ -0,0 +1,90 @@
+import unittest
+from types import SimpleNamespace
+from OpenGL.GL import GL_FRAGMENT_SHADER, GL_VERTEX_SHADER
+from engine.gl.shader import Pipeline, Shader, warm_up
+from _egl import run_scene
+
+# Linking needs a GL context, so it's run in a new process.
+LINK = r"""
+import json
+from engine.gl.offscreen import OffscreenContext, OffscreenError
+try:
+    context = OffscreenContext(8, 8)
+except OffscreenError as e:
+    print(json.dumps({'error': str(e)}))
+    raise SystemExit
+from OpenGL.GL import GL_FRAGMENT_SHADER, GL_VERTEX_SHADER
+from OpenGL.GL import shaders
+from engine.gl.shader import Pipeline, Shader, warm_up
+compiled = []
+compile_shader = shaders.compileShader
+shaders.compileShader = lambda *args: compiled.append(args) or \
+    compile_shader(*args)
+with context:
+    pipelines = [
+        Pipeline(Shader('litvert', GL_VERTEX_SHADER),
+                 Shader('litfrag', GL_FRAGMENT_SHADER)),
+        Pipeline(Shader('litvert', GL_VERTEX_SHADER, defines={'INSTANCED': 1}),
+                 Shader('litfrag', GL_FRAGMENT_SHADER)),
+        Pipeline(Shader('litvert', GL_VERTEX_SHADER),
+                 Shader('litfrag', GL_FRAGMENT_SHADER, defines={'UNLIT': 1})),
+        ]
+    pending = list(pipelines)
+    left = [warm_up(pending, budget=0.) for _ in pipelines]
+    print(json.dumps({'left': left,
+                      'uniforms': [sorted(p.uniforms) for p in pipelines],
+                      'compiled': len(compiled)}))
+"""
+
+
+class ShaderVariantTests(unittest.TestCase):
+    def test_defines_pick_a_variant(self):
+        plain = Shader('litvert', GL_VERTEX_SHADER)
+        instanced = Shader('litvert', GL_VERTEX_SHADER,
+                           defines={'INSTANCED': 1})
+        self.assertEqual(len(plain.VAO_locations), 3)
+        self.assertEqual(len(instanced.VAO_locations), 5)
+        self.assertEqual([var.name for var in plain.reflection.uniforms],
+                         ['model'])
+        self.assertEqual(instanced.reflection.uniforms, ())
+        # The old file is now the same variant through an #include.
+        self.assertEqual(
+            Shader('litvert_instanced', GL_VERTEX_SHADER).reflection,
+            instanced.reflection)
+
+    def test_variants_are_cached_apart(self):
+        defines = {'INSTANCED': 1}
+        first = Shader('litvert', GL_VERTEX_SHADER, defines=defines)
+        again = Shader('litvert', GL_VERTEX_SHADER,
+                       defines={'INSTANCED': '1'})
+        self.assertEqual(first._key, again._key)
+        self.assertEqual(first._code, again._code)
+        plain = Shader('litvert', GL_VERTEX_SHADER)
+        self.assertNotEqual(first._key, plain._key)
+        self.assertNotIn('instance_model', plain._code)
+
+    def test_pipelines_link_on_first_use(self):
+        pipeline = Pipeline(Shader('litvert', GL_VERTEX_SHADER),
+                            Shader('litfrag', GL_FRAGMENT_SHADER))
+        self.assertFalse(pipeline.linked)
+        self.assertIsNone(pipeline.vert._shader)
+
+    def test_warm_up_budget(self):
+        linked = []
+        pipelines = [SimpleNamespace(link=lambda i=i: linked.append(i))
+                     for i in range(3)]
+        self.assertEqual(warm_up(pipelines, budget=0.), 2)
+        self.assertEqual(linked, [0])
+        self.assertEqual(warm_up(pipelines), 0)
+        self.assertEqual(linked, [0, 1, 2])
+
+    def test_variants_link(self):
+        result = run_scene(self, LINK)
+        self.assertEqual(result['left'], [2, 1, 0])
+        plain, instanced, unlit = result['uniforms']
+        self.assertEqual(plain, ['model'])
+        self.assertEqual(instanced, [])
+        self.assertEqual(unlit, ['model'])
+        # Two variants of each file, each compiled once, though the pipelines
+        # hold copies made before anything was compiled.
+        self.assertEqual(result['compiled'], 4)
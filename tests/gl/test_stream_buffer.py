@@ -0,0 +1,248 @@
+import unittest
+from unittest import mock
+import numpy as np
+from OpenGL.GL import GL_TIMEOUT_EXPIRED, GL_WAIT_FAILED
+from engine.gl import stream_buffer
+from engine.gl.drawable import Mesh
+from engine.gl.stream_buffer import StreamBuffer, StreamBufferError, _merge
+from _egl import run_scene
+
+# Drawing needs a GL context, so it's run in a new process.
+# A red square on the left and a green one on the right in one dynamic
+# mesh, moved out of view and back a few rows at a time between frames.
+SCENE = r"""
+import json, sys
+from engine.gl.offscreen import OffscreenContext, OffscreenError
+try:
+    context = OffscreenContext(64, 48)
+except OffscreenError as e:
+    print(json.dumps({'error': str(e)}))
+    raise SystemExit
+import numpy as np
+from OpenGL.GL import GL_FRAGMENT_SHADER, GL_VERTEX_SHADER
+from engine.gameloop.VBOGameLoop import VBOGameLoop
+from engine.gl.camera import Camera
+from engine.gl.drawable import Mesh
+from engine.gl.shader import Pipeline, Shader
+from engine.gl.stream_buffer import StreamBuffer
+StreamBuffer.use_persistent = sys.argv[1] == 'persistent'
+square = np.array([(-1, -1, 0), (1, -1, 0), (1, 1, 0),
+                   (1, 1, 0), (-1, 1, 0), (-1, -1, 0)], 'f') * .2
+left, right = square + (-.5, 0, 0), square + (.5, 0, 0)
+with context:
+    pipeline = Pipeline(Shader('litvert', GL_VERTEX_SHADER),
+                        Shader('litfrag', GL_FRAGMENT_SHADER,
+                               defines={'UNLIT': 1}))
+    mesh = Mesh(np.concatenate([left, right]),
+                colors=[(1, 0, 0)] * 6 + [(0, 1, 0)] * 6,
+                normals=[(0, 0, 1)] * 12, dynamic=True)
+    mesh.move(0, 0, -2)
+    pipeline.add_model(mesh)
+    loop = VBOGameLoop([pipeline], cameras=[Camera()])
+    stream = mesh.render_data[0]
+    frames = []
+
+    def frame():
+        loop.benchmark(context, frames=1, warmup=0)
+        pixels = context.read_pixels()
+        frames.append([pixels[24, 21].tolist(), pixels[24, 42].tolist(),
+                       stream._current])
+
+    frame()
+    mesh.update_positions(left + (0, 10, 0))
+    frame()
+    mesh.update_positions(right + (0, 10, 0), first=6)
+    frame()
+    frame()
+    mesh.update_positions(left)
+    frame()
+    mesh.update_positions(right, first=6)
+    frame()
+    print(json.dumps({'frames': frames, 'persistent': stream.persistent}))
+"""
+
+# An indexed dynamic cube recompiled after its points move to the right,
+# then again with flat normals and a new color, which changes its size.
+RECOMPILE = r"""
+import json, sys
+from engine.gl.offscreen import OffscreenContext, OffscreenError
+try:
+    context = OffscreenContext(64, 48)
+except OffscreenError as e:
+    print(json.dumps({'error': str(e)}))
+    raise SystemExit
+import glm
+from OpenGL.GL import GL_FRAGMENT_SHADER, GL_VERTEX_SHADER
+from engine.gameloop.VBOGameLoop import VBOGameLoop
+from engine.gl.camera import Camera
+from engine.gl.drawable import Point3D, cube
+from engine.gl.shader import Pipeline, Shader
+from engine.gl.stream_buffer import StreamBuffer
+StreamBuffer.use_persistent = sys.argv[1] == 'persistent'
+with context:
+    pipeline = Pipeline(Shader('litvert', GL_VERTEX_SHADER),
+                        Shader('litfrag', GL_FRAGMENT_SHADER,
+                               defines={'UNLIT': 1}))
+    shape = cube(.4, Point3D(-.7, -.2, -.2), color=(1, 0, 0))
+    shape.indexed = shape.dynamic = True
+    shape.gen_normals()
+    shape.move(0, 0, -2)
+    pipeline.add_model(shape)
+    loop = VBOGameLoop([pipeline], cameras=[Camera()])
+    first = shape.render_data[0]
+    frames = []
+
+    def frame():
+        loop.benchmark(context, frames=1, warmup=0)
+        pixels = context.read_pixels()
+        frames.append([pixels[24, 21].tolist(), pixels[24, 42].tolist()])
+
+    def points():
+        return {id(p): p for s in shape.shapes for p in s.points}.values()
+
+    frame()
+    for point in points():
+        point.vertex = point.vertex + glm.vec3(1, 0, 0)
+    shape.compile_VBO(force=True)
+    reused = shape.render_data[0] is first
+    frame()
+    shape.gen_normals('flat')
+    for point in points():
+        point.color = glm.vec3(0, 1, 0)
+    shape.compile_VBO(force=True)
+    frame()
+    print(json.dumps({'frames': frames, 'reused': reused,
+                      'replaced': shape.render_data[0] is not first,
+                      'deleted': first.buffer is None}))
+"""
+
+# The squares of SCENE in an indexed dynamic mesh that draws the left one,
+# then the right one through new indices at the same vertex count, then
+# deduplicates its vertices.
+MESH_RECOMPILE = SCENE[:SCENE.index('with context:')] + r"""
+with context:
+    pipeline = Pipeline(Shader('litvert', GL_VERTEX_SHADER),
+                        Shader('litfrag', GL_FRAGMENT_SHADER,
+                               defines={'UNLIT': 1}))
+    mesh = Mesh(np.concatenate([left, right]),
+                colors=[(1, 0, 0)] * 6 + [(0, 1, 0)] * 6,
+                normals=[(0, 0, 1)] * 12, indices=range(6), dynamic=True)
+    mesh.move(0, 0, -2)
+    pipeline.add_model(mesh)
+    loop = VBOGameLoop([pipeline], cameras=[Camera()])
+    first = mesh.render_data[0]
+    frames = []
+
+    def frame():
+        loop.benchmark(context, frames=1, warmup=0)
+        pixels = context.read_pixels()
+        frames.append([pixels[24, 21].tolist(), pixels[24, 42].tolist()])
+
+    frame()
+    mesh.indices = np.arange(6, 12, dtype=np.uint32)
+    mesh.compile_VBO(force=True)
+    second = mesh.render_data[0]
+    frame()
+    mesh.deduplicate()
+    deleted = second.buffer is None
+    frame()
+    print(json.dumps({'frames': frames, 'replaced': second is not first,
+                      'deleted': [first.buffer is None, deleted]}))
+"""
+
+
+class StreamBufferTests(unittest.TestCase):
+    def test_merge(self):
+        self.assertEqual(_merge([(5, 8), (0, 2), (1, 3), (8, 9)]),
+                         [[0, 3], [5, 9]])
+
+    def test_writes_before_upload(self):
+        stream = StreamBuffer(np.zeros((4, 3), 'f'))
+        self.assertEqual(len(stream), 4)
+        self.assertEqual(stream.stride, 12)
+        self.assertFalse(stream.copied)
+        stream[1:3] = np.ones((2, 3))
+        self.assertEqual(stream._dirty, [(1, 3)])
+        self.assertFalse(stream._orphan)
+        stream.set_array(np.full((4, 3), 2, 'f'))
+        self.assertTrue(stream._orphan)
+        np.testing.assert_array_equal(stream.data, np.full((4, 3), 2))
+        with self.assertRaises(ValueError):
+            stream.set_array(np.zeros((5, 3), 'f'))
+
+    def test_dynamic_mesh(self):
+        mesh = Mesh(np.zeros((3, 3)), dynamic=True)
+        stream = mesh.render_data[0]
+        self.assertIsInstance(stream, StreamBuffer)
+        mesh.update_positions([(4, 5, 6)], first=1)
+        np.testing.assert_array_equal(stream.data[1, :3], (4, 5, 6))
+        self.assertEqual(stream._dirty, [(1, 2)])
+        self.assertEqual(mesh.local_bounds.upper.tolist(), [4, 5, 6])
+        mesh.compile_VBO(force=True)
+        self.assertIs(mesh.render_data[0], stream)
+        self.assertIsNot(Mesh(np.zeros((3, 3))).render_data[0].__class__,
+                         StreamBuffer)
+
+    def check_frames(self, mode):
+        result = run_scene(self, SCENE, mode)
+        red, green, background = \
+            [255, 0, 0, 255], [0, 255, 0, 255], [128, 128, 128, 0]
+        colors = [frame[:2] for frame in result['frames']]
+        self.assertEqual(colors, [[red, green], [background, green],
+                                  [background, background],
+                                  [background, background],
+                                  [red, background], [red, green]])
+        return result
+
+    def test_persistent(self):
+        result = self.check_frames('persistent')
+        if not result['persistent']:
+            self.skipTest("No glBufferStorage in this context.")
+        # A write moves on to the next copy only if the last one was drawn
+        # from, and never for a frame without writes. Coming back round,
+        # the first copy catches up on the rows written to the others.
+        self.assertEqual([frame[2] for frame in result['frames']],
+                         [0, 1, 2, 2, 0, 1])
+
+    def test_sub_data(self):
+        result = self.check_frames('sub_data')
+        self.assertFalse(result['persistent'])
+        self.assertEqual({frame[2] for frame in result['frames']}, {0})
+
+    def test_recompile_indexed(self):
+        red, green, background = \
+            [255, 0, 0, 255], [0, 255, 0, 255], [128, 128, 128, 0]
+        for mode in ('persistent', 'sub_data'):
+            result = run_scene(self, RECOMPILE, mode)
+            self.assertEqual(result['frames'], [[red, background],
+                                                [background, red],
+                                                [background, green]])
+            # Moving the points refills the same buffer; more vertices
+            # need a new one, attached to the VAO in place of the old.
+            self.assertTrue(result['reused'])
+            self.assertTrue(result['replaced'])
+            self.assertTrue(result['deleted'])
+
+    def test_recompile_indexed_mesh(self):
+        red, green, background = \
+            [255, 0, 0, 255], [0, 255, 0, 255], [128, 128, 128, 0]
+        for mode in ('persistent', 'sub_data'):
+            result = run_scene(self, MESH_RECOMPILE, mode)
+            self.assertEqual(result['frames'], [[red, background],
+                                                [background, green],
+                                                [background, green]])
+            # New indices can't ride along with a persistent write, so the
+            # buffer is replaced even at the same size. Deduplicating
+            # frees the buffer it leaves behind.
+            self.assertTrue(result['replaced'])
+            self.assertEqual(result['deleted'], [True, True])
+
+    def test_wait_failed(self):
+        stream = StreamBuffer(np.zeros((4, 3), 'f'), frames=2)
+        stream._fences = [None, 'fence']
+        with mock.patch.object(stream_buffer, 'glFenceSync'), \
+                mock.patch.object(stream_buffer, 'glClientWaitSync',
+                                  side_effect=[GL_TIMEOUT_EXPIRED,
+                                               GL_WAIT_FAILED]):
+            with self.assertRaises(StreamBufferError):
+                stream._next_copy()
@@ -0,0 +1,56 @@
+import os
+import unittest
+import glm
+import numpy as np
+from OpenGL.GL import GL_VERTEX_SHADER
+from engine.gl.glsl import ShaderVar, preprocess
+from engine.gl.shader import Shader
+from engine.gl.ubo import FRAME_FIELDS, UniformBuffer, std140_layout
+
+SHADERS = os.path.join(os.path.dirname(__file__), '..', '..', 'engine', 'gl',
+                       '_shaders')
+
+
+class UniformBufferTests(unittest.TestCase):
+    def test_std140_layout(self):
+        offsets, size = std140_layout(FRAME_FIELDS)
+        self.assertEqual(offsets, {
+            'view': 0,
+            'projection': 64,
+            'light_pos': 128,
+            'light_ambient_weight': 140,  # packs after a vec3
+            'light_ambient_color': 144,
+            'light_glare': 156,
+            'light_color': 160,
+            })
+        self.assertEqual(size, 176)
+        offsets, size = std140_layout([('a', 'float'), ('b', 'vec2'),
+                                       ('c', 'mat3'), ('d', 'float')])
+        self.assertEqual(offsets, {'a': 0, 'b': 8, 'c': 16, 'd': 64})
+        self.assertEqual(size, 80)
+
+    def test_set_skips_unchanged_values(self):
+        ubo = UniformBuffer()
+        view = glm.translate(glm.vec3(1, 2, 3))
+        self.assertTrue(ubo.set('view', view))
+        ubo._dirty = False
+        self.assertFalse(ubo.set('view', glm.translate(glm.vec3(1, 2, 3))))
+        self.assertFalse(ubo._dirty)
+        self.assertTrue(ubo.update({'light_glare': 32., 'view': view}))
+        self.assertTrue(ubo._dirty)
+        # matrices are stored column major
+        np.testing.assert_array_equal(ubo.data[48:60].view('f'), [1, 2, 3])
+        np.testing.assert_array_equal(ubo.data[156:160].view('f'), [32])
+        with self.assertRaises(ValueError):
+            ubo.set('light_pos', (1, 2))
+
+    def test_parse_uniform_block(self):
+        shader = Shader(None, GL_VERTEX_SHADER)
+        shader.shadertype = GL_VERTEX_SHADER
+        with open(os.path.join(SHADERS, 'litvert.shader')) as f:
+            shader._code = preprocess(f.read())
+        shader.parse()
+        self.assertEqual(shader.uniform_blocks, ['Frame'])
+        uniforms = [var for var in shader.vars if var.cls == 'uniform']
+        self.assertEqual(uniforms, [ShaderVar('uniform', 'mat4', 'model')])
+        self.assertEqual(len(shader.VAO_locations), 3)